@@ -1,9 +1,14 @@
 import os.path
+import re
 
 from setuptools import setup, find_packages
 
-__version__ = '1.4.0'
 
+# Read rather than imported, so that squabble's dependencies needn't be
+# installed first.
+init_path = os.path.join(os.path.dirname(__file__), 'squabble', '__init__.py')
+with open(init_path) as fp:
+    __version__ = re.search(r"^__version__ = '(.*)'$", fp.read(), re.M).group(1)
 
 readme_path = os.path.join(os.path.dirname(__file__), 'README.rst')
 with open(readme_path) as fp:
@@ -17,6 +22,9 @@ setup(
     author='Erik Price',
     url='https://github.com/erik/squabble',
     packages=find_packages(),
+    package_data={
+        'squabble.rules': ['manifest.json'],
+    },
     entry_points={
         'console_scripts': [
             'squabble = squabble.__main__:main',
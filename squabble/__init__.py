@@ -3,6 +3,9 @@ import types
 import logging
 
 
+# Also read by setup.py.
+__version__ = '1.4.0'
+
 logger = logging.getLogger(__name__)
 
 
@@ -12,6 +15,10 @@ class SquabbleException(Exception):
 
 class RuleConfigurationException(SquabbleException):
     def __init__(self, rule, msg):
+        # Passed along so the exception can be pickled, e.g. when raised
+        # in a worker process.
+        super().__init__(rule, msg)
+
         self.rule = rule
         self.msg = msg
 
@@ -0,0 +1,618 @@
+"""
+On-disk cache of the issues found in each file, so that files which
+haven't changed since they were last linted aren't parsed or linted
+again, along with the parse trees of each file, which only depend on
+the version of ``pglast``, so that changing the configuration doesn't
+mean everything has to be parsed again.
+"""
+
+import collections
+import copy
+import glob
+import hashlib
+import json
+import logging
+import os
+import os.path
+import pickle
+import re
+import tempfile
+import time
+import zlib
+
+import pglast
+
+import squabble
+from squabble import lint, rule
+from squabble.util import pack, relocate, unpack
+
+logger = logging.getLogger(__name__)
+
+# Default limit on the total size of the cache, in bytes.
+MAX_SIZE = 256 * 1024 * 1024
+
+# Read this much of a file at a time when hashing it.
+_BLOCK_SIZE = 1 << 16
+
+# Name of the file keeping track of the total size of the cache, made up
+# of the size of each entry written, one per line.
+_SIZE_FILE = 'size'
+
+# Number of lines of the size file after which it's rewritten as one.
+_MAX_SIZE_RECORDS = 1024
+
+# Suffix of the files entries are written to before being renamed.
+_TMP_SUFFIX = '.tmp'
+
+# Age in seconds after which a temporary file is assumed to have been
+# left behind by a process which never finished writing it.
+_STALE_TMP_AGE = 60 * 60
+
+
+class ResultCache:
+    """
+    Cache of lint results stored in ``directory``, one file per entry.
+
+    Entries are keyed by the contents of the linted file and the
+    configuration it was linted with, as well as the version (and
+    source) of squabble and the source of the plugins in
+    ``plugin_paths``, so that changing any of those never leads to stale
+    results.
+
+    Parse trees are stored separately, keyed only by the contents of
+    the file and the version of ``pglast`` (see :meth:`parser`).
+
+    Entries are written atomically, so several processes can share a
+    cache. Once the cache grows past ``max_size`` bytes, :meth:`prune`
+    removes the least recently used entries. The size of each entry is
+    added to a running total as it's written, so that the cache only
+    needs to be looked through when that happens.
+
+    >>> import tempfile
+    >>> from squabble.config import get_base_config
+    >>> cache = ResultCache(tempfile.mkdtemp())
+    >>> key = cache.key(b'SELECT 1;', get_base_config())
+    >>> cache.get(key, 'foo.sql') is None
+    True
+    >>> cache.put(key, [])
+    >>> cache.get(key, 'foo.sql')
+    []
+    """
+    def __init__(self, directory, plugin_paths=(), max_size=MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+        self._salt = _salt(plugin_paths)
+        self._parser_salt = _pglast_version().encode('utf-8')
+
+    def key(self, contents, config):
+        """
+        Return the key of the results of linting ``contents``, either
+        ``bytes`` or ``str``, with ``config`` (after applying any
+        configuration from the file itself).
+        """
+        if isinstance(contents, str):
+            contents = contents.encode('utf-8')
+
+        return self._key(hashlib.sha256(contents), config)
+
+    def file_key(self, path, config):
+        """Like :meth:`key`, but reads the contents from ``path``."""
+        digest = hashlib.sha256()
+
+        with open(path, 'rb') as fp:
+            for block in iter(lambda: fp.read(_BLOCK_SIZE), b''):
+                digest.update(block)
+
+        return self._key(digest, config)
+
+    def _key(self, content_digest, config):
+        digest = hashlib.sha256(self._salt)
+        digest.update(content_digest.digest())
+        digest.update(_rules_fingerprint(config))
+
+        return digest.hexdigest()
+
+    def get(self, key, file_name):
+        """
+        Return the issues stored for ``key`` (as reported for
+        ``file_name``), or ``None`` if there aren't any.
+        """
+        issues = self._read(self._path('results', key))
+        if issues is None:
+            return None
+
+        return [i._replace(file=file_name) for i in unpack(issues)]
+
+    def put(self, key, issues):
+        """Store ``issues`` under ``key``."""
+        self._write(self._path('results', key), pack(list(issues)))
+
+    def parser(self, contents):
+        """
+        Return a :class:`CachedParser` for the statements of
+        ``contents``, either ``bytes`` or ``str``.
+        """
+        if isinstance(contents, str):
+            contents = contents.encode('utf-8')
+
+        digest = hashlib.sha256(self._parser_salt)
+        digest.update(contents)
+
+        return CachedParser(self, self._path('trees', digest.hexdigest()))
+
+    def statement_results(self, file_name, config):
+        """
+        Return the :class:`StatementResults` stored for the statements
+        of ``file_name`` the last time it was linted with ``config``.
+        """
+        digest = hashlib.sha256(self._salt)
+        digest.update((file_name or '').encode('utf-8'))
+        digest.update(_rules_fingerprint(config))
+
+        return StatementResults(self, self._path('statements',
+                                                 digest.hexdigest()))
+
+    def prune(self):
+        """
+        Remove the least recently used entries until the cache is no
+        larger than ``max_size``.
+
+        Nothing is looked at other than the running total of the size of
+        the entries, unless it's past ``max_size`` (or isn't known yet,
+        e.g. for a cache written by an older version of squabble).
+        """
+        try:
+            with open(self._size_path(), 'rb') as fp:
+                records = fp.read().split()
+
+        except FileNotFoundError:
+            records = None
+
+        if records is not None:
+            total = sum(int(r) for r in records if r.isdigit())
+
+            if total <= self.max_size:
+                if len(records) > _MAX_SIZE_RECORDS:
+                    self._set_size(total)
+
+                return
+
+        self._set_size(self._evict())
+
+    def _evict(self):
+        """
+        Remove the least recently used entries until the cache is no
+        larger than ``max_size``, returning its size afterwards.
+        """
+        entries = []
+        total = 0
+        now = time.time()
+
+        for path in glob.iglob(os.path.join(self.directory, '*', '*', '*')):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+
+            # Still being written by another process.
+            if path.endswith(_TMP_SUFFIX) and \
+               now - stat.st_mtime < _STALE_TMP_AGE:
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+
+        for _mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+
+            _remove(path)
+            total -= size
+
+        return total
+
+    def _size_path(self):
+        return os.path.join(self.directory, _SIZE_FILE)
+
+    def _set_size(self, total):
+        os.makedirs(self.directory, exist_ok=True)
+        self._replace(self._size_path(), b'%d\n' % total)
+
+    def _add_size(self, size):
+        # Appended in a single write, so several processes can add to it
+        # at once. Entries which are written again are counted twice,
+        # which only means the cache is looked through a bit sooner.
+        try:
+            fd = os.open(self._size_path(), os.O_WRONLY | os.O_APPEND)
+
+        except FileNotFoundError:
+            # Not known yet, and found by looking through the whole
+            # cache the next time it's pruned.
+            return
+
+        try:
+            os.write(fd, b'%d\n' % size)
+        finally:
+            os.close(fd)
+
+    def _path(self, kind, key):
+        return os.path.join(self.directory, kind, key[:2], key)
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as fp:
+                value = pickle.loads(zlib.decompress(fp.read()))
+
+            # Mark as recently used.
+            os.utime(path)
+
+        except FileNotFoundError:
+            return None
+
+        except Exception:
+            # Corrupt, or refers to messages which no longer exist.
+            logger.warning('ignoring unreadable cache entry %s', path)
+            return None
+
+        return value
+
+    def _write(self, path, value):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        data = zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL), 1)
+
+        if self._replace(path, data):
+            self._add_size(len(data))
+
+    def _replace(self, path, data):
+        """
+        Atomically replace the file at ``path`` with ``data``, returning
+        whether it was written.
+        """
+        # Written to a temporary file first, so that nobody sees a
+        # partially written entry.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                        suffix=_TMP_SUFFIX)
+
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(data)
+
+            os.replace(tmp_path, path)
+
+        except FileNotFoundError:
+            # Removed by another process pruning the cache, e.g. after
+            # taking a long time to write, so the entry is left out.
+            logger.debug('could not write cache entry %s', path)
+            _remove(tmp_path)
+            return False
+
+        except BaseException:
+            _remove(tmp_path)
+            raise
+
+        return True
+
+
+class CachedParser:
+    """
+    Parses statements like :func:`squabble.lint._parse_statement`, but
+    using the parse trees stored for the file, if any. Trees of new
+    statements are only stored once :meth:`save` is called.
+
+    Can be passed to :class:`squabble.lint.Session` as ``parse``.
+    """
+    def __init__(self, cache, path):
+        self._cache = cache
+        self._path = path
+
+        # (location, length) of each statement -> parse tree, or the
+        # arguments of the ``ParseError`` raised for it.
+        self._trees = None
+        self._changed = False
+
+    def __call__(self, stmt):
+        if self._trees is None:
+            self._trees = self._cache._read(self._path) or {}
+
+        # The contents of the file are the same, so a statement at the
+        # same position and of the same length is the same statement.
+        key = (stmt.location, len(stmt.sql))
+
+        if key not in self._trees:
+            self._changed = True
+
+            try:
+                self._trees[key] = lint._parse_statement(stmt)
+            except pglast.parser.ParseError as exc:
+                self._trees[key] = _ParseFailure(exc.args)
+
+        tree = self._trees[key]
+
+        if isinstance(tree, _ParseFailure):
+            raise pglast.parser.ParseError(*tree.args)
+
+        return tree
+
+    def save(self):
+        """Store the parse trees of any newly parsed statements."""
+        if self._changed:
+            self._cache._write(self._path, self._trees)
+            self._changed = False
+
+
+class StatementResults:
+    """
+    The issues found in (and the facts recorded for) each statement of a
+    file, for when only some of the statements of a file have changed
+    since it was last linted. Only used when every rule is
+    :attr:`~squabble.rules.BaseRule.STATEMENT_LOCAL`.
+
+    Statements are identified by their text, and their results are
+    stored along with where the statement started, so they can be moved
+    to wherever the statement is in the file now.
+    """
+    def __init__(self, cache, path):
+        self._cache = cache
+        self._path = path
+
+        self._stored = None
+
+        # Results of the statements in the file as it is now.
+        self._results = {}
+
+    def get(self, stmt):
+        """
+        Return ``(issues, facts)`` for ``stmt``, or ``None`` if it
+        wasn't in the file the last time it was linted.
+        """
+        if self._stored is None:
+            self._stored = self._cache._read(self._path) or {}
+
+        key, start = _statement_key(stmt)
+
+        stored = self._results.get(key) or self._stored.get(key)
+        if stored is None:
+            return None
+
+        self._results[key] = stored
+
+        # Each result is pickled on its own, so loading it gives a fresh
+        # copy which can be moved to where the statement is now.
+        old_start, result = pickle.loads(stored)
+        if start != old_start:
+            result = relocate(result, lambda location:
+                              location + start - old_start)
+
+        return unpack(result)
+
+    def put(self, stmt, issues, facts):
+        """Store the ``issues`` and ``facts`` of ``stmt``."""
+        key, start = _statement_key(stmt)
+
+        self._results[key] = pickle.dumps((start, pack((issues, facts))),
+                                          pickle.HIGHEST_PROTOCOL)
+
+    def save(self):
+        """
+        Store the results of every statement passed to :meth:`get` or
+        :meth:`put`, replacing those stored before.
+        """
+        if self._results != self._stored:
+            self._cache._write(self._path, self._results)
+
+
+class MemoryStatementResults:
+    """
+    Like :class:`StatementResults`, but kept in memory, for a file which
+    is linted again after each edit (see :mod:`squabble.lsp`). Results
+    aren't pickled, so those of the statements which didn't move are
+    reused as they are.
+
+    Only the results for one configuration are kept, see
+    :meth:`for_config`.
+    """
+    def __init__(self):
+        self._rules = None
+
+        # (key of a statement, occurrence) -> (start, packed result,
+        # result), so that each occurrence of a statement repeated in
+        # the file has nodes of its own.
+        self._stored = {}
+        self._results = {}
+
+        # key of a statement -> occurrences seen in this lint
+        self._seen = {}
+
+    def for_config(self, config):
+        """
+        Return these results for the file linted with ``config``,
+        forgetting the results kept for any other configuration. Can be
+        passed to :meth:`squabble.lint.Linter.lint_statements`.
+        """
+        rules = _rules_fingerprint(config)
+
+        if rules != self._rules:
+            self._rules = rules
+            self._stored = {}
+            self._results = {}
+            self._seen = {}
+
+        return self
+
+    def get(self, stmt):
+        """
+        Return ``(issues, facts)`` for ``stmt``, or ``None`` if it
+        wasn't in the file the last time it was linted.
+        """
+        key, start = self._key(stmt)
+
+        stored = self._stored.pop(key, None)
+
+        if stored is None and key[1]:
+            # A copy of the results of the statement's first occurrence.
+            stored = self._results.get((key[0], 0))
+            if stored is not None:
+                stored = (stored[0], copy.deepcopy(stored[1]), None)
+
+        if stored is None:
+            return None
+
+        old_start, packed, result = stored
+
+        # Nodes are moved in place, so the result has to be unpacked
+        # again for the locations of the issues.
+        if start != old_start or result is None:
+            packed = relocate(packed, lambda location:
+                              location + start - old_start)
+            result = unpack(packed)
+
+        self._results[key] = (start, packed, result)
+        return result
+
+    def put(self, stmt, issues, facts):
+        """
+        Keep the ``issues`` and ``facts`` of ``stmt``, which was just
+        passed to :meth:`get`.
+        """
+        key, start = _statement_key(stmt)
+        key = (key, self._seen[key] - 1)
+
+        self._results[key] = (start, pack((issues, facts)), (issues, facts))
+
+    def _key(self, stmt):
+        key, start = _statement_key(stmt)
+
+        occurrence = self._seen.get(key, 0)
+        self._seen[key] = occurrence + 1
+
+        return (key, occurrence), start
+
+    def save(self):
+        """
+        Keep the results of every statement passed to :meth:`get` or
+        :meth:`put` for the next lint, forgetting the others.
+        """
+        self._stored, self._results = self._results, {}
+        self._seen = {}
+
+    def abandon(self):
+        """
+        Keep the results of the statements linted so far along with the
+        others, when the file changed before it was completely linted.
+        """
+        self._stored.update(self._results)
+        self._results = {}
+        self._seen = {}
+
+
+# Whitespace and comments before the start of a statement.
+_LEADING_TRIVIA = re.compile(r'(?:\s+|--[^\n]*|/\*.*?\*/)*', re.DOTALL)
+
+
+def _statement_key(stmt):
+    """
+    Return the hash of the text of ``stmt``, without any whitespace or
+    comments before it, and the location in bytes of where that text
+    starts.
+
+    >>> from squabble.splitter import Statement
+    >>> key, start = _statement_key(Statement('\\n-- ü\\nSELECT 1;', 10))
+    >>> start
+    17
+    >>> key == _statement_key(Statement('SELECT 1;', 0))[0]
+    True
+    """
+    leading = _LEADING_TRIVIA.match(stmt.sql).end()
+    text = stmt.sql[leading:].encode('utf-8')
+
+    start = stmt.location + len(stmt.sql[:leading].encode('utf-8'))
+
+    return hashlib.sha256(text).hexdigest(), start
+
+
+def _rules_fingerprint(config):
+    # Rule order matters, since it's the order issues are reported.
+    rules = json.dumps(list(config.rules.items()), sort_keys=True,
+                       default=repr)
+
+    return rules.encode('utf-8')
+
+
+class _ParseFailure(collections.namedtuple('_ParseFailure', ['args'])):
+    """Stored in place of the tree of a statement with a syntax error."""
+
+
+def _salt(plugin_paths):
+    """
+    Return a hash of everything other than the file and configuration
+    that affects the results of linting: the version and source of
+    squabble itself, the source of the plugins, and the versions of the
+    packages providing plugins through entry points.
+    """
+    digest = hashlib.sha256(_version().encode('utf-8'))
+
+    package_dir = os.path.dirname(squabble.__file__)
+    sources = [
+        (os.path.relpath(source, package_dir), source)
+        for source in sorted(glob.glob(
+            os.path.join(package_dir, '**', '*.py'), recursive=True))
+    ]
+
+    # Plugins are loaded in order, which affects the message codes.
+    for path in plugin_paths:
+        sources.extend(
+            (os.path.basename(source), source)
+            for source in sorted(glob.glob(os.path.join(path, '*.py'))))
+
+    for name, source in sources:
+        digest.update(name.encode('utf-8'))
+
+        with open(source, 'rb') as fp:
+            digest.update(hashlib.sha256(fp.read()).digest())
+
+    for entry_point in sorted(rule.entry_points(), key=lambda e: e.name):
+        dist = getattr(entry_point, 'dist', None)
+        version = getattr(dist, 'version', None) or ''
+
+        digest.update(('%s %s %s' % (
+            entry_point.name, getattr(entry_point, 'value', entry_point),
+            version)).encode('utf-8'))
+
+    return digest.digest()
+
+
+def _version():
+    return squabble.__version__
+
+
+def _pglast_version():
+    version = getattr(pglast, '__version__', None)
+    if version is not None:
+        return version
+
+    try:
+        from importlib import metadata
+    except ImportError:
+        # Before Python 3.8, fall back to the much slower pkg_resources.
+        from pkg_resources import DistributionNotFound, get_distribution
+
+        try:
+            return get_distribution('pglast').version
+        except DistributionNotFound:
+            return 'unknown'
+
+    try:
+        return metadata.version('pglast')
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -1,11 +1,23 @@
 """
 Usage:
+  squabble lsp [options]
+  squabble daemon [options]
   squabble [options] [PATHS...]
   squabble (-h | --help)
 
 Arguments:
   PATHS  Paths to check. If given a directory, will recursively traverse the
-         path and lint all files ending in `.sql` [default: -].
+         path and lint all files matching the `include` patterns of the
+         configuration (by default, those ending in `.sql`), other than
+         those matching its `exclude` patterns or ignored by git
+         [default: -].
+
+Commands:
+  lsp     Run a Language Server Protocol server on stdin and stdout, for
+          editors to lint files as they're edited.
+  daemon  Keep running, linting for the runs of squabble given --daemon so
+          that they don't have to load everything themselves. Listens on
+          $SQUABBLE_SOCKET, if set.
 
 Options:
   -h --help               Show this screen.
@@ -17,6 +29,27 @@ Options:
   -c --config=PATH        Path to configuration file.
   -p --preset=PRESETS     Comma-separated list of presets to use as a base.
   -r --reporter=REPORTER  Use REPORTER for output rather than one in config.
+  --stream                Lint files one statement at a time, without reading
+                          them into memory.
+  -j --jobs=N             Lint using N processes [default: 1].
+  --cache-dir=DIR         Cache lint results in DIR, so that unchanged files
+                          aren't linted again. Defaults to the value of
+                          $SQUABBLE_CACHE_DIR, if set.
+  --no-cache              Don't use or update the cache.
+  --dedupe                Lint statements differing only in their literal
+                          values, whitespace or comments only once.
+  --changed-since=REF     Only lint the files in PATHS (or anywhere in the
+                          repository, if not given) which git says were
+                          added, modified or renamed since REF.
+  --changed-lines         With --changed-since, only report issues on the
+                          lines which were changed.
+  --rev=REV               Lint the files in PATHS as of the git revision
+                          REV, reading them from the repository rather than
+                          from disk.
+
+  --daemon                Lint with the daemon started by `squabble daemon`,
+                          rather than in this process, if it's running and
+                          not busy.
 
   -e --explain=CODE       Show detailed explanation of a message code.
   --list-presets          List available preset configurations.
@@ -24,35 +57,105 @@ Options:
   --show-rule=RULE        Show detailed information about RULE.
 """
 
-import glob
 import json
 import os.path
 import sys
 
 import docopt
 from colorama import Style
-from pkg_resources import get_distribution
 
 import squabble
 import squabble.message
-from squabble import config, lint, reporter, rule
-from squabble.util import strip_rst_directives
+from squabble import config, discovery, rule
+
+# Modules which import pglast (or start other processes) are imported
+# where they're needed, since squabble is run on every save by editors,
+# and things like --version shouldn't have to wait for them.
 
 
 def main():
-    version = get_distribution('squabble').version
-    args = docopt.docopt(__doc__, version=version)
+    args = docopt.docopt(__doc__, version=squabble.__version__)
+
+    if args['lsp']:
+        from squabble import lsp
+
+        return lsp.serve(args)
+
+    if args['daemon']:
+        from squabble import daemon
+
+        try:
+            return daemon.serve(verbose=args['--verbose'])
+        except daemon.DaemonException as exc:
+            sys.exit(str(exc))
+
+    if args['--daemon']:
+        from squabble import daemon
+
+        status = daemon.run(sys.argv[1:], args)
+        if status is not None:
+            return status
+
     return dispatch_args(args)
 
 
-def dispatch_args(args):
+class Session:
+    """
+    Loads the configuration, rules and caches needed to lint. A daemon
+    (see :mod:`squabble.daemon`) keeps a session which only loads them
+    again when they change, rather than once for every run.
+    """
+    def load_config(self, config_file, preset_names, reporter_name):
+        """
+        Return the configuration in ``config_file`` (see
+        :func:`squabble.config.load_config`), with the rules of its
+        plugins loaded.
+        """
+        base_config = config.load_config(
+            config_file,
+            preset_names=preset_names,
+            reporter_name=reporter_name)
+
+        # Load all of the rule classes into memory (need to do this now to
+        # be able to list all rules / show rule details)
+        rule.load_rules(plugin_paths=base_config.plugins)
+
+        return base_config
+
+    def result_cache(self, cache_dir, plugin_paths):
+        """Return a :class:`squabble.cache.ResultCache` in ``cache_dir``."""
+        from squabble import cache
+
+        return cache.ResultCache(cache_dir, plugin_paths=plugin_paths)
+
+    def directory_configs(self, base_config, root):
+        """
+        Return the :class:`squabble.config.DirectoryConfigs` of ``root``,
+        whose configuration is ``base_config``.
+        """
+        return config.DirectoryConfigs(base_config, root)
+
+    def linter(self, base_config, cache, dedupe):
+        """Return a :class:`squabble.lint.Linter` for ``base_config``."""
+        from squabble import lint
+
+        return lint.Linter(base_config, cache, dedupe)
+
+
+def dispatch_args(args, session=None):
     """
     Handle the command line arguments as parsed by ``docopt``. Calls the
     subroutine implied by the combination of command line flags and returns the
     exit status (or ``None``, if successful) of the program.
 
+    Everything needed is loaded through ``session``, by default a new
+    :class:`Session`.
+
     Note that some exceptional conditions will terminate the program directly.
     """
+    if session is None:
+        session = Session()
+
     if args['--verbose']:
         squabble.logger.setLevel('DEBUG')
 
@@ -65,14 +168,7 @@ def dispatch_args(args):
 
     presets = args['--preset'].split(',') if args['--preset'] else []
 
-    base_config = config.load_config(
-        config_file,
-        preset_names=presets,
-        reporter_name=args['--reporter'])
-
-    # Load all of the rule classes into memory (need to do this now to
-    # be able to list all rules / show rule details)
-    rule.load_rules(plugin_paths=base_config.plugins)
+    base_config = session.load_config(config_file, presets, args['--reporter'])
 
     if args['--list-rules']:
         return list_rules()
@@ -83,47 +179,392 @@ def dispatch_args(args):
     if args['--explain']:
         return explain_message(code=args['--explain'])
 
-    return run_linter(base_config, args['PATHS'], args['--expanded'])
+    try:
+        jobs = int(args['--jobs'])
+    except ValueError:
+        sys.exit('--jobs must be a number, not "%s"' % args['--jobs'])
+
+    result_cache = None
+    cache_dir = args['--cache-dir'] or os.environ.get('SQUABBLE_CACHE_DIR')
+
+    if cache_dir and not args['--no-cache']:
+        result_cache = session.result_cache(cache_dir, base_config.plugins)
+
+    root = _config_root(config_file)
+    finder = discovery.FileFinder(
+        base_config.include, base_config.exclude, root=root)
+    configs = session.directory_configs(base_config, root)
+
+    paths = args['PATHS']
+    changed_lines = None
+
+    if args['--changed-since']:
+        from squabble import vcs
+
+        try:
+            changed = vcs.changed_files(args['--changed-since'])
+        except vcs.GitException as exc:
+            sys.exit('--changed-since: %s' % exc)
+
+        paths = select_files(paths, changed, finder)
+        if not paths:
+            return 0
+
+        if args['--changed-lines']:
+            changed_lines = changed
+
+    # Only used when linting in this process, a file at a time.
+    linter = None
+    if jobs == 1 and not args['--stream']:
+        linter = session.linter(base_config, result_cache, args['--dedupe'])
+
+    return run_linter(base_config, paths, args['--expanded'],
+                      stream=args['--stream'], jobs=jobs, cache=result_cache,
+                      dedupe=args['--dedupe'], changed_lines=changed_lines,
+                      rev=args['--rev'], finder=finder, configs=configs,
+                      linter=linter)
+
+
+def _config_root(config_file):
+    """
+    Return the directory the patterns in ``config_file`` are relative
+    to, as are the configuration files of the directories below it.
+    """
+    if config_file:
+        return os.path.dirname(config_file) or '.'
+
+    return discovery.find_repository_root('.') or '.'
 
 
-def run_linter(base_config, paths, expanded):
+def run_linter(base_config, paths, expanded, stream=False, jobs=1,
+               cache=None, dedupe=False, changed_lines=None, rev=None,
+               finder=None, configs=None, linter=None):
     """
     Run linter against all SQL files contained in ``paths``.
 
-    ``paths`` may contain both files and directories.
+    ``paths`` may contain both files and directories. Which files are
+    linted in directories is decided by ``finder``, a
+    :class:`squabble.discovery.FileFinder`, which defaults to one using
+    the ``include`` and ``exclude`` patterns of ``base_config``. Paths
+    which don't exist are reported once linting has finished.
 
     If ``paths`` is empty or only contains ``"-"``, squabble will read
     from stdin instead.
 
+    If ``configs`` (a :class:`squabble.config.DirectoryConfigs` for
+    ``base_config``) is given, each file is linted with the configuration
+    of its directory, rather than with ``base_config``.
+
+    Files are found, read, linted and reported one at a time, so only
+    the file whose issues are being reported is kept in memory, and
+    issues are printed as soon as the first file has been linted.
+
     If ``expanded`` is ``True``, print the detailed explanation of each message
     after the lint has finished.
+
+    If ``stream`` is ``True``, files are linted (and issues reported) one
+    statement at a time, rather than being read into memory. Stdin is
+    still read all at once.
+
+    If ``jobs`` is greater than 1, that many processes are used, linting
+    several files at once, or with ``stream``, parts of each file at
+    once. Either way, the output is the same as with a single process.
+
+    If ``cache`` (a :class:`squabble.cache.ResultCache`) is given, the
+    results of files linted before with the same configuration are
+    reused.
+
+    If ``dedupe`` is ``True``, statements of the same shape are only
+    linted once, see :mod:`squabble.shapes`. This isn't done for files
+    linted with ``stream``.
+
+    If ``changed_lines`` is given, as returned by
+    :func:`squabble.vcs.changed_files`, only issues on the changed lines
+    of the files in it are reported.
+
+    If ``rev`` is given, the files in ``paths`` are read from that git
+    revision instead (see :class:`squabble.vcs.Revision`), and ``stream``
+    is ignored.
+
+    If ``linter`` (a :class:`squabble.lint.Linter` for ``base_config``,
+    ``cache`` and ``dedupe``) is given, files linted one at a time in this
+    process are linted with it, rather than with a new one.
     """
-    if not paths:
+    if not paths and rev is None:
         paths = ['-']
 
-    files = collect_files(paths)
+    if finder is None:
+        finder = discovery.FileFinder(base_config.include,
+                                      base_config.exclude)
 
-    issues = []
-    for file_name, contents in files:
-        file_config = config.apply_file_config(base_config, contents)
-        if file_config is None:
-            continue
-        issues += lint.check_file(file_config, file_name, contents)
+    if stream and rev is None:
+        issues, files = _stream_files(base_config, paths, jobs, cache,
+                                      finder, configs)
+    elif jobs > 1:
+        issues, files = _lint_files_parallel(
+            base_config, paths, jobs, cache, dedupe, rev, finder, configs)
+    else:
+        issues, files = _lint_files(base_config, paths, cache, dedupe, rev,
+                                    finder, configs, linter)
 
-    reporter.report(base_config.reporter, issues, dict(files))
+    if changed_lines is not None:
+        issues = _on_changed_lines(issues, files, changed_lines)
 
-    if expanded:
-        codes = {
-            i.message.CODE for i in issues
-            if i.message
-        }
+    codes = set()
+    has_issues = False
+
+    def record(issues):
+        nonlocal has_issues
+
+        for i in issues:
+            has_issues = True
+            if i.message:
+                codes.add(i.message.CODE)
 
+            yield i
+
+    from squabble import reporter
+    reporter.report(base_config.reporter, record(issues), files)
+
+    if cache is not None:
+        cache.prune()
+
+    if expanded:
         for c in codes:
             print('\n')
             explain_message(c)
 
+    for path in finder.missing:
+        print('%s: no such file or directory' % path, file=sys.stderr)
+
     # Make sure we have an error status if something went wrong.
-    return 1 if issues else 0
+    return 1 if has_issues or finder.missing else 0
+
+
+def _lint_files(base_config, paths, cache=None, dedupe=False, rev=None,
+                finder=None, configs=None, linter=None):
+    """
+    Lazily lint the files in ``paths`` (as of the git revision ``rev``,
+    if given) one at a time, yielding the issues found in each as soon as
+    it has been linted. Also returns a map of file name to contents for
+    the reporter, which only holds the file whose issues are being
+    reported, so that memory use doesn't grow with the number of files.
+    """
+    files = {}
+
+    if linter is None:
+        from squabble import lint
+        linter = lint.Linter(base_config, cache, dedupe)
+
+    def lint_all():
+        for file_name, contents in iter_files(paths, rev, finder):
+            files[file_name] = contents
+            yield from linter.lint(contents, file_name,
+                                   _file_config(configs, file_name))
+
+            # Issues are reported as they're yielded, so every issue in
+            # the file has been reported by now.
+            del files[file_name]
+
+    return lint_all(), files
+
+
+def _lint_files_parallel(base_config, paths, jobs, cache=None,
+                         dedupe=False, rev=None, finder=None, configs=None):
+    """
+    Like :func:`_lint_files`, but lints files with ``jobs`` processes,
+    lazily yielding the issues found in each file in order. Only files
+    with issues are read into the returned map, as they are reported.
+
+    Only the names of files on disk are collected up front. Their
+    contents are read by the workers.
+    """
+    from squabble import parallel
+
+    files = {}
+
+    def lint_all():
+        # Collected up front, so that stdin is read (and missing paths
+        # are reported) before any workers are started.
+        items = []
+
+        if rev is not None:
+            items = collect_files(paths, rev, finder)
+            files.update(items)
+
+        else:
+            for path in _collect_paths(paths, finder):
+                if path != '-':
+                    items.append((path, None))
+                    continue
+
+                for file_name, contents in collect_files([path]):
+                    files[file_name] = contents
+                    items.append((file_name, contents))
+
+        if not items:
+            return
+
+        results = parallel.check_files(
+            base_config, items, min(jobs, len(items)), cache=cache,
+            dedupe=dedupe, configs=configs)
+
+        for file_name, issues in results:
+            if issues and file_name not in files:
+                files[file_name] = _slurp_file(file_name)
+
+            yield from issues
+
+            files.pop(file_name, None)
+
+    return lint_all(), files
+
+
+def _stream_files(base_config, paths, jobs=1, cache=None, finder=None,
+                  configs=None):
+    """
+    Like :func:`_lint_files`, but lazily yields the issues found in each
+    file as it is read. The returned map of file names is filled in as
+    the files are linted.
+    """
+    from squabble import lint, parallel, reporter
+
+    files = {}
+    linter = lint.Linter(base_config, cache)
+
+    # Shared by every file, rather than started for each.
+    pool = parallel.StreamPool(jobs, base_config)
+
+    def lint_all():
+        with pool:
+            yield from lint_paths()
+
+    def lint_paths():
+        for path in _collect_paths(paths, finder):
+            if path == '-':
+                for file_name, contents in collect_files([path]):
+                    files[file_name] = contents
+                    yield from linter.lint(contents, file_name)
+                continue
+
+            # The file is read twice, first for any per-file
+            # configuration, which may be anywhere in the file.
+            with open(path, 'r') as fp:
+                file_config = config.apply_file_config(
+                    _file_config(configs, path) or base_config, fp)
+            if file_config is None:
+                continue
+
+            files[path] = reporter.SourceFile(path)
+
+            if cache is None:
+                with open(path, 'rb') as fp:
+                    yield from parallel.check_stream(
+                        file_config, path, fp, jobs, pool=pool)
+
+            else:
+                yield from _stream_cached(cache, file_config, path, jobs,
+                                          pool)
+
+            files.pop(path).close()
+
+    return lint_all(), files
+
+
+def _stream_cached(cache, file_config, path, jobs, pool=None):
+    from squabble import parallel
+
+    key = cache.file_key(path, file_config)
+
+    issues = cache.get(key, path)
+    if issues is not None:
+        yield from issues
+        return
+
+    issues = []
+
+    with open(path, 'rb') as fp:
+        for issue in parallel.check_stream(file_config, path, fp, jobs,
+                                           pool=pool):
+            issues.append(issue)
+            yield issue
+
+    cache.put(key, issues)
+
+
+def _file_config(configs, file_name):
+    """
+    Return the configuration of the directory of ``file_name`` from
+    ``configs``, or ``None`` if there isn't one.
+    """
+    if configs is None:
+        return None
+
+    return configs.for_file(file_name)
+
+
+def _on_changed_lines(issues, files, changed_lines):
+    """
+    Lazily filter out the issues which aren't on the lines of their file
+    listed in ``changed_lines``. Issues in other files, and those without
+    a location, are kept.
+    """
+    from squabble import reporter
+
+    for issue in issues:
+        ranges = changed_lines.get(issue.file)
+
+        if ranges is None or reporter._location_for_issue(issue) is None:
+            yield issue
+            continue
+
+        _line_str, line, _column = reporter._issue_to_file_location(
+            issue, files.get(issue.file, ''))
+
+        if any(first <= line <= last for first, last in ranges):
+            yield issue
+
+
+def select_files(paths, file_names, finder=None):
+    """
+    Return the files in ``file_names`` which would be linted given
+    ``paths``: those named in ``paths``, and those in the directories in
+    ``paths`` wanted by ``finder`` (see
+    :meth:`squabble.discovery.FileFinder.wanted`), by default those
+    ending in `.sql`. If ``paths`` is empty, every wanted file is
+    returned.
+
+    >>> names = ['a.sql', 'a.txt', 'db/b.sql', 'c.sql']
+    >>> select_files(['db', 'a.txt'], names)
+    ['a.txt', 'db/b.sql']
+    >>> select_files([], names)
+    ['a.sql', 'c.sql', 'db/b.sql']
+    >>> finder = discovery.FileFinder(exclude=['db/'])
+    >>> select_files([], names, finder)
+    ['a.sql', 'c.sql']
+    """
+    if finder is None:
+        finder = discovery.FileFinder()
+
+    if not paths:
+        return sorted(f for f in file_names if finder.wanted(f))
+
+    selected = []
+
+    for file_name in sorted(file_names):
+        for path in map(os.path.expanduser, paths):
+            if os.path.normpath(file_name) == os.path.normpath(path):
+                selected.append(file_name)
+                break
+
+            relative = os.path.relpath(file_name, path)
+            if relative != os.pardir and \
+               not relative.startswith(os.pardir + os.sep) and \
+               finder.wanted(file_name):
+                selected.append(file_name)
+                break
+
+    return selected
 
 
 def _slurp_file(file_name):
@@ -143,37 +584,69 @@ def _slurp_stdin():
         return None
 
 
-def collect_files(paths):
+def iter_files(paths, rev=None, finder=None):
+    """
+    Like :func:`collect_files`, but lazily yields each file, only reading
+    it once the previous one has been dealt with.
+    """
+    if rev is not None:
+        yield from _iter_revision_files(paths, rev, finder)
+        return
+
+    for path in _collect_paths(paths, finder):
+        if path == '-':
+            stdin = _slurp_stdin()
+            if stdin is not None and stdin.strip() != '':
+                yield 'stdin', stdin
+
+        else:
+            yield path, _slurp_file(path)
+
+
+def collect_files(paths, rev=None, finder=None):
     """
     Given a list of files or directories, find all named files as well as
-    any files ending in `.sql` in the directories.
+    any files found in the directories by ``finder`` (a
+    :class:`squabble.discovery.FileFinder`), by default those ending in
+    `.sql`.
 
     The return format is a list of tuples containing the file name and
     file contents.
 
     The value ``'-'`` is treated specially as stdin.
+
+    If ``rev`` is given, the files are read from that git revision of the
+    repository containing the current directory instead, and ``paths``
+    defaults to the current directory.
     """
-    files = []
+    return list(iter_files(paths, rev, finder))
 
-    for path in map(os.path.expanduser, paths):
-        if path == '-':
-            stdin = _slurp_stdin()
-            if stdin is not None and stdin.strip() != '':
-                files.append(('stdin', stdin))
 
-        elif not os.path.exists(path):
-            sys.exit('%s: no such file or directory' % path)
+def _iter_revision_files(paths, rev, finder=None):
+    from squabble import vcs
 
-        elif os.path.isdir(path):
-            sql_glob = os.path.join(path, '**/*.sql')
-            sql_files = glob.iglob(sql_glob, recursive=True)
+    paths = [os.path.expanduser(p) for p in paths] or ['.']
 
-            files.extend(collect_files(sql_files))
+    try:
+        with vcs.Revision(rev) as revision:
+            names = select_files(paths, revision.files(paths), finder)
 
-        else:
-            files.append((path, _slurp_file(path)))
+            for name in names:
+                yield name, revision.read(name)
+
+    except vcs.GitException as exc:
+        sys.exit('--rev: %s' % exc)
+
+
+def _collect_paths(paths, finder=None):
+    """
+    Lazily expand directories in ``paths`` into the files that ``finder``
+    finds in them, see :meth:`squabble.discovery.FileFinder.find`.
+    """
+    if finder is None:
+        finder = discovery.FileFinder()
 
-    return files
+    return finder.find(os.path.expanduser(path) for path in paths)
 
 
 def show_rule(name):
@@ -207,7 +680,7 @@ def list_rules():
     all_rules = sorted(rule.Registry.all(), key=lambda r: r['name'])
 
     for meta in all_rules:
-        desc = strip_rst_directives(meta['description'])
+        desc = squabble.message.strip_rst_directives(meta['description'])
 
         print('{bold}{name: <32}{reset} {description}'.format(**{
             **color,
@@ -236,7 +709,7 @@ def explain_message(code):
     ))
 
     explanation = cls.explain() or 'No additional info.'
-    print(strip_rst_directives(explanation))
+    print(squabble.message.strip_rst_directives(explanation))
 
 
 def list_presets():
@@ -4,9 +4,9 @@ import json
 import logging
 import os.path
 import re
-import subprocess
 
 from squabble import SquabbleException
+from squabble.discovery import find_repository_root
 
 
 logger = logging.getLogger(__name__)
@@ -15,15 +15,23 @@ logger = logging.getLogger(__name__)
 Config = collections.namedtuple('Config', [
     'reporter',
     'plugins',
-    'rules'
+    'rules',
+    'include',
+    'exclude',
 ])
 
+# Which files are linted in the directories given on the command line,
+# see ``squabble.discovery``.
+Config.__new__.__defaults__ = (('*.sql',), ())
+
 
 # TODO: Move these out somewhere else, feels gross to have them hardcoded.
 DEFAULT_CONFIG = dict(
     reporter='plain',
     plugins=[],
-    rules={}
+    rules={},
+    include=['*.sql'],
+    exclude=[],
 )
 
 PRESETS = {
@@ -94,6 +102,12 @@ class UnknownPresetException(SquabbleException):
         super().__init__('unknown preset: "%s"' % preset)
 
 
+class InvalidConfigException(SquabbleException):
+    """Raised when a configuration file can't be read."""
+    def __init__(self, path, reason):
+        super().__init__('%s: %s' % (path, reason))
+
+
 def discover_config_location():
     """
     Try to locate a config file in some likely locations.
@@ -129,10 +143,13 @@ def discover_config_location():
 def _get_vcs_root():
     """
     Return the path to the root of the Git repository for the current
-    directory, or empty string if not in a repository.
+    directory, or ``None`` if not in a repository.
+
+    Found by looking for ``.git`` in the parent directories rather than
+    by running ``git``, which would take longer than everything else
+    squabble does at startup.
     """
-    return subprocess.getoutput(
-        'git rev-parse --show-toplevel 2>/dev/null || echo ""')
+    return find_repository_root('.')
 
 
 def get_base_config(preset_names=None):
@@ -189,26 +206,156 @@ def load_config(config_file, preset_names=None, reporter_name=None):
     return Config(
         reporter=reporter_name or config.get('reporter', base.reporter),
         plugins=config.get('plugins', base.plugins),
-        rules=rules
+        rules=rules,
+        include=config.get('include', base.include),
+        exclude=config.get('exclude', base.exclude),
     )
 
 
+class DirectoryConfigs:
+    """
+    Resolves the configuration of each file, given the ``base``
+    configuration of ``root``, and the ``.squabblerc`` files in the
+    directories between ``root`` and the file, so that parts of a
+    repository can be linted with different rules.
+
+    Each ``.squabblerc`` below ``root`` is merged with the configuration
+    of the directory above it: options of rules it names are merged with
+    those already set (as with presets, see :func:`_merge_dicts`), and
+    a rule set to ``false`` is disabled. Only ``rules`` can be set
+    there. The reporter, plugins and which files are linted are decided
+    by the configuration of ``root``.
+
+    Each directory's configuration is resolved once, and shared by every
+    file below it. Files outside of ``root`` use ``base``.
+    """
+    def __init__(self, base, root='.'):
+        self.base = base
+        self.root = os.path.abspath(root)
+
+        # directory -> its configuration
+        self._configs = {self.root: base}
+
+        # path of each .squabblerc looked for -> its stamp, see
+        # :meth:`changed`
+        self._stamps = {}
+
+    def for_file(self, file_name):
+        """
+        Return the configuration of ``file_name`` (before applying any
+        configuration comments in the file itself).
+        """
+        if not file_name or file_name == 'stdin':
+            return self.base
+
+        directory = os.path.dirname(os.path.abspath(file_name))
+
+        if directory != self.root and \
+           not directory.startswith(os.path.join(self.root, '')):
+            return self.base
+
+        return self._resolve(directory)
+
+    def _resolve(self, directory):
+        if directory in self._configs:
+            return self._configs[directory]
+
+        parent = self._resolve(os.path.dirname(directory))
+        config = parent
+
+        path = os.path.join(directory, '.squabblerc')
+
+        self._stamps[path] = stamp(path)
+        if self._stamps[path] is not None:
+            config = _apply_directory_config(parent, path)
+
+        self._configs[directory] = config
+        return config
+
+    def changed(self):
+        """
+        Return whether any of the ``.squabblerc`` files used so far have
+        changed (or been created or removed) since they were read.
+        """
+        return any(stamp(p) != s for p, s in self._stamps.items())
+
+
+def stamp(path):
+    """
+    Return something which changes whenever the file ``path`` is
+    modified, or ``None`` if it doesn't exist.
+    """
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+
+    return (info.st_mtime_ns, info.st_size)
+
+
+def _apply_directory_config(parent, path):
+    """
+    Return ``parent`` with the ``.squabblerc`` at ``path`` applied, see
+    :class:`DirectoryConfigs`.
+    """
+    logger.debug('applying "%s" to the configuration of its directory',
+                 path)
+
+    try:
+        settings = _parse_config_file(path)
+    except (OSError, ValueError) as exc:
+        raise InvalidConfigException(path, exc)
+
+    if not isinstance(settings, dict):
+        raise InvalidConfigException(path, 'expected a JSON object')
+
+    for key in settings.keys() - {'rules'}:
+        logger.warning('%s: "%s" can only be set in the top level '
+                       'configuration, ignoring it', path, key)
+
+    if not settings.get('rules'):
+        return parent
+
+    # Order matters, since it's the order issues are reported in.
+    rules = dict(parent.rules)
+
+    for name, options in settings['rules'].items():
+        if options is False or options is None:
+            rules.pop(name, None)
+
+        elif isinstance(options, dict):
+            rules[name] = _merge_dicts(rules.get(name, {}), options)
+
+        else:
+            raise InvalidConfigException(
+                path, 'options of "%s" should be an object, or false' % name)
+
+    return parent._replace(rules=rules)
+
+
 def apply_file_config(base, contents):
     """
-    Given a base configuration object and the contents of a file,
+    Given a base configuration object and the contents of a file
+    (either a string or an iterable of lines, such as an open file),
     return a new config that applies any file-specific rule
     additions/deletions.
 
     Returns ``None`` if the file should be skipped.
     """
-    # Operate on a copy so we don't mutate the base config
-    file_rules = copy.deepcopy(base.rules)
-
     rules = _extract_file_rules(contents)
 
     if rules['skip_file']:
         return None
 
+    # Nothing to change, so the rules (and the lint plan cached for
+    # them, see ``squabble.lint.Linter``) can be shared.
+    if not rules['enable'] and not rules['disable']:
+        return base
+
+    # Operate on a copy so we don't mutate the base config. Options of
+    # the rules are replaced rather than changed, so can be shared.
+    file_rules = dict(base.rules)
+
     for rule, opts in rules['enable'].items():
         file_rules[rule] = opts
 
@@ -218,6 +365,11 @@ def apply_file_config(base, contents):
     return base._replace(rules=file_rules)
 
 
+# Anything which might be a configuration comment, see
+# ``_extract_file_rules``.
+_CONFIG_COMMENT = re.compile(r'--\s*(?:squabble-)?(?:en|dis)able', re.I)
+
+
 def _extract_file_rules(text):
     """
     Try to extract any file-level rule additions/suppressions.
@@ -241,13 +393,23 @@ def _extract_file_rules(text):
         'skip_file': False
     }
 
+    if isinstance(text, str):
+        # Most files have no configuration comments, and large ones are
+        # searched much faster as a whole than line by line.
+        if not _CONFIG_COMMENT.search(text):
+            return rules
+
+        lines = text.splitlines()
+    else:
+        lines = text
+
     comment_re = re.compile(
         r'--\s*'
         r'(?:squabble-)?(enable|disable)'
         r'(?::\s*(\w+)(.*?))?'
         r'$', re.I)
 
-    for line in text.splitlines():
+    for line in lines:
         line = line.strip()
 
         m = re.match(comment_re, line)
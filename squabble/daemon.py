@@ -0,0 +1,537 @@
+"""
+Lint for other runs of squabble from a long running process, so that
+they don't each pay for starting Python, importing ``pglast`` and
+loading the rules and configuration.
+
+``squabble daemon`` listens on a Unix socket (see :func:`socket_path`)
+for the command lines of runs given ``--daemon``, which send them along
+with their working directory, environment and standard input, and print
+the output they get back (see :func:`run`). Runs fall back to linting by
+themselves when no daemon is running, it's busy with another run, or it
+can't help them.
+
+The daemon keeps the configuration, the rules set up for it and any
+result caches between runs, checking whether the configuration files
+have changed each time. Plugins can't be unloaded, so if they change
+(or the daemon's version of squabble is different to the one asking)
+the daemon starts over, and the run lints by itself meanwhile.
+"""
+
+import glob
+import io
+import json
+import logging
+import os
+import os.path
+import queue
+import signal
+import sys
+import threading
+import time
+
+import docopt
+
+import squabble
+from squabble import SquabbleException, cli, config, rule
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for the daemon to accept a connection, and then for
+# each part of its response, before linting without it.
+_CONNECT_TIMEOUT = 1
+_RESPONSE_TIMEOUT = 60
+
+
+class DaemonException(SquabbleException):
+    """Raised when the daemon can't be started."""
+
+
+class Restart(Exception):
+    """Raised when the daemon has to start over to handle a request."""
+
+
+def socket_path():
+    """
+    Return the path of the socket the daemon listens on, which is
+    ``$SQUABBLE_SOCKET`` if set, or else a socket for the current user in
+    ``$XDG_RUNTIME_DIR`` (or the temporary directory).
+    """
+    path = os.environ.get('SQUABBLE_SOCKET')
+    if path:
+        return path
+
+    directory = os.environ.get('XDG_RUNTIME_DIR') or \
+        os.environ.get('TMPDIR') or '/tmp'
+
+    return os.path.join(directory, 'squabble-%d.sock' % os.getuid())
+
+
+def reads_stdin(args):
+    """
+    Return whether the run of squabble with ``args``, as parsed by
+    ``docopt``, reads the file to lint from stdin.
+
+    >>> args = {'PATHS': [], '--rev': None, '--changed-since': None,
+    ...         '--list-presets': False, '--list-rules': False,
+    ...         '--show-rule': None, '--explain': None}
+    >>> reads_stdin(args)
+    True
+    >>> reads_stdin(dict(args, PATHS=['a.sql']))
+    False
+    >>> reads_stdin(dict(args, PATHS=['a.sql', '-']))
+    True
+    >>> reads_stdin(dict(args, **{'--list-rules': True}))
+    False
+    """
+    if any(args[option] for option in [
+            '--list-presets', '--list-rules', '--show-rule', '--explain']):
+        return False
+
+    if args['PATHS']:
+        return '-' in args['PATHS']
+
+    return not args['--rev'] and not args['--changed-since']
+
+
+def run(argv, args):
+    """
+    Have the daemon run squabble with the command line arguments
+    ``argv`` (as parsed by ``docopt`` into ``args``), printing its output
+    and returning the exit status, or ``None`` if the daemon isn't
+    running, is busy, doesn't answer in time or couldn't handle it.
+
+    If stdin is read for the daemon, it's replaced with what was read,
+    so that squabble can still read it when the daemon can't help.
+    """
+    if os.name != 'posix':
+        return None
+
+    path = socket_path()
+
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+
+    # Don't send anything to a socket belonging to someone else.
+    if info.st_uid != os.getuid():
+        logger.warning('ignoring daemon socket %s, which belongs to another '
+                       'user', path)
+        return None
+
+    # Imported here, since it's slow to import and only needed when a
+    # daemon is running.
+    import socket
+
+    stdin = None
+    if reads_stdin(args):
+        stdin = cli._slurp_stdin()
+        sys.stdin = io.StringIO(stdin or '')
+
+    request = {
+        'version': squabble.__version__,
+        'argv': argv,
+        'cwd': os.getcwd(),
+        'env': dict(os.environ),
+        'stdin': stdin,
+    }
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(_CONNECT_TIMEOUT)
+            sock.connect(path)
+
+            sock.settimeout(_RESPONSE_TIMEOUT)
+            sock.sendall(json.dumps(request).encode('utf-8'))
+            sock.shutdown(socket.SHUT_WR)
+
+            response = json.loads(_receive(sock).decode('utf-8'))
+
+    except (socket.timeout, OSError, ValueError) as exc:
+        logger.debug('could not lint with the daemon at %s: %s', path, exc)
+        return None
+
+    if response.get('busy'):
+        logger.debug('daemon at %s is busy', path)
+        return None
+
+    if response.get('restart'):
+        logger.debug('daemon at %s is starting over', path)
+        return None
+
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+
+    return response['status']
+
+
+def serve(path=None, verbose=False):
+    """
+    Listen on the socket at ``path`` (by default :func:`socket_path`),
+    handling each request from :func:`run` in turn, until interrupted.
+
+    Requests are handled one at a time, since squabble is run in the
+    working directory of each. Runs connecting while one is being
+    handled are told that the daemon is busy straight away, so that they
+    lint by themselves rather than wait.
+
+    Raises :class:`DaemonException` if a daemon is already listening
+    there.
+    """
+    import socket
+
+    if not hasattr(socket, 'AF_UNIX'):
+        raise DaemonException('the daemon needs Unix sockets')
+
+    if verbose:
+        squabble.logger.setLevel('DEBUG')
+
+    path = path or socket_path()
+    _remove_stale_socket(socket, path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    # Only the current user may connect.
+    umask = os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(umask)
+
+    server.listen(16)
+    logger.info('listening on %s', path)
+
+    # Stopped like ^c, so that the socket is removed.
+    signal.signal(signal.SIGTERM, _interrupt)
+
+    session = Session()
+    restart = False
+
+    # Connections are accepted by another thread, which only passes them
+    # on while ``idle`` (so none is being handled).
+    pending = queue.Queue()
+    idle = threading.Semaphore()
+    stopping = threading.Event()
+
+    threading.Thread(target=_accept,
+                     args=(server, pending, idle, stopping),
+                     daemon=True).start()
+
+    try:
+        while not restart:
+            conn = pending.get()
+
+            try:
+                with conn:
+                    restart = _serve_connection(conn, session)
+            finally:
+                idle.release()
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        stopping.set()
+
+        # Wakes up the thread accepting connections.
+        try:
+            server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+        server.close()
+        os.unlink(path)
+
+    if restart:
+        logger.info('starting over')
+        os.execv(sys.executable,
+                 [sys.executable, '-m', 'squabble'] + sys.argv[1:])
+
+
+def _interrupt(_signum, _frame):
+    raise KeyboardInterrupt()
+
+
+def _remove_stale_socket(socket, path):
+    if not os.path.exists(path):
+        return
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            # Left behind by a daemon which is no longer running.
+            os.unlink(path)
+            return
+
+    raise DaemonException('a daemon is already listening on %s' % path)
+
+
+def _accept(server, pending, idle, stopping):
+    """
+    Accept connections on ``server`` until ``stopping`` is set, putting
+    them in the queue ``pending`` if the semaphore ``idle`` can be
+    acquired, or else telling them that the daemon is busy.
+    """
+    import socket
+
+    while True:
+        try:
+            conn, _address = server.accept()
+
+        except OSError as exc:
+            if stopping.is_set():
+                return
+
+            # E.g. out of file descriptors, which may not last.
+            logger.warning('could not accept connection: %s', exc)
+            time.sleep(0.1)
+            continue
+
+        if idle.acquire(blocking=False):
+            pending.put(conn)
+            continue
+
+        logger.debug('busy, turning a connection away')
+
+        with conn:
+            try:
+                conn.settimeout(_CONNECT_TIMEOUT)
+                conn.sendall(json.dumps({'busy': True}).encode('utf-8'))
+                conn.shutdown(socket.SHUT_WR)
+
+                # Otherwise the connection is reset, and the answer lost,
+                # if it's closed before the request is read.
+                _receive(conn)
+
+            except OSError:
+                pass
+
+
+def _serve_connection(conn, session):
+    """
+    Handle the request on ``conn``, returning whether the daemon has to
+    start over.
+    """
+    # So that a run which never finishes sending its request doesn't
+    # keep the daemon busy.
+    conn.settimeout(_RESPONSE_TIMEOUT)
+
+    try:
+        request = json.loads(_receive(conn).decode('utf-8'))
+    except (OSError, ValueError) as exc:
+        logger.warning('could not read request: %s', exc)
+        return False
+
+    response = handle(request, session)
+
+    try:
+        conn.sendall(json.dumps(response).encode('utf-8'))
+    except OSError as exc:
+        logger.warning('could not send response: %s', exc)
+
+    return bool(response.get('restart'))
+
+
+def _receive(sock):
+    chunks = []
+
+    for chunk in iter(lambda: sock.recv(65536), b''):
+        chunks.append(chunk)
+
+    return b''.join(chunks)
+
+
+def handle(request, session):
+    """
+    Run squabble as asked by ``request`` (see :func:`run`) with the
+    :class:`Session` ``session``, returning the output and exit status,
+    or that the daemon has to start over.
+
+    Squabble is run in the working directory and environment of the
+    request, with its output captured, and both restored afterwards.
+    """
+    if request.get('version') != squabble.__version__:
+        return {'restart': True}
+
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+
+    saved = (sys.stdin, sys.stdout, sys.stderr, os.getcwd(),
+             dict(os.environ), squabble.logger.level)
+    handlers = _redirect_logging(stderr)
+
+    try:
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+
+        sys.stdin = io.StringIO(request['stdin'] or '')
+        sys.stdout = stdout
+        sys.stderr = stderr
+
+        # As verbose as the request asks, rather than as the daemon.
+        squabble.logger.setLevel(logging.NOTSET)
+
+        try:
+            args = docopt.docopt(cli.__doc__, argv=request['argv'],
+                                 version=squabble.__version__)
+            status = cli.dispatch_args(args, session)
+
+        except Restart:
+            return {'restart': True}
+
+        except SystemExit as exc:
+            status = exc.code
+            if not isinstance(status, (int, type(None))):
+                print(status, file=stderr)
+                status = 1
+
+        except Exception:
+            import traceback
+            traceback.print_exc(file=stderr)
+            status = 1
+
+    finally:
+        sys.stdin, sys.stdout, sys.stderr, cwd, environ, level = saved
+
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(environ)
+
+        squabble.logger.setLevel(level)
+
+        for handler, stream in handlers.items():
+            handler.stream = stream
+
+    return {
+        'status': status or 0,
+        'stdout': stdout.getvalue(),
+        'stderr': stderr.getvalue(),
+    }
+
+
+def _redirect_logging(stream):
+    """
+    Point the stream handlers of the root logger at ``stream``, returning
+    a map of each handler to its previous stream.
+    """
+    previous = {}
+
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.StreamHandler):
+            previous[handler] = handler.stream
+            handler.stream = stream
+
+    return previous
+
+
+class Session(cli.Session):
+    """
+    A :class:`squabble.cli.Session` which keeps what it loads for the
+    next request, until the files it was loaded from change.
+
+    Raises :class:`Restart` if plugins which were loaded have changed,
+    or others are needed.
+    """
+    def __init__(self):
+        # (config file, presets, reporter) -> its stamp and configuration
+        self._configs = {}
+
+        # The plugin directories loaded, and their stamps.
+        self._plugins = None
+
+        # (cache directory, plugin directories) -> ResultCache
+        self._caches = {}
+
+        # (id of configuration, root) -> DirectoryConfigs
+        self._directory_configs = {}
+
+        # (id of configuration, id of cache, dedupe) -> Linter
+        self._linters = {}
+
+    def load_config(self, config_file, preset_names, reporter_name):
+        key = (config_file and os.path.abspath(config_file),
+               tuple(preset_names), reporter_name)
+        current = config.stamp(config_file) if config_file else None
+
+        if key in self._configs and self._configs[key][0] == current:
+            base_config = self._configs[key][1]
+
+        else:
+            base_config = config.load_config(
+                config_file,
+                preset_names=preset_names,
+                reporter_name=reporter_name)
+
+            # Configurations are identified by id, so everything set up
+            # for the old one has to go with it.
+            if key in self._configs:
+                self._forget()
+
+            self._configs[key] = (current, base_config)
+
+        self._load_plugins(base_config.plugins)
+
+        return base_config
+
+    def _load_plugins(self, plugin_paths):
+        plugins = [
+            (os.path.abspath(path), _plugin_stamp(path))
+            for path in plugin_paths
+        ]
+
+        if self._plugins is None:
+            rule.load_rules(plugin_paths=plugin_paths)
+            self._plugins = plugins
+
+        elif plugins != self._plugins:
+            raise Restart()
+
+    def _forget(self):
+        self._configs.clear()
+        self._directory_configs.clear()
+        self._linters.clear()
+
+    def result_cache(self, cache_dir, plugin_paths):
+        key = (os.path.abspath(cache_dir), tuple(plugin_paths))
+
+        if key not in self._caches:
+            # Absolute, since the next request may be somewhere else.
+            self._caches[key] = super().result_cache(key[0], plugin_paths)
+
+        return self._caches[key]
+
+    def directory_configs(self, base_config, root):
+        key = (id(base_config), os.path.abspath(root))
+        configs = self._directory_configs.get(key)
+
+        if configs is not None and configs.changed():
+            # The linters have the configurations of its directories.
+            self._linters.clear()
+            configs = None
+
+        if configs is None:
+            configs = super().directory_configs(base_config, key[1])
+            self._directory_configs[key] = configs
+
+        return configs
+
+    def linter(self, base_config, cache, dedupe):
+        key = (id(base_config), id(cache), dedupe)
+
+        if key not in self._linters:
+            self._linters[key] = super().linter(base_config, cache, dedupe)
+
+        return self._linters[key]
+
+
+def _plugin_stamp(path):
+    """
+    Return the stamps (see :func:`squabble.config.stamp`) of the plugin
+    directory ``path`` and the Python files in it.
+    """
+    return [config.stamp(path)] + [
+        config.stamp(file_name)
+        for file_name in sorted(glob.glob(os.path.join(path, '*.py')))
+    ]
@@ -0,0 +1,325 @@
+"""
+Find the files to lint in the directories given on the command line,
+skipping those excluded by the configuration or by ``.gitignore``
+files without descending into excluded directories or opening any file
+that won't be linted.
+
+Patterns, whether in the ``include`` and ``exclude`` configuration
+options or in ``.gitignore`` files, use the same syntax as
+``.gitignore``: a pattern without a slash (other than at the end)
+matches a file or directory with that name anywhere, while others are
+relative to the directory containing the configuration (or
+``.gitignore``) file. A trailing slash only matches directories, and
+``**`` matches any number of directories.
+"""
+
+import logging
+import os
+import os.path
+import re
+
+logger = logging.getLogger(__name__)
+
+
+class Pattern:
+    """
+    A single ``.gitignore`` style pattern, relative to the directory
+    ``base``.
+
+    >>> Pattern('*.sql', '/repo').matches('/repo/db/a.sql', is_dir=False)
+    True
+    >>> p = Pattern('db/**/legacy/', '/repo')
+    >>> p.matches('/repo/db/legacy', is_dir=True)
+    True
+    >>> p.matches('/repo/db/x/y/legacy', is_dir=False)
+    False
+    >>> Pattern('!keep.sql', '/repo').negated
+    True
+    """
+    def __init__(self, pattern, base):
+        self.pattern = pattern
+
+        self.negated = pattern.startswith('!')
+        if self.negated:
+            pattern = pattern[1:]
+
+        self.dir_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+
+        self.anchored = '/' in pattern
+
+        regex = _translate(pattern.lstrip('/'))
+        if self.anchored:
+            regex = re.escape(base.rstrip(os.sep) + '/') + regex
+
+        self._regex = re.compile(regex + r'\Z', re.DOTALL)
+
+    def matches(self, path, is_dir):
+        """
+        Return whether the absolute ``path`` (of a directory if
+        ``is_dir``) matches the pattern.
+        """
+        if self.dir_only and not is_dir:
+            return False
+
+        if self.anchored:
+            return self._regex.match(_to_posix(path)) is not None
+
+        return self._regex.match(os.path.basename(path)) is not None
+
+
+def _translate(pattern):
+    """
+    Translate a ``.gitignore`` style pattern into a regular expression.
+
+    >>> _translate('**/a/*.s?l')
+    '(?:.*/)?a/[^/]*\\\\.s[^/]l'
+    """
+    regex = []
+    i = 0
+
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex.append('(?:.*/)?')
+            i += 3
+
+        elif pattern.startswith('**', i):
+            regex.append('.*')
+            i += 2
+
+        elif pattern[i] == '*':
+            regex.append('[^/]*')
+            i += 1
+
+        elif pattern[i] == '?':
+            regex.append('[^/]')
+            i += 1
+
+        elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            chars = pattern[i + 1:end]
+
+            if chars.startswith('!'):
+                chars = '^' + chars[1:]
+
+            regex.append('[%s]' % chars.replace('\\', '\\\\'))
+            i = end + 1
+
+        elif pattern[i] == '\\' and i + 1 < len(pattern):
+            regex.append(re.escape(pattern[i + 1]))
+            i += 2
+
+        else:
+            regex.append(re.escape(pattern[i]))
+            i += 1
+
+    return ''.join(regex)
+
+
+def _to_posix(path):
+    return path if os.sep == '/' else path.replace(os.sep, '/')
+
+
+def _ignored(patterns, path, is_dir):
+    """
+    Return whether the last of ``patterns`` to match ``path`` (if any)
+    excludes it, as in ``.gitignore``.
+    """
+    for pattern in reversed(patterns):
+        if pattern.matches(path, is_dir):
+            return not pattern.negated
+
+    return False
+
+
+def read_gitignore(directory):
+    """
+    Return the patterns in the ``.gitignore`` file in ``directory``, if
+    there is one.
+    """
+    try:
+        with open(os.path.join(directory, '.gitignore'), 'r') as fp:
+            lines = fp.read().splitlines()
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+    except (OSError, UnicodeDecodeError) as exc:
+        logger.warning('could not read .gitignore in %s: %s', directory, exc)
+        return []
+
+    return [
+        Pattern(line.rstrip(' '), directory)
+        for line in lines
+        if line.strip() and not line.startswith('#')
+    ]
+
+
+def find_repository_root(path):
+    """
+    Return the closest directory containing ``path`` (or ``path``
+    itself) which has a ``.git`` directory or file, or ``None``.
+    """
+    path = os.path.abspath(path)
+
+    while True:
+        if os.path.exists(os.path.join(path, '.git')):
+            return path
+
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+
+        path = parent
+
+
+class FileFinder:
+    """
+    Finds the files to lint in a list of paths, see :meth:`find`.
+
+    Only files matching one of the ``include`` patterns are found in
+    directories. Files and directories matching the ``exclude`` patterns
+    are skipped, as are those ignored by ``.gitignore`` files (when in a
+    git repository, and ``gitignore`` is true) and, like the shell,
+    those whose names start with a dot. Patterns are relative to
+    ``root``.
+
+    Paths which don't exist are skipped, and collected in ``missing``.
+    """
+    def __init__(self, include=('*.sql',), exclude=(), root='.',
+                 gitignore=True):
+        self.root = root = os.path.abspath(root)
+
+        self.include = [Pattern(p, root) for p in include]
+        self.exclude = [Pattern(p, root) for p in exclude]
+        self.gitignore = gitignore
+
+        self.missing = []
+
+    def find(self, paths):
+        """
+        Lazily yield the files named in ``paths``, and the files to lint
+        in the directories in ``paths``. Files named directly are always
+        yielded, as is ``'-'``, for stdin.
+        """
+        for path in paths:
+            if path == '-':
+                yield path
+
+            elif os.path.isdir(path):
+                yield from self._walk(path)
+
+            elif os.path.exists(path):
+                yield path
+
+            else:
+                logger.debug('%s: no such file or directory', path)
+                self.missing.append(path)
+
+    def wanted(self, path):
+        """
+        Return whether the file ``path`` would be found in one of the
+        directories containing it, ignoring ``.gitignore`` files.
+        """
+        path = os.path.abspath(path)
+
+        if not any(p.matches(path, is_dir=False) for p in self.include):
+            return False
+
+        if _ignored(self.exclude, path, is_dir=False):
+            return False
+
+        # Anything in an excluded directory (below the root) is excluded
+        # too.
+        parent = os.path.dirname(path)
+        while parent.startswith(os.path.join(self.root, '')):
+            if _ignored(self.exclude, parent, is_dir=True):
+                return False
+
+            parent = os.path.dirname(parent)
+
+        return True
+
+    def _walk(self, top):
+        ignores = self._inherited_ignores(top)
+
+        # Real paths of the directories being walked, to avoid going
+        # around in circles through symbolic links.
+        seen = {os.path.realpath(top)}
+
+        # (directory, its absolute path, the patterns applying in it)
+        work = [(top, os.path.abspath(top), ignores)]
+
+        while work:
+            directory, abs_directory, ignores = work.pop()
+
+            if self.gitignore and ignores is not None:
+                local = read_gitignore(abs_directory)
+                if local:
+                    ignores = ignores + local
+
+            try:
+                entries = sorted(os.scandir(directory), key=lambda e: e.name)
+            except OSError as exc:
+                logger.warning('could not read %s: %s', directory, exc)
+                continue
+
+            subdirectories = []
+
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+
+                abs_path = os.path.join(abs_directory, entry.name)
+
+                if _ignored(self.exclude, abs_path, is_dir) or (
+                        ignores and _ignored(ignores, abs_path, is_dir)):
+                    continue
+
+                if is_dir:
+                    if entry.is_symlink():
+                        real_path = os.path.realpath(entry.path)
+                        if real_path in seen:
+                            continue
+
+                        seen.add(real_path)
+
+                    subdirectories.append(
+                        (entry.path, abs_path, ignores))
+
+                elif any(p.matches(abs_path, is_dir=False)
+                         for p in self.include):
+                    yield entry.path
+
+            # Popped in order of name.
+            work.extend(reversed(subdirectories))
+
+    def _inherited_ignores(self, top):
+        """
+        Return the patterns of the ``.gitignore`` files in the
+        directories above ``top``, up to the root of its repository, or
+        ``None`` if ``.gitignore`` files don't apply.
+        """
+        if not self.gitignore:
+            return None
+
+        top = os.path.abspath(top)
+
+        root = find_repository_root(top)
+        if root is None:
+            return None
+
+        ignores = []
+        directory = root
+
+        for part in os.path.relpath(top, root).split(os.sep):
+            if part in (os.curdir, ''):
+                break
+
+            ignores.extend(read_gitignore(directory))
+            directory = os.path.join(directory, part)
+
+        return ignores
@@ -1,11 +1,18 @@
 """ linting engine """
 
+import bisect
 import collections
 import enum
+import json
+import math
 
 import pglast
 
+from squabble.config import apply_file_config
 from squabble.rule import Registry
+from squabble.shapes import ShapeResults
+from squabble.splitter import split_lines, split_statements
+from squabble.util import pack, unpack
 
 _LintIssue = collections.namedtuple('_LintIssue', [
     'message',
@@ -39,6 +46,66 @@ class Severity(enum.Enum):
     CRITICAL = 'CRITICAL'
 
 
+class StatementKind(enum.Enum):
+    """
+    Broad category of a top-level SQL statement, used by rules to declare
+    which statements they can report issues for (see
+    :attr:`squabble.rules.BaseRule.STATEMENT_KINDS`).
+    """
+    DDL = 'DDL'
+    DML = 'DML'
+    QUERY = 'QUERY'
+    UTILITY = 'UTILITY'
+
+
+# Statements changing the schema whose tags don't start with ``Create``,
+# ``Alter`` or ``Drop``.
+_DDL_TAGS = frozenset([
+    'CommentStmt',
+    'CompositeTypeStmt',
+    'DefineStmt',
+    'GrantRoleStmt',
+    'GrantStmt',
+    'ImportForeignSchemaStmt',
+    'IndexStmt',
+    'RenameStmt',
+    'RuleStmt',
+    'SecLabelStmt',
+    'ViewStmt',
+])
+
+_DML_TAGS = frozenset([
+    'DeleteStmt',
+    'InsertStmt',
+    'TruncateStmt',
+    'UpdateStmt',
+])
+
+
+def statement_kind(tag):
+    """
+    Return the :class:`StatementKind` of a statement with node tag
+    ``tag``.
+
+    >>> statement_kind('AlterTableStmt')
+    <StatementKind.DDL: 'DDL'>
+    >>> statement_kind('InsertStmt')
+    <StatementKind.DML: 'DML'>
+    >>> statement_kind('VariableSetStmt')
+    <StatementKind.UTILITY: 'UTILITY'>
+    """
+    if tag == 'SelectStmt':
+        return StatementKind.QUERY
+
+    if tag in _DML_TAGS:
+        return StatementKind.DML
+
+    if tag in _DDL_TAGS or tag.startswith(('Create', 'Alter', 'Drop')):
+        return StatementKind.DDL
+
+    return StatementKind.UTILITY
+
+
 def _parse_string(text):
     """
     Use ``pglast`` to turn ``text`` into a SQL AST node.
@@ -57,6 +124,48 @@ def _parse_string(text):
     return pglast.Node(ast) if ast else pglast.node.Scalar(None)
 
 
+def _parse_statement(stmt):
+    """
+    Parse a :class:`squabble.splitter.Statement`, returning its raw
+    parse tree with the locations of every node adjusted to be relative
+    to the start of the file, as if it had been parsed all at once.
+
+    >>> from squabble.splitter import Statement
+    >>> tree = _parse_statement(Statement('SELECT a', location=10))
+    >>> tree[0]['RawStmt']['stmt_location']
+    10
+    >>> target = tree[0]['RawStmt']['stmt']['SelectStmt']['targetList'][0]
+    >>> target['ResTarget']['location']
+    17
+    """
+    tree = pglast.parse_sql(stmt.sql)
+
+    if stmt.location:
+        _shift_locations(tree, stmt.location)
+
+    return tree
+
+
+def _shift_locations(tree, offset):
+    work = [tree]
+
+    while work:
+        item = work.pop()
+
+        if isinstance(item, list):
+            work.extend(v for v in item if isinstance(v, (dict, list)))
+            continue
+
+        for fields in item.values():
+            for key, value in fields.items():
+                if isinstance(value, (dict, list)):
+                    work.append(value)
+
+                # -1 is used for unknown locations.
+                elif key in ('location', 'stmt_location') and value >= 0:
+                    fields[key] = value + offset
+
+
 def _configure_rules(rule_config):
     rules = []
 
@@ -67,6 +176,383 @@ def _configure_rules(rule_config):
     return rules
 
 
+def _statement_kinds(rules):
+    """
+    Return the set of statement kinds that at least one of ``rules``
+    applies to, or ``None`` if some rule applies to every kind.
+    """
+    kinds = set()
+
+    for rule, _config in rules:
+        if rule.STATEMENT_KINDS is None:
+            return None
+
+        kinds.update(rule.STATEMENT_KINDS)
+
+    return kinds
+
+
+# Node tags of the statements which can start with each keyword, to tell
+# which rules apply to a statement without parsing it.
+_LEADING_KEYWORD_TAGS = {
+    b'delete': ['DeleteStmt'],
+    b'insert': ['InsertStmt'],
+    b'select': ['SelectStmt'],
+    b'table': ['SelectStmt'],
+    b'truncate': ['TruncateStmt'],
+    b'update': ['UpdateStmt'],
+    b'values': ['SelectStmt'],
+    b'with': ['DeleteStmt', 'InsertStmt', 'SelectStmt', 'UpdateStmt'],
+}
+
+
+def _fingerprint(options):
+    return json.dumps(options, sort_keys=True, default=repr)
+
+
+class LintPlan:
+    """
+    A list of configured rules, along with the hooks they register when
+    enabled, which can be used to lint any number of files.
+
+    Rules which are :attr:`~squabble.rules.BaseRule.REUSABLE` are only
+    enabled once, and the hooks they register on the root context are
+    reused for every file. Other rules are enabled again for each file.
+    """
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.statement_kinds = _statement_kinds(self.rules)
+        self.statement_local = _statement_local(self.rules)
+        self.literal_kinds = _literal_kinds(self.rules)
+
+        # Hooks registered by each rule, or ``None`` for the rules which
+        # are enabled for each file.
+        self._rule_hooks = []
+
+        for rule, config in self.rules:
+            if not rule.REUSABLE:
+                self._rule_hooks.append(None)
+                continue
+
+            ctx = Context(session=None)
+            rule.enable(ctx, config)
+            self._rule_hooks.append((ctx._hooks, ctx._exit_hooks))
+
+    @classmethod
+    def combine(cls, plans):
+        """
+        Return a plan with the rules of every one of ``plans``, in
+        order, without enabling them again.
+        """
+        combined = cls([])
+
+        for plan in plans:
+            combined.rules.extend(plan.rules)
+            combined._rule_hooks.extend(plan._rule_hooks)
+
+        combined.statement_kinds = _statement_kinds(combined.rules)
+        combined.statement_local = _statement_local(combined.rules)
+        combined.literal_kinds = _literal_kinds(combined.rules)
+        return combined
+
+    def ignores_literals(self, keyword):
+        """
+        Return whether the literal values in a statement starting with
+        ``keyword`` (lowercase ``bytes``) can't affect the issues found
+        in it, see :attr:`squabble.rules.BaseRule.IGNORES_LITERALS`.
+        """
+        kinds = self.literal_kinds
+        if kinds is None:
+            return False
+
+        if not kinds:
+            return True
+
+        tags = _LEADING_KEYWORD_TAGS.get(keyword)
+        return tags is not None and \
+            not any(statement_kind(tag) in kinds for tag in tags)
+
+    def root_context(self, session):
+        """
+        Return a new root context for ``session`` with the hooks of
+        every rule, enabling those which aren't reusable.
+        """
+        ctx = Context(session)
+
+        # In the same order as if every rule was enabled on ``ctx``. The
+        # lists are copied, since more hooks may be added to the root
+        # context while a file is being linted.
+        for (rule, config), rule_hooks in zip(self.rules, self._rule_hooks):
+            if rule_hooks is None:
+                rule.enable(ctx, config)
+                continue
+
+            hooks, exit_hooks = rule_hooks
+
+            for tag, tag_hooks in hooks.items():
+                ctx._hooks.setdefault(tag, []).extend(tag_hooks)
+
+            ctx._exit_hooks.extend(exit_hooks)
+
+        return ctx
+
+
+class Linter:
+    """
+    Lints any number of files with ``config``, only setting up the rules
+    of each distinct configuration once, which makes it cheaper to lint
+    many files (or the same file repeatedly) than :func:`check_file`.
+
+    The configuration comments in each file (e.g.
+    ``-- squabble-enable:...``) are applied as usual. Rules they don't
+    change are shared with the base configuration.
+
+    If ``cache`` (a :class:`squabble.cache.ResultCache`) is given, files
+    which were linted with the same configuration before aren't linted
+    again.
+
+    With ``dedupe``, each distinct shape of statement (see
+    :mod:`squabble.shapes`) is only linted once across every file, and
+    the issues found are reused for the other statements of the same
+    shape, wherever they are. Only used when every rule is
+    :attr:`~squabble.rules.BaseRule.STATEMENT_LOCAL`.
+
+    >>> from squabble import config, rule
+    >>> rule.load_rules()
+    >>> linter = Linter(config.get_base_config()._replace(
+    ...     rules={'DisallowFloatTypes': {}}))
+    >>> [i.message.CODE for i in linter.lint('CREATE TABLE t (x real);')]
+    [1007]
+    """
+    def __init__(self, config, cache=None, dedupe=False):
+        self.config = config
+        self.cache = cache
+
+        # plan -> results of each shape of statement, see ``dedupe``
+        self._shapes = {} if dedupe else None
+
+        # (rule name, options) -> plan of that rule alone
+        self._rule_plans = {}
+
+        # tuple of (rule name, options) -> plan of all of those rules
+        self._plans = {}
+
+        # id of the rules of a configuration passed to ``lint`` -> those
+        # rules (so the id isn't reused) and their plan
+        self._config_plans = {}
+
+        self._base_plan = self.plan(config.rules)
+
+    def plan(self, rule_config):
+        """
+        Return the :class:`LintPlan` for ``rule_config``, a map of rule
+        name to options, reusing the parts already set up for other
+        configurations.
+        """
+        keys = tuple(
+            (name, _fingerprint(options))
+            for name, options in rule_config.items()
+        )
+
+        if keys not in self._plans:
+            plans = []
+
+            for key, (name, options) in zip(keys, rule_config.items()):
+                if key not in self._rule_plans:
+                    cls = Registry.get_class(name)
+                    self._rule_plans[key] = LintPlan([(cls(), options)])
+
+                plans.append(self._rule_plans[key])
+
+            self._plans[keys] = LintPlan.combine(plans)
+
+        return self._plans[keys]
+
+    def lint(self, text, file_name=None, config=None):
+        """
+        Return a list of lint issues found in ``text``, the contents of
+        a SQL file.
+
+        ``config`` is used in place of the linter's configuration for
+        this file, e.g. one from
+        :meth:`squabble.config.DirectoryConfigs.for_file`. Rules are set
+        up once for each configuration passed in.
+        """
+        base = self.config if config is None else config
+
+        file_config = apply_file_config(base, text)
+        if file_config is None:
+            return []
+
+        if self.cache is not None:
+            key = self.cache.key(text, file_config)
+
+            issues = self.cache.get(key, file_name)
+            if issues is not None:
+                return issues
+
+        plan = self._file_plan(base, file_config)
+
+        if self.cache is None and self._shapes is None:
+            return Session(plan, text, file_name).lint()
+
+        parser = None
+        if self.cache is not None:
+            # The file may have been parsed before with other rules.
+            parser = self.cache.parser(text)
+
+        if plan.statement_local:
+            results = None
+            if self.cache is not None:
+                results = self.cache.statement_results(file_name,
+                                                       file_config)
+
+            statements = split_statements(split_lines(text.encode('utf-8')))
+            issues = self._lint_statements(
+                plan, statements, file_name, parser, results)
+        else:
+            issues = Session(plan, text, file_name, parse=parser).lint()
+
+        if self.cache is not None:
+            parser.save()
+            self.cache.put(key, issues)
+
+        return issues
+
+    def lint_statements(self, text, statements, file_name=None, config=None,
+                        results=None):
+        """
+        Like :meth:`lint`, for a file whose ``statements`` have already
+        been split (e.g. by :func:`squabble.splitter.split_changed`, for
+        a file being edited). The result cache isn't used.
+
+        ``results`` is called with the configuration of the file, to get
+        the results kept for each of its statements, in the same form as
+        :meth:`squabble.cache.ResultCache.statement_results`. When every
+        rule is :attr:`~squabble.rules.BaseRule.STATEMENT_LOCAL`, only
+        the statements without any are linted.
+        """
+        base = self.config if config is None else config
+
+        file_config = apply_file_config(base, text)
+        if file_config is None:
+            return []
+
+        plan = self._file_plan(base, file_config)
+
+        if plan.statement_local and results is not None:
+            return self._lint_statements(plan, statements, file_name, None,
+                                         results(file_config))
+
+        return list(Session(plan, text, file_name).stream(statements))
+
+    def _file_plan(self, base, file_config):
+        """
+        Return the plan for ``file_config``, the configuration of a file
+        as changed by its comments from ``base``.
+        """
+        if file_config.rules is self.config.rules:
+            return self._base_plan
+
+        if file_config.rules is base.rules:
+            return self._config_plan(base.rules)
+
+        return self.plan(file_config.rules)
+
+    def _config_plan(self, rules):
+        rules_plan = self._config_plans.get(id(rules))
+
+        if rules_plan is None or rules_plan[0] is not rules:
+            rules_plan = (rules, self.plan(rules))
+            self._config_plans[id(rules)] = rules_plan
+
+        return rules_plan[1]
+
+    def _lint_statements(self, plan, statements, file_name, parser, results):
+        """
+        Lint each of ``statements`` on its own, reusing the ``results``
+        stored for the statements which haven't changed since the file
+        was last linted, or for statements of the same shape.
+        """
+        shapes = None
+        if self._shapes is not None:
+            if plan not in self._shapes:
+                self._shapes[plan] = ShapeResults(plan.ignores_literals)
+
+            shapes = self._shapes[plan]
+
+        issues = []
+        facts = [[] for _ in plan.rules]
+
+        for stmt in statements:
+            result = None
+            if results is not None:
+                result = results.get(stmt)
+
+            if result is None:
+                result = self._lint_statement(plan, stmt, file_name, parser,
+                                              shapes)
+
+                if results is not None:
+                    results.put(stmt, *result)
+
+            stmt_issues, stmt_facts = result
+            issues.extend(stmt_issues)
+
+            for rule_facts, new_facts in zip(facts, stmt_facts):
+                rule_facts.extend(new_facts)
+
+        if results is not None:
+            results.save()
+
+        issues.extend(Session(plan, '', file_name).merge(facts))
+        return issues
+
+    def _lint_statement(self, plan, stmt, file_name, parser, shapes):
+        """
+        Return ``(issues, facts)`` for ``stmt``, reusing the results of
+        a statement of the same shape if ``shapes`` is given.
+        """
+        if shapes is not None:
+            shape = shapes.shape(stmt)
+
+            result = shapes.get(shape)
+            if result is not None:
+                issues, facts = result
+                return [i._replace(file=file_name) for i in issues], facts
+
+        session = Session(plan, '', file_name, parse=parser)
+        result = (list(session.stream([stmt], merge=False)), session.facts())
+
+        if shapes is not None:
+            shapes.put(shape, *result)
+
+        return result
+
+    def lint_many(self, files):
+        """
+        Lazily lint ``files``, an iterable of ``(file_name, text)``,
+        yielding the issues found in each file in order.
+        """
+        for file_name, text in files:
+            yield from self.lint(text, file_name)
+
+
+def _statement_local(rules):
+    return all(rule.STATEMENT_LOCAL for rule, _config in rules)
+
+
+def _literal_kinds(rules):
+    """
+    Return the set of statement kinds that the rules which don't ignore
+    literal values apply to, or ``None`` if one applies to every kind.
+    """
+    return _statement_kinds([
+        (rule, config) for rule, config in rules
+        if not rule.IGNORES_LITERALS
+    ])
+
+
 def check_file(config, name, contents):
     """
     Return a list of lint issues from using ``config`` to lint
@@ -77,44 +563,172 @@ def check_file(config, name, contents):
     return s.lint()
 
 
+def check_stream(config, name, lines):
+    """
+    Like :func:`check_file`, but lazily reads the file from ``lines``,
+    an iterable of UTF-8 encoded lines (such as a file opened in binary
+    mode), yielding lint issues as each statement is linted.
+    """
+    rules = _configure_rules(config.rules)
+    s = Session(rules, lines, file_name=name)
+    return s.stream()
+
+
 class Session:
     """
     A run of the linter using a given set of rules over a single file. This
     class exists mainly to hold the list of issues returned by the enabled
     rules.
+
+    ``sql_text`` may either be a string, or an iterable of UTF-8 encoded
+    lines which is only read as the file is linted.
+
+    ``rules`` is either a list of ``(rule, config)``, which are enabled
+    for this file, or a :class:`LintPlan` of already enabled rules.
+
+    ``parse`` is called to parse each :class:`~squabble.splitter.Statement`
+    of the file, e.g. to use cached parse trees instead, see
+    :func:`_parse_statement`.
     """
-    def __init__(self, rules, sql_text, file_name):
-        self._rules = rules
+    def __init__(self, rules, sql_text, file_name, parse=None):
+        if not isinstance(rules, LintPlan):
+            rules = LintPlan(rules)
+
+        self._plan = rules
+        self._rules = rules.rules
+        self._parse = parse or _parse_statement
         self._sql = sql_text
         self._issues = []
         self._file_name = file_name
 
+        # Facts recorded by each rule, see ``Context.record``.
+        self._facts = {id(rule): [] for rule, _config in self._rules}
+
+        # Context and hook kind currently being run, used to put the
+        # reported issues back into a stable order.
+        self._event = (None, False)
+
     def report_issue(self, issue):
         i = issue._replace(file=self._file_name)
-        self._issues.append(i)
+        self._issues.append(self._event + (i,))
+
+    def record_fact(self, rule, fact):
+        # Nodes are packed, so that they don't keep the whole tree of
+        # their statement alive (through ``parent_node``) until the end
+        # of the file.
+        self._facts[id(rule)].append(pack(fact))
+
+    def facts(self):
+        """
+        Return the facts recorded so far, as a list with one list of facts
+        for each rule, in the same order as the rules given in the
+        constructor. Nodes in them are packed, see
+        :func:`squabble.util.pack`.
+        """
+        return [self._facts[id(rule)] for rule, _config in self._rules]
 
     def lint(self):
         """
         Run the linter on SQL given in constructor, returning a list of
         :class:`~LintIssue` discovered.
         """
+        return list(self.stream())
+
+    def stream(self, statements=None, merge=True):
+        """
+        Run the linter on SQL given in constructor, yielding each
+        :class:`~LintIssue` discovered as soon as the statement it was
+        found in has been linted.
+
+        Only the statement being linted is kept in memory, along with
+        whatever state the rules keep. Issues reported by the exit hooks
+        of the root context (e.g. for something that was never done
+        later in the file) come last, followed by those reported by the
+        rules' :meth:`~squabble.rules.BaseRule.merge`.
+
+        To lint only part of a file, ``statements`` may be given as an
+        iterable of :class:`~squabble.splitter.Statement` to use instead
+        of splitting the SQL given in the constructor. With ``merge=False``
+        the facts recorded by the rules are left for the caller to
+        combine with those of the rest of the file, see :meth:`merge`.
+        """
+        if statements is None:
+            statements = split_statements(self._lines())
+
+        root_ctx = self._plan.root_context(self)
+        statement_kinds = self._plan.statement_kinds
+
+        # All statements are linted by the same traversal so that rules
+        # can keep track of state across them.
+        traversal = _Traversal(root_ctx)
+        traversal.start()
+
+        # Statements are parsed one at a time, so that a syntax error
+        # only affects the statement containing it, and ``COPY ... FROM
+        # stdin`` data (which the parser can't handle) can be skipped.
+        for stmt in statements:
+            try:
+                tree = self._parse(stmt)
+
+            except pglast.parser.ParseError as exc:
+                self._event = (None, False)
+                root_ctx.report_issue(LintIssue(
+                    severity=Severity.CRITICAL,
+                    message_text=exc.args[0],
+                    location=stmt.location + exc.location
+                ))
+
+            else:
+                # Traversal works on the raw parse tree, skipping the
+                # ``pglast.Node`` wrappers for nodes without any hooks.
+                traversal.feed(tree, statement_kinds)
+
+            yield from self._take_issues()
+
+        traversal.finish()
+        yield from self._take_issues()
+
+        if merge:
+            self._merge(root_ctx)
+            yield from self._take_issues()
+
+    def merge(self, facts):
+        """
+        Return the issues reported by the rules' merge step, given
+        ``facts`` in the same form as returned by :meth:`facts`.
+
+        Used to finish linting a file which was linted in several parts,
+        by concatenating the facts of each part in file order.
+        """
+        # Only used to report issues, so no rules are enabled for it.
         root_ctx = Context(self)
 
-        for rule, config in self._rules:
-            rule.enable(root_ctx, config)
+        for (rule, _config), rule_facts in zip(self._rules, facts):
+            self._facts[id(rule)] = list(rule_facts)
+
+        self._merge(root_ctx)
+        return self._take_issues()
 
-        try:
-            ast = _parse_string(self._sql)
-            root_ctx.traverse(ast)
+    def _merge(self, root_ctx):
+        self._event = (root_ctx, True)
 
-        except pglast.parser.ParseError as exc:
-            root_ctx.report_issue(LintIssue(
-                severity=Severity.CRITICAL,
-                message_text=exc.args[0],
-                location=exc.location
-            ))
+        for rule, _config in self._rules:
+            rule.merge(root_ctx, unpack(self._facts[id(rule)]))
 
-        return self._issues
+    def _lines(self):
+        if isinstance(self._sql, str):
+            return split_lines(self._sql.encode('utf-8'))
+
+        return self._sql
+
+    def _take_issues(self):
+        # Every context created for a statement is finished with once
+        # the statement has been traversed, so its issues can be put in
+        # order without waiting for the rest of the file.
+        issues = _ordered_issues(self._issues)
+        self._issues = []
+
+        return issues
 
 
 class Context:
@@ -139,18 +753,47 @@ class Context:
     from child
     from root
     """
-    def __init__(self, session):
+    def __init__(self, session, _parent=None, _position=None):
         self._hooks = {}
         self._exit_hooks = []
         self._session = session
 
-    def traverse(self, parent_node):
+        # Where this context was created, see ``_ordered_issues``.
+        self._parent = _parent
+        self._position = _position
+
+        # Set while this context is part of a running traversal, along
+        # with the position just past the end of its subtree.
+        self._traversal = None
+        self._end = None
+
+    def traverse(self, parent_node, statement_kinds=None):
         """
-        Recursively walk down the AST starting at `parent_node`.
+        Walk down the AST starting at `parent_node`, visiting each node
+        exactly once. `parent_node` may be a ``pglast.Node`` or the raw
+        parse tree returned by ``pglast.parse_sql``.
 
         For every node, call any callback functions registered for that
-        particular node tag.
+        particular node tag, by this context or by any of the child
+        contexts which are active at that point of the tree.
+
+        If `statement_kinds` is given, top-level statements of any
+        other :class:`StatementKind` are skipped entirely.
+        """
+        _Traversal(self).run(parent_node, statement_kinds)
+
+    def _traverse_nested(self, parent_node, statement_kinds=None):
+        """
+        Reference implementation of :meth:`traverse`, which re-walks
+        the subtree of every node that has a hook. Kept around so that
+        the two can be checked against each other.
+
+        `statement_kinds` is ignored, every statement is visited.
         """
+        if not isinstance(parent_node, pglast.node.Base):
+            parent_node = pglast.Node(parent_node) if parent_node \
+                else pglast.node.Scalar(None)
+
         for node in parent_node.traverse():
             # Ignore scalar values
             if not isinstance(node, pglast.node.Node):
@@ -166,7 +809,7 @@ class Context:
                 hook(child_ctx, node)
 
             # children can set up their own hooks, so recurse
-            child_ctx.traverse(node)
+            child_ctx._traverse_nested(node)
 
         for exit_fn in self._exit_hooks:
             exit_fn(self)
@@ -189,8 +832,23 @@ class Context:
         if node_tag not in self._hooks:
             self._hooks[node_tag] = []
 
+            if self._traversal is not None:
+                self._traversal.watch(self, node_tag)
+
         self._hooks[node_tag].append(fn)
 
+    def record(self, rule, fact):
+        """
+        Record ``fact`` on behalf of ``rule``, to be passed to its
+        :meth:`~squabble.rules.BaseRule.merge` once the whole file has
+        been linted.
+
+        Facts should be picklable, with the exception of ``pglast``
+        nodes, which may be used freely. Only the subtree of each node
+        is kept, so in ``merge`` they have no ``parent_node``.
+        """
+        self._session.record_fact(rule, fact)
+
     def report_issue(self, issue):
         self._session.report_issue(issue)
 
@@ -203,3 +861,530 @@ class Context:
             # This is filled in later
             file=None,
         ))
+
+
+def _ordered_issues(reported):
+    """
+    Return the issues in ``reported``, a list of ``(context, exiting,
+    issue)``, in the order that re-walking the subtree of each node with
+    a hook would have produced.
+
+    That is, ordered by the preorder position of each node which created
+    the chain of contexts leading to the hook, with the issues from exit
+    hooks coming after everything else reported below that context.
+    Issues reported by the same hook keep their relative order.
+    """
+    # context -> (hook issues, child contexts, exit hook issues)
+    tree = {None: ([], [], [])}
+
+    for ctx, exiting, issue in reported:
+        # Link the chain of contexts leading to this one into the tree.
+        missing = []
+        while ctx not in tree:
+            missing.append(ctx)
+            ctx = ctx._parent
+
+        for child in reversed(missing):
+            tree[ctx][1].append(child)
+            tree[child] = ([], [], [])
+            ctx = child
+
+        tree[ctx][2 if exiting else 0].append(issue)
+
+    ordered = []
+    work = [None]
+
+    while work:
+        item = work.pop()
+
+        # Issues from exit hooks, queued up behind the child contexts.
+        if isinstance(item, list):
+            ordered.extend(item)
+            continue
+
+        hook_issues, children, exit_issues = tree[item]
+
+        ordered.extend(hook_issues)
+        work.append(exit_issues)
+        work.extend(sorted(children, key=lambda c: c._position, reverse=True))
+
+    return ordered
+
+
+def _raw_tree(node):
+    """
+    Return the parse tree wrapped by ``node``, which may be either a
+    ``pglast`` node or already a raw parse tree.
+
+    >>> tree = pglast.parse_sql('SELECT 1')
+    >>> _raw_tree(pglast.Node(tree)) == tree
+    True
+    """
+    if isinstance(node, pglast.node.Node):
+        return {node.node_tag: node.parse_tree}
+
+    if isinstance(node, pglast.node.List):
+        return [_raw_tree(item) for item in node]
+
+    if isinstance(node, pglast.node.Base):
+        return None
+
+    return node
+
+
+# Tags of the nodes making up literal values, see ``_is_literal``.
+_LITERAL_TAGS = frozenset([
+    'A_ArrayExpr',
+    'A_Const',
+    'BitString',
+    'Float',
+    'Integer',
+    'Null',
+    'String',
+    'TypeCast',
+    'TypeName',
+])
+
+
+def _is_literal(value):
+    """
+    Return ``True`` if ``value``, part of a raw parse tree, is made up
+    only of constants, possibly cast or in arrays, such as the rows of
+    ``INSERT ... VALUES``.
+
+    >>> values = pglast.parse_sql("VALUES (1, 'a'::text, ARRAY[2.0])")
+    >>> _is_literal(values[0]['RawStmt']['stmt']['SelectStmt']['valuesLists'])
+    True
+    >>> _is_literal(pglast.parse_sql('SELECT 1')[0])
+    False
+    """
+    work = [value]
+
+    while work:
+        item = work.pop()
+
+        if isinstance(item, list):
+            work.extend(item)
+            continue
+
+        if not isinstance(item, dict):
+            continue
+
+        for tag, fields in item.items():
+            if tag == 'TypeCast':
+                work.append(fields.get('arg'))
+            elif tag == 'A_ArrayExpr':
+                work.append(fields.get('elements'))
+            elif tag != 'A_Const':
+                return False
+
+    return True
+
+
+class _NodeIndex:
+    """
+    Every node of a raw parse tree in preorder, along with the positions
+    of the nodes having each tag. Built in a single pass over the tree.
+
+    Nodes are stored as they come out of the parser. ``pglast.Node``
+    wrappers are only created by :meth:`view`, when a hook needs one.
+
+    >>> index = _NodeIndex(pglast.parse_sql('SELECT 1; SELECT 2'))
+    >>> index.positions['SelectStmt']
+    [1, 6]
+    >>> index.ends[1]
+    5
+    >>> index.view(3)
+    {A_Const}
+    >>> index.view(3).parent_node.parent_node
+    {SelectStmt}
+
+    When ``statement_kinds`` is given, top-level statements of other
+    kinds are left out of the index.
+
+    >>> tree = pglast.parse_sql('CREATE TABLE a (); SELECT 1')
+    >>> index = _NodeIndex(tree, {StatementKind.DDL})
+    >>> 'CreateStmt' in index.positions, 'SelectStmt' in index.positions
+    (True, False)
+
+    With ``prune_literals``, subtrees made up only of literals (see
+    :func:`_is_literal`) are left out as well.
+
+    >>> index = _NodeIndex(pglast.parse_sql('SELECT 1'), prune_literals=True)
+    >>> 'A_Const' in index.positions, index.pruned
+    (False, True)
+    """
+    def __init__(self, root, statement_kinds=None, prune_literals=False):
+        self.nodes = []
+
+        # Whether any literals were left out because of ``prune_literals``.
+        self.pruned = False
+
+        # Position just past the last node in the subtree of each node.
+        self.ends = []
+
+        # Position of the closest enclosing node, or -1.
+        self.parents = []
+
+        # tag -> positions of nodes with that tag, ascending.
+        self.positions = {}
+
+        # position -> ``pglast.Node`` wrapper, see ``view``.
+        self._views = {}
+
+        # id(list) -> {id(item): index}, see ``_attribute_name``.
+        self._list_indices = {}
+
+        self._root = root
+
+        # Positions of the nodes whose subtree is being indexed.
+        enclosing = [-1]
+
+        # Contains dicts and lists still to be indexed, and the
+        # positions of nodes whose subtree has been completely indexed.
+        # Scalar values are never pushed, so ints are always positions.
+        work = [root]
+
+        while work:
+            item = work.pop()
+
+            if isinstance(item, int):
+                self.ends[item] = len(self.nodes)
+                enclosing.pop()
+
+            elif isinstance(item, list):
+                for value in reversed(item):
+                    if not isinstance(value, (dict, list)):
+                        continue
+
+                    if prune_literals and _is_literal(value):
+                        self.pruned = True
+                    else:
+                        work.append(value)
+
+            elif isinstance(item, dict):
+                # Every node is a dict with a single key, its tag.
+                for tag, fields in item.items():
+                    if tag == 'RawStmt' and enclosing[-1] == -1 and \
+                       statement_kinds is not None:
+                        stmt_tag = next(iter(fields['stmt']))
+
+                        if statement_kind(stmt_tag) not in statement_kinds:
+                            continue
+
+                    position = len(self.nodes)
+
+                    self.nodes.append(item)
+                    self.ends.append(None)
+                    self.parents.append(enclosing[-1])
+                    self.positions.setdefault(tag, []).append(position)
+
+                    enclosing.append(position)
+
+                    work.append(position)
+
+                    # Same order as ``pglast.Node.traverse``.
+                    for attr in sorted(fields, reverse=True):
+                        value = fields[attr]
+                        if not isinstance(value, (dict, list)):
+                            continue
+
+                        if prune_literals and _is_literal(value):
+                            self.pruned = True
+                        else:
+                            work.append(value)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def tag(self, position):
+        """Return the tag of the node at ``position``."""
+        return next(iter(self.nodes[position]))
+
+    def next_position(self, tag, start, end):
+        """
+        Return the position of the first node with ``tag`` in
+        ``[start, end)``, or ``None``.
+        """
+        positions = self.positions.get(tag)
+        if not positions:
+            return None
+
+        i = bisect.bisect_left(positions, start)
+        if i == len(positions) or positions[i] >= end:
+            return None
+
+        return positions[i]
+
+    def view(self, position):
+        """
+        Return a ``pglast.Node`` for the node at ``position``.
+
+        Wrappers are created on demand, along with those for every
+        enclosing node so that ``parent_node`` keeps working, and then
+        reused for the remainder of the traversal.
+        """
+        missing = []
+        while position != -1 and position not in self._views:
+            missing.append(position)
+            position = self.parents[position]
+
+        parent = self._views.get(position)
+
+        for position in reversed(missing):
+            raw = self.nodes[position]
+            name = None
+
+            if parent is not None:
+                name = self._attribute_name(parent.parse_tree, raw)
+            elif isinstance(self._root, list):
+                name = self._list_item_name(self._root, raw, None)
+
+            parent = pglast.Node(raw, parent, name)
+            self._views[position] = parent
+
+        return parent
+
+    def _attribute_name(self, fields, raw):
+        """
+        Return the name of the attribute in ``fields`` containing
+        ``raw``, in the format used by ``pglast.Node.parent_attribute``.
+        """
+        for attr, value in fields.items():
+            if value is raw:
+                return attr
+
+            if isinstance(value, list):
+                name = self._list_item_name(value, raw, attr)
+                if name is not None:
+                    return name
+
+        return None
+
+    def _list_item_name(self, items, raw, name):
+        # Indices are cached per list, so finding each of the items of a
+        # long list stays linear.
+        indices = self._list_indices.get(id(items))
+        if indices is None:
+            indices = {id(v): i for i, v in enumerate(items)}
+            self._list_indices[id(items)] = indices
+
+        if id(raw) in indices:
+            return (name, indices[id(raw)])
+
+        # Lists of lists, e.g. ``VALUES (...), (...)``
+        for i, value in enumerate(items):
+            if isinstance(value, list):
+                found = self._list_item_name(value, raw, (name, i))
+                if found is not None:
+                    return found
+
+        return None
+
+
+class _Traversal:
+    """
+    Single pass over an AST, keeping a stack of the child contexts
+    created by hooks.
+
+    A child context is only active for the subtree of the node it was
+    created for, so it is entered along with that node and left
+    (running its exit hooks) once the whole subtree has been visited.
+
+    Rather than visiting every node, the traversal jumps straight to
+    the next node in the :class:`_NodeIndex` having a tag that one of
+    the active contexts has hooks for. No recursion is involved, so
+    arbitrarily deep trees can be linted, and the cost of finding the
+    next node doesn't grow with the number of active contexts.
+
+    A file can be fed in one statement at a time (see :meth:`feed`),
+    with the root context staying active until :meth:`finish`.
+    """
+    def __init__(self, root_ctx):
+        self._root = root_ctx
+        self._session = root_ctx._session
+
+        # Contexts that have been entered, innermost last.
+        self._active = []
+
+        # tag -> active contexts with hooks for it, outermost first.
+        self._watched = {}
+
+        # Contexts can be used on their own, without a session.
+        self._track_events = isinstance(self._session, Session)
+
+        # Set when a hook is registered for a tag which may have been
+        # pruned from the index, see ``_unprune``.
+        self._literals_watched = False
+
+    def run(self, parent_node, statement_kinds=None):
+        self.start()
+        self.feed(_raw_tree(parent_node), statement_kinds)
+        self.finish()
+
+    def start(self):
+        """Enter the root context, before any tree is fed in."""
+        self._enter(self._root, math.inf)
+
+    def finish(self):
+        """Leave every context, running their exit hooks."""
+        self._leave_before(math.inf)
+
+    def feed(self, root, statement_kinds=None):
+        """
+        Traverse the raw parse tree ``root``, which may be just one part
+        of a file. Child contexts created for its nodes are left before
+        returning, but the root context stays active for the next tree.
+        """
+        self._literals_watched = False
+
+        # Nothing looks at literals unless it registers a hook for one
+        # of their tags, so they can be left out of the index.
+        prune = not any(self._watched.get(tag) for tag in _LITERAL_TAGS)
+        index = _NodeIndex(root, statement_kinds, prune_literals=prune)
+
+        position = 0
+        while True:
+            position = self._next_position(index, position)
+            if position is None:
+                break
+
+            self._leave_before(position)
+            self._visit(index, position)
+
+            if self._literals_watched and index.pruned:
+                index, position = self._unprune(
+                    index, position, _NodeIndex(root, statement_kinds))
+
+            position += 1
+
+        self._leave_before(len(index))
+
+    def watch(self, ctx, tag):
+        """Start calling the hooks ``ctx`` registers for ``tag``."""
+        watching = self._watched.setdefault(tag, [])
+        watching.append(ctx)
+
+        # A hook registered late on an outer context must still come
+        # before those of the contexts nested in it.
+        if ctx is not self._active[-1]:
+            depth = {id(active): i for i, active in enumerate(self._active)}
+            watching.sort(key=lambda active: depth[id(active)])
+
+        if tag in _LITERAL_TAGS:
+            self._literals_watched = True
+
+    def _unprune(self, pruned, position, full):
+        """
+        Switch over from the ``pruned`` index to ``full``, after a child
+        context registered a hook for a tag that could be inside one of
+        the literals left out, returning ``full`` and the new position
+        of the node at ``position``.
+
+        Contexts keep the position they were created at, since only
+        their relative order matters and every node keeps its place
+        relative to the others.
+        """
+        moved = {id(node): i for i, node in enumerate(full.nodes)}
+
+        # The root context is active for every tree fed in.
+        for ctx in self._active[1:]:
+            created_at = moved[id(pruned.nodes[ctx._position])]
+            ctx._end = full.ends[created_at]
+
+        return full, moved[id(pruned.nodes[position])]
+
+    def _next_position(self, index, start):
+        """
+        Return the position of the next node which has hooks in an
+        active context, or ``None`` if there isn't one.
+        """
+        # Finished contexts would otherwise still be considered.
+        self._leave_before(start)
+
+        found = None
+
+        for tag, watching in self._watched.items():
+            if not watching:
+                continue
+
+            # The outermost context spans the widest range.
+            end = watching[0]._end if found is None else \
+                min(found, watching[0]._end)
+
+            position = index.next_position(tag, start, end)
+            if position is not None:
+                found = position
+
+        return found
+
+    def _visit(self, index, position):
+        """Fire the hooks registered for the node at ``position``."""
+        node = index.view(position)
+        tag = node.node_tag
+
+        entered = []
+
+        # Innermost contexts fire first, matching the nested ordering,
+        # and so their child contexts must also be left first.
+        for ctx in self._watched[tag][::-1]:
+            created = []
+
+            # The child context created by the hooks also sees ``node``
+            # itself, and may create a child context of its own.
+            while ctx is not None:
+                ctx = self._fire(ctx, tag, node, position)
+                if ctx is not None:
+                    created.append(ctx)
+
+            entered[:0] = created
+
+        for ctx in entered:
+            self._enter(ctx, index.ends[position])
+
+    def _fire(self, ctx, tag, node, position):
+        """
+        Call the hooks ``ctx`` has for ``tag``, returning the child
+        context passed to them if it still has anything to do.
+        """
+        hooks = ctx._hooks.get(tag)
+        if not hooks:
+            return None
+
+        child_ctx = Context(self._session, _parent=ctx, _position=position)
+
+        self._set_event(child_ctx, False)
+        for hook in hooks:
+            hook(child_ctx, node)
+
+        if child_ctx._hooks or child_ctx._exit_hooks:
+            return child_ctx
+
+        return None
+
+    def _enter(self, ctx, end):
+        ctx._traversal = self
+        ctx._end = end
+
+        self._active.append(ctx)
+        for tag in ctx._hooks:
+            self.watch(ctx, tag)
+
+    def _leave_before(self, position):
+        """Leave every context whose subtree ends before ``position``."""
+        while self._active and self._active[-1]._end <= position:
+            self._leave(self._active.pop())
+
+    def _leave(self, ctx):
+        ctx._traversal = None
+        for tag in ctx._hooks:
+            # Contexts are left in the reverse order they were entered.
+            self._watched[tag].pop()
+
+        self._set_event(ctx, True)
+        for exit_fn in ctx._exit_hooks:
+            exit_fn(ctx)
+
+    def _set_event(self, ctx, exiting):
+        if self._track_events:
+            self._session._event = (ctx, exiting)
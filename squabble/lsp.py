@@ -0,0 +1,713 @@
+"""
+A `Language Server Protocol`_ server, run with ``squabble lsp``, so that
+editors can lint SQL files as they're edited, in a process which stays
+around for as long as the editor does.
+
+Documents are synced incrementally, and linted once they haven't changed
+for :data:`DEBOUNCE` seconds. Only the statements touched by the edits
+since the last lint are split, parsed and linted again (see
+:func:`squabble.splitter.split_changed`), and the issues found in the
+others are moved to wherever their statement is now. That's only
+possible when every rule is :attr:`~squabble.rules.BaseRule.STATEMENT_LOCAL`,
+otherwise the whole document is linted again.
+
+A lint which becomes stale, since the document changed again while it
+was running, is abandoned between statements, keeping the results of
+the statements it got through. Requests the editor cancels before
+they're handled are answered as such.
+
+The configuration is found like ``squabble`` does, from the root of the
+workspace, and loaded again whenever it changes.
+
+.. _Language Server Protocol:
+   https://microsoft.github.io/language-server-protocol/
+"""
+
+import bisect
+import json
+import logging
+import os
+import os.path
+import queue
+import re
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+import squabble
+from squabble import SquabbleException, cli, config, daemon, reporter
+from squabble.cache import MemoryStatementResults
+from squabble.lint import Severity
+from squabble.splitter import split_changed
+
+logger = logging.getLogger(__name__)
+
+# Seconds a document has to stay unchanged before it's linted.
+DEBOUNCE = 0.3
+
+# JSON-RPC error codes.
+_INVALID_REQUEST = -32600
+_METHOD_NOT_FOUND = -32601
+_INTERNAL_ERROR = -32603
+_SERVER_NOT_INITIALIZED = -32002
+_REQUEST_CANCELLED = -32800
+
+# ``TextDocumentSyncKind.Incremental``
+_INCREMENTAL = 2
+
+# ``MessageType.Error``
+_MESSAGE_ERROR = 1
+
+# ``DiagnosticSeverity`` of each ``Severity``.
+_SEVERITIES = {
+    Severity.CRITICAL: 1,
+    Severity.HIGH: 1,
+    Severity.MEDIUM: 2,
+    Severity.LOW: 3,
+}
+
+_LINE = re.compile(r'[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+\Z')
+
+# Characters taking up two UTF-16 code units, which LSP positions count.
+_ASTRAL = re.compile('[\U00010000-\U0010ffff]')
+
+# The token a diagnostic is shown under.
+_TOKEN = re.compile(r'\w+|\S')
+
+
+class ProtocolException(SquabbleException):
+    """Raised when a message from the editor can't be read."""
+
+
+class Cancelled(Exception):
+    """Raised when a lint is abandoned, since the document changed."""
+
+
+def serve(args, input=None, output=None):
+    """
+    Handle the messages sent by the editor on ``input`` (by default
+    stdin), sending responses to ``output`` (by default stdout), until it
+    asks the server to exit. Returns the exit status.
+
+    ``args`` are the command line arguments, as parsed by ``docopt``.
+    """
+    if args['--verbose']:
+        squabble.logger.setLevel('DEBUG')
+
+    if input is None:
+        input = sys.stdin.buffer
+
+    if output is None:
+        output = sys.stdout.buffer
+
+        # Nothing else may write to the stream messages are sent on.
+        sys.stdout = sys.stderr
+
+    config_file = args['--config']
+    if config_file:
+        # The server moves to the root of the workspace once it's known.
+        config_file = os.path.abspath(config_file)
+
+    presets = args['--preset'].split(',') if args['--preset'] else []
+
+    server = Server(input, output, config_file, presets)
+    return server.serve()
+
+
+def read_message(stream):
+    """
+    Return the next message on ``stream``, or ``None`` if there aren't
+    any more.
+
+    >>> import io
+    >>> read_message(io.BytesIO(b'Content-Length: 2\\r\\n\\r\\n{}'))
+    {}
+    """
+    length = None
+
+    while True:
+        line = stream.readline()
+        if not line:
+            return None
+
+        line = line.strip()
+        if not line:
+            break
+
+        name, _, value = line.decode('ascii').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+
+    if length is None:
+        raise ProtocolException('message without a Content-Length')
+
+    body = stream.read(length)
+    if len(body) < length:
+        return None
+
+    try:
+        return json.loads(body.decode('utf-8'))
+    except ValueError as exc:
+        raise ProtocolException('invalid message: %s' % exc)
+
+
+def write_message(stream, message):
+    """Send ``message`` on ``stream``."""
+    body = json.dumps(message).encode('utf-8')
+
+    stream.write(b'Content-Length: %d\r\n\r\n' % len(body) + body)
+    stream.flush()
+
+
+class Server:
+    """
+    Handles the messages sent by the editor, one at a time, linting the
+    documents it opens.
+
+    Messages are read by another thread as soon as they arrive, which
+    keeps count of the changes made to each document, so that a running
+    lint knows when it's stale, and of the requests which were cancelled.
+
+    ``config_file`` is the configuration to use, rather than the one found
+    in the workspace, with the presets ``presets`` as a base.
+    """
+    def __init__(self, input, output, config_file=None, presets=(),
+                 debounce=DEBOUNCE):
+        self._input = input
+        self._output = output
+        self._config_file = config_file
+        self._presets = list(presets)
+        self._debounce = debounce
+
+        self._messages = queue.Queue()
+
+        # uri -> number of changes read, updated by the reader thread
+        self._changes = {}
+
+        # Ids of the requests which were cancelled.
+        self._cancelled = set()
+
+        # uri -> Document
+        self._documents = {}
+
+        # uri -> time at which to lint it
+        self._due = {}
+
+        self._session = daemon.Session()
+        self._initialized = False
+        self._shut_down = False
+
+        self._handlers = {
+            'initialize': self.initialize,
+            'initialized': self.initialized,
+            'shutdown': self.shutdown,
+            'textDocument/didOpen': self.did_open,
+            'textDocument/didChange': self.did_change,
+            'textDocument/didSave': self.did_save,
+            'textDocument/didClose': self.did_close,
+        }
+
+    def serve(self):
+        """
+        Handle every message until the editor asks to exit, linting the
+        documents which are due in between. Returns the exit status.
+        """
+        reader = threading.Thread(target=self._read, daemon=True)
+        reader.start()
+
+        while True:
+            timeout = None
+            if self._due:
+                timeout = min(self._due.values()) - time.monotonic()
+
+                if timeout <= 0:
+                    self._lint_due()
+                    continue
+
+            try:
+                message = self._messages.get(timeout=timeout)
+            except queue.Empty:
+                continue
+
+            if message is None:
+                break
+
+            if message.get('method') == 'exit':
+                break
+
+            self._handle(message)
+
+        reader.join()
+
+        # The editor should have asked the server to shut down first.
+        return 0 if self._shut_down else 1
+
+    def _read(self):
+        try:
+            while True:
+                message = read_message(self._input)
+                if message is None:
+                    break
+
+                self._note(message)
+                self._messages.put(message)
+
+                # Nothing is read after this, and the thread mustn't be
+                # left reading when the interpreter exits.
+                if message.get('method') == 'exit':
+                    return
+
+        except (OSError, ProtocolException) as exc:
+            logger.error('could not read message: %s', exc)
+
+        finally:
+            self._messages.put(None)
+
+    def _note(self, message):
+        """
+        Keep track of what ``message`` changes, as soon as it's read.
+        """
+        method = message.get('method')
+        params = message.get('params') or {}
+
+        if method == '$/cancelRequest':
+            self._cancelled.add(params.get('id'))
+
+        elif method == 'textDocument/didChange':
+            uri = params['textDocument']['uri']
+            self._changes[uri] = self._changes.get(uri, 0) + 1
+
+    def _handle(self, message):
+        method = message.get('method')
+
+        # Responses to requests from the server, which doesn't make any.
+        if method is None:
+            return
+
+        handler = self._handlers.get(method)
+        params = message.get('params') or {}
+
+        if 'id' not in message:
+            if handler is not None and (
+                    self._initialized or method == 'initialized'):
+                try:
+                    handler(params)
+                except Exception:
+                    logger.exception('could not handle %s', method)
+
+            return
+
+        request_id = message['id']
+
+        if request_id in self._cancelled:
+            self._cancelled.discard(request_id)
+            self._error(request_id, _REQUEST_CANCELLED, 'cancelled')
+
+        elif handler is None:
+            self._error(request_id, _METHOD_NOT_FOUND,
+                        'unknown method: %s' % method)
+
+        elif not self._initialized and method != 'initialize':
+            self._error(request_id, _SERVER_NOT_INITIALIZED,
+                        'not initialized')
+
+        elif self._shut_down:
+            self._error(request_id, _INVALID_REQUEST, 'shut down')
+
+        else:
+            try:
+                result = handler(params)
+            except Exception as exc:
+                logger.exception('could not handle %s', method)
+                self._error(request_id, _INTERNAL_ERROR, str(exc))
+            else:
+                self._send({'id': request_id, 'result': result})
+
+    def _send(self, message):
+        message['jsonrpc'] = '2.0'
+        write_message(self._output, message)
+
+    def _error(self, request_id, code, text):
+        self._send({'id': request_id,
+                    'error': {'code': code, 'message': text}})
+
+    def _notify(self, method, params):
+        self._send({'method': method, 'params': params})
+
+    def initialize(self, params):
+        root = params.get('rootUri')
+        root = _path(root) if root else params.get('rootPath')
+
+        # Configuration is found from the root of the workspace.
+        if root:
+            os.chdir(root)
+
+        self._initialized = True
+
+        return {
+            'capabilities': {
+                'textDocumentSync': {
+                    'openClose': True,
+                    'change': _INCREMENTAL,
+                    'save': {'includeText': False},
+                },
+            },
+            'serverInfo': {
+                'name': 'squabble',
+                'version': squabble.__version__,
+            },
+        }
+
+    def initialized(self, params):
+        pass
+
+    def shutdown(self, params):
+        self._shut_down = True
+
+    def did_open(self, params):
+        item = params['textDocument']
+        uri = item['uri']
+
+        self._documents[uri] = Document(uri, item['text'], item.get('version'))
+        self._due[uri] = time.monotonic()
+
+    def did_change(self, params):
+        uri = params['textDocument']['uri']
+
+        document = self._documents.get(uri)
+        if document is None:
+            return
+
+        document.change(params['contentChanges'],
+                        params['textDocument'].get('version'))
+
+        # Linted once the editor has stopped changing it for a moment.
+        self._due[uri] = time.monotonic() + self._debounce
+
+    def did_save(self, params):
+        uri = params['textDocument']['uri']
+
+        if uri in self._documents:
+            self._due[uri] = time.monotonic()
+
+    def did_close(self, params):
+        uri = params['textDocument']['uri']
+
+        self._documents.pop(uri, None)
+        self._due.pop(uri, None)
+
+        self._notify('textDocument/publishDiagnostics',
+                     {'uri': uri, 'diagnostics': []})
+
+    def _lint_due(self):
+        now = time.monotonic()
+
+        for uri, due in list(self._due.items()):
+            if due <= now:
+                del self._due[uri]
+                self._lint(uri)
+
+    def _lint(self, uri):
+        """Lint the document ``uri``, and send the issues found."""
+        document = self._documents[uri]
+
+        # Changes read but not handled yet make the lint stale from the
+        # start, and another is due once they're handled.
+        changes = self._changes.get(uri, 0)
+
+        def cancelled():
+            return self._changes.get(uri, 0) != changes
+
+        try:
+            linter, file_config = self._configure(document.path)
+            issues = document.lint(linter, file_config, cancelled)
+
+        except Cancelled:
+            logger.debug('abandoned stale lint of %s', uri)
+            return
+
+        except daemon.Restart:
+            self._show_error('squabble: plugins have changed, restart the '
+                             'language server to load them')
+            return
+
+        except SquabbleException as exc:
+            self._show_error('squabble: %s' % exc)
+            return
+
+        except Exception as exc:
+            logger.exception('could not lint %s', uri)
+            self._show_error('squabble: could not lint: %s' % exc)
+            return
+
+        self._notify('textDocument/publishDiagnostics', {
+            'uri': uri,
+            'version': document.version,
+            'diagnostics': document.diagnostics(issues),
+        })
+
+    def _configure(self, path):
+        """
+        Return the linter and configuration for the file at ``path``,
+        loading the configuration again if it changed.
+        """
+        config_file = self._config_file or config.discover_config_location()
+
+        base_config = self._session.load_config(
+            config_file, self._presets, None)
+
+        file_config = base_config
+        if path is not None:
+            configs = self._session.directory_configs(
+                base_config, cli._config_root(config_file))
+            file_config = configs.for_file(path)
+
+        linter = self._session.linter(base_config, None, False)
+
+        return linter, file_config
+
+    def _show_error(self, text):
+        self._notify('window/showMessage',
+                     {'type': _MESSAGE_ERROR, 'message': text})
+
+
+class Document:
+    """
+    A file open in the editor, along with what's kept from the last time
+    it was linted.
+    """
+    def __init__(self, uri, text, version=None):
+        self.uri = uri
+        self.path = _path(uri)
+        self.version = version
+
+        # Each line of the document, with its line break.
+        self.lines = _split_lines(text)
+
+        # The contents and statements as of the last lint.
+        self._contents = b''
+        self._statements = []
+
+        self._results = MemoryStatementResults()
+
+    @property
+    def text(self):
+        return ''.join(self.lines)
+
+    def change(self, changes, version=None):
+        """
+        Apply ``changes``, a list of ``TextDocumentContentChangeEvent``,
+        in order.
+
+        >>> document = Document('file:///a.sql', 'SELECT 1;\\nSELECT 2;\\n')
+        >>> document.change([{
+        ...     'range': {'start': {'line': 0, 'character': 7},
+        ...               'end': {'line': 1, 'character': 7}},
+        ...     'text': '3, ',
+        ... }])
+        >>> document.text
+        'SELECT 3, 2;\\n'
+        """
+        for change in changes:
+            if 'range' in change:
+                self._replace(change['range'], change['text'])
+            else:
+                self.lines = _split_lines(change['text'])
+
+        self.version = version
+
+    def _replace(self, text_range, text):
+        lines = self.lines
+        start, end = text_range['start'], text_range['end']
+
+        first = start['line']
+        first_line = lines[first] if first < len(lines) else ''
+
+        last = end['line']
+        last_line = lines[last] if last < len(lines) else ''
+
+        replaced = first_line[:_index(first_line, start['character'])] + \
+            text + last_line[_index(last_line, end['character']):]
+
+        stop = min(last + 1, len(lines))
+
+        # A carriage return and a line feed coming together again are
+        # a single line break.
+        if replaced.endswith('\r') and stop < len(lines) and \
+           lines[stop].startswith('\n'):
+            replaced += lines[stop]
+            stop += 1
+
+        if first > 0 and replaced.startswith('\n') and \
+           lines[first - 1].endswith('\r'):
+            first -= 1
+            replaced = lines[first] + replaced
+
+        lines[first:stop] = _split_lines(replaced)
+
+    def lint(self, linter, config=None, cancelled=None):
+        """
+        Return the issues ``linter`` finds in the document, only linting
+        the statements which changed since it was last linted, if it can.
+
+        Raises :class:`Cancelled` if ``cancelled()`` (checked before each
+        statement) returns true.
+        """
+        text = self.text
+        contents = text.encode('utf-8')
+
+        statements = split_changed(self._statements, self._contents, contents)
+        self._contents, self._statements = contents, statements
+
+        def check(statements):
+            for stmt in statements:
+                if cancelled is not None and cancelled():
+                    raise Cancelled()
+
+                yield stmt
+
+        try:
+            return linter.lint_statements(
+                text, check(statements), self.path, config,
+                self._results.for_config)
+
+        except Cancelled:
+            self._results.abandon()
+            raise
+
+    def diagnostics(self, issues):
+        """
+        Return a ``Diagnostic`` for each of ``issues``, found in the
+        document as it is now.
+
+        >>> from squabble.lint import LintIssue
+        >>> text = 'SELECT 1;\\nSELECT "\\U0001f600", xy;'
+        >>> [diagnostic] = Document('file:///a.sql', text).diagnostics([
+        ...     LintIssue(message_text='oops', severity=Severity.HIGH,
+        ...               location=25)])
+        >>> diagnostic['range']['start']
+        {'line': 1, 'character': 13}
+        >>> diagnostic['range']['end']
+        {'line': 1, 'character': 15}
+        """
+        diagnostics = []
+
+        # Where each line starts, in bytes.
+        starts = None
+
+        for issue in issues:
+            location = reporter._location_for_issue(issue)
+
+            if location is None:
+                start = end = {'line': 0, 'character': 0}
+
+            else:
+                if starts is None:
+                    starts = _line_starts(self.lines)
+
+                start, end = self._token_range(starts, location)
+
+            diagnostic = {
+                'range': {'start': start, 'end': end},
+                'severity': _SEVERITIES.get(issue.severity, 2),
+                'source': 'squabble',
+                'message': reporter._format_message(issue),
+            }
+
+            if issue.message is not None:
+                diagnostic['code'] = issue.message.CODE
+
+            diagnostics.append(diagnostic)
+
+        return diagnostics
+
+    def _token_range(self, starts, location):
+        """
+        Return the start and end positions of the token at ``location``,
+        in bytes.
+        """
+        line = max(0, bisect.bisect_right(starts, location) - 1)
+        if line >= len(self.lines):
+            return ({'line': line, 'character': 0},) * 2
+
+        text = self.lines[line]
+        encoded = text.encode('utf-8')
+
+        index = len(encoded[:location - starts[line]].decode(
+            'utf-8', 'replace'))
+
+        match = _TOKEN.match(text, index)
+        end = match.end() if match else index
+
+        return (
+            {'line': line, 'character': _units(text[:index])},
+            {'line': line, 'character': _units(text[:end])},
+        )
+
+
+def _split_lines(text):
+    """
+    Split ``text`` into lines like LSP does, keeping their line breaks.
+
+    >>> _split_lines('a\\r\\nb\\rc\\n\\nd')
+    ['a\\r\\n', 'b\\r', 'c\\n', '\\n', 'd']
+    """
+    return _LINE.findall(text)
+
+
+def _line_starts(lines):
+    starts = [0]
+
+    for line in lines:
+        starts.append(starts[-1] + len(line.encode('utf-8')))
+
+    return starts
+
+
+def _index(line, character):
+    """
+    Return the index in ``line`` of the column ``character``, counted in
+    UTF-16 code units, as positions are.
+
+    >>> _index('\\U0001f600 x\\n', 3)
+    2
+    >>> _index('ab\\n', 10)
+    2
+    """
+    text = line.rstrip('\r\n')
+
+    if not _ASTRAL.search(text, 0, character):
+        return min(character, len(text))
+
+    units = 0
+    for index, char in enumerate(text):
+        if units >= character:
+            return index
+
+        units += 2 if char >= '\U00010000' else 1
+
+    return len(text)
+
+
+def _units(text):
+    """Return the length of ``text`` in UTF-16 code units."""
+    return len(text) + len(_ASTRAL.findall(text))
+
+
+def _path(uri):
+    """
+    Return the path of the file at ``uri``, or ``None`` if it's not a
+    file.
+
+    >>> _path('file:///db/a%20b.sql')
+    '/db/a b.sql'
+    >>> _path('untitled:Untitled-1') is None
+    True
+    """
+    parsed = urllib.parse.urlparse(uri)
+    if parsed.scheme != 'file':
+        return None
+
+    return urllib.request.url2pathname(parsed.path)
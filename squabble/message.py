@@ -1,11 +1,15 @@
-import inspect
+import importlib
 import logging
+import re
 
 from squabble import SquabbleException, PEP487Object
+from squabble.rule import manifest
 
 
 logger = logging.getLogger(__name__)
 
+_RST_DIRECTIVE = re.compile(r'^\.\. [\w-]+:: \w+$\n', flags=re.MULTILINE)
+
 
 class DuplicateMessageCodeException(SquabbleException):
     def __init__(self, dupe):
@@ -15,6 +19,19 @@ class DuplicateMessageCodeException(SquabbleException):
         super().__init__(message)
 
 
+def strip_rst_directives(string):
+    """
+    Strip reStructuredText directives out of a block of text.
+
+    Lines containing a directive will be stripped out entirely
+
+    >>> strip_rst_directives('hello\\n.. code-block:: foo\\nworld')
+    'hello\\nworld'
+    """
+
+    return re.sub(_RST_DIRECTIVE, '', string)
+
+
 class Registry(PEP487Object):
     """
     Singleton which maps message code values to classes.
@@ -62,7 +79,15 @@ class Registry(PEP487Object):
         """
         Return the :class:`squabble.message.Message` class identified by
         ``code``, raising a :class:`KeyError` if it doesn't exist.
+
+        Messages of built in rules are registered when the rule is
+        imported, which is done here if it hasn't been already.
         """
+        if code not in cls._MAP:
+            module = manifest()['messages'].get(str(code))
+            if module is not None:
+                importlib.import_module(module)
+
         return cls._MAP[code]
 
     @classmethod
@@ -108,6 +133,11 @@ class Message(PEP487Object):
         super().__init_subclass__(**kwargs)
         Registry.register(cls)
 
+    def __reduce__(self):
+        # Messages are usually defined inside of their rule class, so
+        # look them up by code rather than by name when unpickling.
+        return (_from_code, (self.CODE, self.kwargs))
+
     def format(self):
         return self.TEMPLATE.format(**self.kwargs)
 
@@ -130,6 +160,9 @@ class Message(PEP487Object):
         if not cls.__doc__:
             return None
 
+        # Imported here, since it's slow to import and rarely needed.
+        import inspect
+
         # Remove the leading indentation on the docstring
         return inspect.cleandoc(cls.__doc__)
 
@@ -158,3 +191,7 @@ class Message(PEP487Object):
             'message_params': self.kwargs,
             'message_code': self.CODE
         }
+
+
+def _from_code(code, kwargs):
+    return Registry.by_code(code)(**kwargs)
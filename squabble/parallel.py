@@ -0,0 +1,221 @@
+"""
+Lint using several processes, either many files at once
+(:func:`check_files`) or a single large file (:func:`check_stream`).
+
+A large file is split into shards of consecutive statements, which are
+linted independently by a pool of worker processes. Rules which need to
+know about the rest of the file record facts instead of keeping state
+(see :meth:`squabble.rules.BaseRule.merge`), and the facts of every
+shard are combined once the whole file has been linted.
+"""
+
+import collections
+import itertools
+import multiprocessing
+
+from squabble import lint, rule
+from squabble.splitter import split_statements
+from squabble.util import pack, unpack
+
+# Roughly how much SQL (in characters) to send to a worker at once.
+_SHARD_SIZE = 1 << 20
+
+# Number of files to send to a worker at once.
+_CHUNK_SIZE = 16
+
+# Linter for the configuration given to each worker when it starts.
+_linter = None
+
+# Configuration of each directory, see ``check_files``.
+_configs = None
+
+
+def check_files(base_config, files, jobs, chunk_size=_CHUNK_SIZE,
+                cache=None, dedupe=False, configs=None):
+    """
+    Lint ``files``, an iterable of ``(file_name, contents)``, using
+    ``jobs`` worker processes, yielding ``(file_name, issues)`` for each
+    file in the same order as ``files``.
+
+    ``contents`` may be ``None``, in which case the worker reads the file
+    itself. Each file is linted with ``base_config`` combined with its
+    own configuration, as with :func:`squabble.config.apply_file_config`.
+    Files are sent to the workers ``chunk_size`` at a time.
+
+    ``cache`` and ``dedupe`` are used by the workers as by
+    :class:`squabble.lint.Linter`, each worker linting the statements of
+    each shape once.
+
+    If ``configs`` (a :class:`squabble.config.DirectoryConfigs` for
+    ``base_config``) is given, each file is linted with the configuration
+    of its directory instead.
+    """
+    # Configuration errors would otherwise be raised by every worker.
+    lint.Linter(base_config)
+
+    with _pool(jobs, base_config, cache, dedupe, configs) as pool:
+        results = pool.imap(_check_file, files, chunk_size)
+
+        for file_name, issues in results:
+            yield file_name, unpack(issues)
+
+
+def check_stream(config, name, lines, jobs, shard_size=_SHARD_SIZE,
+                 pool=None):
+    """
+    Like :func:`squabble.lint.check_stream`, but lint shards of roughly
+    ``shard_size`` characters of the file in parallel, using ``jobs``
+    worker processes.
+
+    Issues are yielded in the same order as when linting the file in a
+    single process. Only a few shards per worker are read ahead of the
+    shard whose issues are being yielded, so memory use doesn't depend
+    on the size of the file.
+
+    The workers of ``pool`` (a :class:`StreamPool`) are used if given,
+    so that several files can be linted without starting new ones for
+    each. A file which fits in a single shard is linted in this process,
+    as is the whole file unless every rule is
+    :attr:`~squabble.rules.BaseRule.STATEMENT_LOCAL`, since other rules
+    may keep state from one statement to the next.
+    """
+    if jobs <= 1:
+        yield from lint.check_stream(config, name, lines)
+        return
+
+    # Also finds any configuration errors before the workers do.
+    plan = lint.Linter(config).plan(config.rules)
+    session = lint.Session(plan, '', name)
+
+    if not plan.statement_local:
+        yield from session.stream(split_statements(lines))
+        return
+
+    shards = _shards(split_statements(lines), shard_size)
+
+    first = next(shards, [])
+    second = next(shards, None)
+
+    if second is None:
+        yield from session.stream(first)
+        return
+
+    own_pool = pool is None
+    if own_pool:
+        pool = StreamPool(jobs, config)
+
+    facts = [[] for _ in plan.rules]
+
+    try:
+        pending = collections.deque()
+
+        for shard in itertools.chain([first, second], shards):
+            pending.append(pool.apply_async(
+                _lint_shard, (name, config.rules, shard)))
+
+            if len(pending) >= pool.jobs * 2:
+                yield from _take_shard(pending.popleft(), facts)
+
+        while pending:
+            yield from _take_shard(pending.popleft(), facts)
+
+    finally:
+        if own_pool:
+            pool.close()
+
+    yield from session.merge(facts)
+
+
+class StreamPool:
+    """
+    Worker processes for :func:`check_stream`, which can be shared by
+    every file linted with a configuration based on ``config`` (e.g. one
+    for each file, with its own rules). The workers are only started
+    once a file needs them.
+    """
+    def __init__(self, jobs, config):
+        self.jobs = jobs
+        self._config = config
+        self._pool = None
+
+    def apply_async(self, func, args):
+        if self._pool is None:
+            self._pool = _pool(self.jobs, self._config)
+
+        return self._pool.apply_async(func, args)
+
+    def close(self):
+        """Stop the workers, if they were started."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _shards(statements, shard_size):
+    shard = []
+    size = 0
+
+    for stmt in statements:
+        shard.append(stmt)
+        size += len(stmt.sql)
+
+        if size >= shard_size:
+            yield shard
+            shard = []
+            size = 0
+
+    if shard:
+        yield shard
+
+
+def _take_shard(result, facts):
+    issues, shard_facts = unpack(result.get())
+
+    for rule_facts, new_facts in zip(facts, shard_facts):
+        rule_facts.extend(new_facts)
+
+    return issues
+
+
+def _pool(jobs, config, cache=None, dedupe=False, configs=None):
+    # Workers are started fresh rather than forked, so that plugins are
+    # loaded the same way on every platform.
+    return multiprocessing.get_context('spawn').Pool(
+        jobs, _init_worker, (config, cache, dedupe, configs))
+
+
+def _init_worker(config, cache, dedupe, configs):
+    global _linter, _configs
+
+    rule.load_rules(config.plugins)
+    _linter = lint.Linter(config, cache, dedupe)
+    _configs = configs
+
+
+def _check_file(item):
+    file_name, contents = item
+
+    if contents is None:
+        with open(file_name, 'r') as fp:
+            contents = fp.read()
+
+    file_config = None
+    if _configs is not None:
+        file_config = _configs.for_file(file_name)
+
+    return file_name, pack(_linter.lint(contents, file_name, file_config))
+
+
+def _lint_shard(name, rules, statements):
+    plan = _linter.plan(rules)
+    session = lint.Session(plan, '', name)
+
+    issues = list(session.stream(statements, merge=False))
+
+    return pack((issues, session.facts()))
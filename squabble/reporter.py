@@ -82,6 +82,56 @@ def report(reporter_name, issues, files):
             _print_err(line)
 
 
+class SourceFile:
+    """
+    Contents of a file that was linted without being read into memory
+    (see :func:`squabble.lint.check_stream`), which can be passed to
+    reporters in place of the file contents.
+
+    Lines are read from disk as locations are looked up, starting from
+    the last location looked up, so this is cheapest when issues are
+    reported in the order they appear in the file.
+    """
+    def __init__(self, path):
+        self._path = path
+        self._fp = None
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def locate(self, location):
+        """
+        Return the ``(line_str, line, column)`` that the byte offset
+        ``location`` is at, or ``('', 1, 0)``. The column is counted
+        in characters, as for a file read into memory.
+        """
+        if self._fp is None or location < self._line_start:
+            self.close()
+
+            self._fp = open(self._path, 'rb')
+            self._line = b''
+            self._line_num = 0
+            self._line_start = 0
+
+        while location >= self._line_start + len(self._line):
+            self._line_start += len(self._line)
+            self._line_num += 1
+            self._line = self._fp.readline()
+
+            if not self._line:
+                self.close()
+                return ('', 1, 0)
+
+        # Strip out \r so we can treat \r\n and \n the same way
+        line = self._line.decode('utf-8', 'replace').rstrip('\r\n')
+        prefix = self._line[:location - self._line_start]
+        column = len(prefix.decode('utf-8', 'replace'))
+
+        return (line, self._line_num, column)
+
+
 def _location_for_issue(issue):
     """
     Return the offset into the file for this issue, or None if it
@@ -102,7 +152,8 @@ def _issue_to_file_location(issue, contents):
 
     :param issue:
     :type issue: :class:`squabble.lint.LintIssue`
-    :param contents: Full contents of the file being linted, as a string.
+    :param contents: Full contents of the file being linted, as a string,
+                     or a :class:`SourceFile`.
     :type contents: str
 
     >>> from squabble.lint import LintIssue
@@ -116,12 +167,27 @@ def _issue_to_file_location(issue, contents):
     >>> sql = '1\\r\\n\\r\\n678\\r\\nBCD'
     >>> _issue_to_file_location(issue, sql)
     ('678', 3, 2)
+
+    Locations are byte offsets, but columns are counted in characters.
+
+    >>> issue = LintIssue(location=8, file='foo')
+    >>> _issue_to_file_location(issue, 'é\\n"ü" x\\n')
+    ('"ü" x', 2, 4)
     """
     loc = _location_for_issue(issue)
 
-    if loc is None or loc >= len(contents):
+    if loc is not None and isinstance(contents, SourceFile):
+        return contents.locate(loc)
+
+    if loc is None:
         return ('', 1, 0)
 
+    encoded = contents.encode('utf-8')
+    if loc >= len(encoded):
+        return ('', 1, 0)
+
+    loc = len(encoded[:loc].decode('utf-8', 'replace'))
+
     # line number is number of newlines in the file before this
     # location, 1 indexed.
     line_num = contents[:loc].count('\n') + 1
@@ -2,6 +2,7 @@ import functools
 import glob
 import importlib
 import importlib.util as import_util
+import json
 import logging
 import os.path
 
@@ -10,6 +11,20 @@ from squabble import UnknownRuleException, PEP487Object
 
 logger = logging.getLogger(__name__)
 
+# Name and metadata of each rule that ships with squabble, along with
+# the module defining it (and the module defining each message), so
+# that rules are only imported when they're used. Regenerated with
+# ``python -m squabble.rule``.
+MANIFEST_PATH = os.path.join(os.path.dirname(__file__), 'rules',
+                             'manifest.json')
+
+# Packages can provide rules by naming the modules defining them as
+# entry points in this group.
+ENTRY_POINT_GROUP = 'squabble.rules'
+
+_manifest = None
+_entry_points_loaded = False
+
 
 def _load_plugin(path):
     """
@@ -38,8 +53,12 @@ def _load_plugin(path):
 
 
 def _load_builtin_rules():
-    """Load the rules that ship with squabble (squabble/rules/*.py)"""
+    """
+    Load the rules that ship with squabble (squabble/rules/*.py),
+    returning the names of their modules.
+    """
     modules = glob.glob(os.path.dirname(__file__) + '/rules/*.py')
+    names = []
 
     # Sort the modules to guarantee stable ordering
     for mod in sorted(modules):
@@ -48,22 +67,129 @@ def _load_builtin_rules():
         if not os.path.isfile(mod) or mod_name.startswith('__'):
             continue
 
-        importlib.import_module('squabble.rules.' + mod_name)
+        names.append('squabble.rules.' + mod_name)
+        importlib.import_module(names[-1])
+
+    return names
 
 
 def load_rules(plugin_paths=None):
     """
-    Load built in rules as well as any custom rules contained in the
-    directories in `plugin_paths`.
+    Load any custom rules contained in the directories in
+    `plugin_paths`. Built in rules (and those provided through entry
+    points) are loaded as they're needed.
     """
-    _load_builtin_rules()
-
-    # Import plugins last so their naming takes precedence
     plugin_paths = plugin_paths or []
     for path in plugin_paths:
         _load_plugin(path)
 
 
+def _load_entry_points():
+    """
+    Import the modules named by the entry points in
+    :data:`ENTRY_POINT_GROUP` (once), in order of name so that any
+    message codes they are assigned are always the same.
+    """
+    global _entry_points_loaded
+
+    if _entry_points_loaded:
+        return
+
+    _entry_points_loaded = True
+
+    before = dict(Registry._REGISTRY)
+
+    for entry_point in sorted(entry_points(), key=lambda e: e.name):
+        logger.debug('loading rules from entry point "%s"', entry_point)
+        entry_point.load()
+
+    # Built in rules (or plugins replacing them) are never replaced by
+    # rules from entry points.
+    for name, builtin in manifest()['rules'].items():
+        entry = Registry._REGISTRY.get(name)
+
+        if entry is None or entry is before.get(name):
+            continue
+
+        if entry['class'].__module__ == builtin['module']:
+            continue
+
+        logger.warning('ignoring rule "%s" from %s, which has the same name '
+                       'as a built in rule', name, entry['class'].__module__)
+
+        if name in before:
+            Registry._REGISTRY[name] = before[name]
+        else:
+            del Registry._REGISTRY[name]
+
+
+def entry_points():
+    """
+    Return the entry points in :data:`ENTRY_POINT_GROUP` of the
+    installed packages.
+    """
+    try:
+        from importlib import metadata
+    except ImportError:
+        # Before Python 3.8, fall back to the much slower pkg_resources.
+        import pkg_resources
+        return list(pkg_resources.iter_entry_points(ENTRY_POINT_GROUP))
+
+    found = metadata.entry_points()
+
+    # Python 3.10 added ``select``, and 3.12 removed the dict interface.
+    if hasattr(found, 'select'):
+        return list(found.select(group=ENTRY_POINT_GROUP))
+
+    return list(found.get(ENTRY_POINT_GROUP, []))
+
+
+def manifest():
+    """
+    Return the manifest of the built in rules, see
+    :data:`MANIFEST_PATH`.
+    """
+    global _manifest
+
+    if _manifest is None:
+        with open(MANIFEST_PATH, 'r') as fp:
+            _manifest = json.load(fp)
+
+    return _manifest
+
+
+def build_manifest():
+    """
+    Import every built in rule, and return the manifest describing them,
+    see :data:`MANIFEST_PATH`.
+    """
+    import squabble.message
+
+    rules = {}
+    messages = {}
+
+    for module in _load_builtin_rules():
+        for name, entry in Registry._REGISTRY.items():
+            if entry['class'].__module__ == module:
+                meta = dict(entry['meta'])
+                del meta['name']
+
+                rules[name] = dict(meta, module=module)
+
+        for code, msg in squabble.message.Registry._MAP.items():
+            if msg.__module__ == module:
+                messages[str(code)] = module
+
+    return {'rules': rules, 'messages': messages}
+
+
+def write_manifest(path=MANIFEST_PATH):
+    """Write the manifest returned by :func:`build_manifest` to ``path``."""
+    with open(path, 'w') as fp:
+        json.dump(build_manifest(), fp, indent=2, sort_keys=True)
+        fp.write('\n')
+
+
 def node_visitor(fn):
     """
     Helper decorator to make it easier to register callbacks for AST
@@ -114,6 +240,28 @@ class Registry(PEP487Object):
 
         Registry._REGISTRY[name] = {'class': rule, 'meta': meta}
 
+    @staticmethod
+    def _find(name):
+        """
+        Return the registry entry of the rule ``name``, importing the
+        module defining it if it's built in, or else the modules of any
+        plugins provided through entry points.
+        """
+        if name in Registry._REGISTRY:
+            return Registry._REGISTRY[name]
+
+        builtin = manifest()['rules'].get(name)
+
+        if builtin is not None:
+            importlib.import_module(builtin['module'])
+        else:
+            _load_entry_points()
+
+        if name not in Registry._REGISTRY:
+            raise UnknownRuleException(name)
+
+        return Registry._REGISTRY[name]
+
     @staticmethod
     def get_meta(name):
         """
@@ -133,9 +281,17 @@ class Registry(PEP487Object):
             }
         """
         if name not in Registry._REGISTRY:
-            raise UnknownRuleException(name)
+            builtin = manifest()['rules'].get(name)
+
+            # Described by the manifest, so there's no need to import it.
+            if builtin is not None:
+                return {
+                    'name': name,
+                    'description': builtin['description'],
+                    'help': builtin['help'],
+                }
 
-        return Registry._REGISTRY[name]['meta']
+        return Registry._find(name)['meta']
 
     @staticmethod
     def get_class(name):
@@ -145,16 +301,26 @@ class Registry(PEP487Object):
         If no rule exists in the registry named ``name``,
         :class:`UnknownRuleException` will be thrown.
         """
-        if name not in Registry._REGISTRY:
-            raise UnknownRuleException(name)
-
-        return Registry._REGISTRY[name]['class']
+        return Registry._find(name)['class']
 
     @staticmethod
     def all():
         """
         Return an iterator over all known rule metadata. Equivalent to calling
         :func:`~Registry.get_meta()` for all registered rules.
+
+        Built in rules aren't imported, but plugins provided through entry
+        points are.
         """
-        for r in Registry._REGISTRY.values():
-            yield r['meta']
+        _load_entry_points()
+
+        names = set(manifest()['rules']) | set(Registry._REGISTRY)
+
+        for name in sorted(names):
+            yield Registry.get_meta(name)
+
+
+if __name__ == '__main__':
+    # Rules register themselves with the imported module, not this one.
+    import squabble.rule
+    squabble.rule.write_manifest()
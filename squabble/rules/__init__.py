@@ -27,6 +27,34 @@ class BaseRule(PEP487Object):
     'column foo is not allowed'
     """
 
+    # Set of :class:`squabble.lint.StatementKind` that this rule can
+    # report issues for, e.g. ``{StatementKind.DDL}`` for a rule only
+    # looking at schema changes. Statements of other kinds are skipped
+    # when no enabled rule applies to them. ``None`` means every kind.
+    STATEMENT_KINDS = None
+
+    # Whether the hooks registered by ``enable`` keep no state from one
+    # file to the next (anything specific to a statement being kept in
+    # hooks registered while it is traversed, or recorded as facts), so
+    # the rule only needs to be enabled once for each configuration and
+    # its hooks can be reused for every file. Otherwise ``enable`` is
+    # called again for each file.
+    REUSABLE = False
+
+    # Whether the issues this rule reports for (and the facts it records
+    # for) a statement depend only on that statement, so can be reused
+    # for as long as the statement doesn't change. Anything depending on
+    # other statements must be done in ``merge``, and no exit hooks may
+    # be registered on the root context.
+    STATEMENT_LOCAL = False
+
+    # Whether the issues this rule reports for (and the facts it records
+    # for) a statement only depend on the structure of the statement,
+    # not on the literal values (strings and numbers) in it, other than
+    # where they are. Statements differing only in their literals can
+    # then be linted once, see :mod:`squabble.shapes`.
+    IGNORES_LITERALS = False
+
     def __init_subclass__(cls, **kwargs):
         """Keep track of all classes that inherit from ``BaseRule``."""
         super().__init_subclass__(**kwargs)
@@ -72,8 +100,29 @@ class BaseRule(PEP487Object):
         Called before the root AST node is traversed. Here's where most
         callbacks should be registered for different AST nodes.
 
-        Each linter is initialized once per file that it is being run
-        against. ``config`` will contain the merged base configuration
-        with the file-specific configuration options for this linter.
+        This is called for each file being linted, unless the rule is
+        :attr:`REUSABLE`, in which case it is called once per
+        configuration that it is being run with, and the hooks it
+        registers on ``ctx`` are reused for every file linted with that
+        configuration. ``config`` will contain the merged base
+        configuration with the file-specific configuration options for
+        this linter.
         """
         raise NotImplementedError('must be overridden by subclass')
+
+    def merge(self, ctx, facts):
+        """
+        Called once the whole file has been linted, with the list of
+        ``facts`` recorded by this rule through
+        :meth:`squabble.lint.Context.record`, in file order.
+
+        Rules which need to know about other statements in the file
+        (e.g. whether a table was created earlier) should record what
+        they find as facts and report issues here, rather than keeping
+        state between statements. This lets a large file be linted in
+        several parts, possibly in parallel, with the facts of each part
+        being combined afterwards.
+
+        Issues reported with ``ctx`` come after every other issue in the
+        file. The default implementation does nothing.
+        """
@@ -3,6 +3,7 @@ from pglast.enums import AlterTableType, ConstrType
 
 import squabble.rule
 from squabble import RuleConfigurationException
+from squabble.lint import StatementKind
 from squabble.message import Message
 from squabble.rules import BaseRule
 
@@ -27,6 +28,11 @@ class AddColumnDisallowConstraints(BaseRule):
       - UNIQUE
     """
 
+    STATEMENT_KINDS = {StatementKind.DDL}
+    REUSABLE = True
+    STATEMENT_LOCAL = True
+    IGNORES_LITERALS = True
+
     _CONSTRAINT_MAP = {
         'DEFAULT': ConstrType.CONSTR_DEFAULT,
         'NULL': ConstrType.CONSTR_NULL,
@@ -1,5 +1,6 @@
 from pglast.enums import AlterTableType
 
+from squabble.lint import StatementKind
 from squabble.message import Message
 from squabble.rules import BaseRule
 
@@ -13,6 +14,11 @@ class DisallowChangeColumnType(BaseRule):
        { "DisallowChangeColumnType": {} }
     """
 
+    STATEMENT_KINDS = {StatementKind.DDL}
+    REUSABLE = True
+    STATEMENT_LOCAL = True
+    IGNORES_LITERALS = True
+
     class ChangeTypeNotAllowed(Message):
         """
         Trying to change the type of an existing column may hold a
@@ -45,6 +45,12 @@ class DisallowFloatTypes(BaseRule):
       { "DisallowFloatTypes": {} }
     """
 
+    # Columns are defined in queries too, e.g. ``f() AS t(a real)``.
+    STATEMENT_KINDS = None
+    REUSABLE = True
+    STATEMENT_LOCAL = True
+    IGNORES_LITERALS = True
+
     _INEXACT_TYPES = set(
         _parse_column_type(ty)
         for ty in ['real', 'float', 'double', 'double precision']
@@ -1,6 +1,7 @@
 from pglast.enums import ConstrType
 
 import squabble
+from squabble.lint import StatementKind
 from squabble.message import Message
 from squabble.rules import BaseRule
 
@@ -24,6 +25,11 @@ class DisallowForeignKey(BaseRule):
       }
     """
 
+    STATEMENT_KINDS = {StatementKind.DDL}
+    REUSABLE = True
+    STATEMENT_LOCAL = True
+    IGNORES_LITERALS = True
+
     class DisallowedForeignKeyConstraint(Message):
         """
         Sometimes, foreign keys are not possible, or may cause more
@@ -16,6 +16,10 @@ class DisallowNotIn(BaseRule):
         { "DisallowNotIn": {} }
     """
 
+    REUSABLE = True
+    STATEMENT_LOCAL = True
+    IGNORES_LITERALS = True
+
     class NotInNotAllowed(Message):
         """
         ``NOT IN`` (along with any expression containing ``NOT ... IN``) should
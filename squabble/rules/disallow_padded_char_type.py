@@ -22,6 +22,12 @@ class DisallowPaddedCharType(BaseRule):
       { "DisallowPaddedCharType": {} }
     """
 
+    # Columns are defined in queries too, e.g. ``f() AS t(a char)``.
+    STATEMENT_KINDS = None
+    REUSABLE = True
+    STATEMENT_LOCAL = True
+    IGNORES_LITERALS = True
+
     _DISALLOWED_TYPES = {
         # note: ``bpchar`` for "bounded, padded char"
         'pg_catalog.bpchar'
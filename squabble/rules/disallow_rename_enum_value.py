@@ -1,6 +1,7 @@
 import pglast
 
 import squabble.rule
+from squabble.lint import StatementKind
 from squabble.message import Message
 from squabble.rules import BaseRule
 
@@ -16,6 +17,10 @@ class DisallowRenameEnumValue(BaseRule):
         { "DisallowChangeEnumValue": {} }
     """
 
+    STATEMENT_KINDS = {StatementKind.DDL}
+    REUSABLE = True
+    STATEMENT_LOCAL = True
+
     class RenameNotAllowed(Message):
         """
         Renaming an existing enum value may not be backwards compatible
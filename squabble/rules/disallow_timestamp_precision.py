@@ -29,6 +29,11 @@ class DisallowTimestampPrecision(BaseRule):
        }
     """
 
+    # Columns are defined in queries too, e.g. ``f() AS t(a time(0))``.
+    STATEMENT_KINDS = None
+    REUSABLE = True
+    STATEMENT_LOCAL = True
+
     _CHECKED_TYPES = {
         'pg_catalog.time',
         'pg_catalog.timetz',
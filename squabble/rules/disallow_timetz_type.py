@@ -20,6 +20,10 @@ class DisallowTimetzType(BaseRule):
        { "DisallowTimetzType": {} }
     """
 
+    REUSABLE = True
+    STATEMENT_LOCAL = True
+    IGNORES_LITERALS = True
+
     _DISALLOWED_TYPES = {
         'pg_catalog.timetz',
         'timetz',
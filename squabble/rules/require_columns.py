@@ -3,6 +3,7 @@ import pglast.printers
 
 import squabble.rule
 from squabble import RuleConfigurationException
+from squabble.lint import StatementKind
 from squabble.message import Message
 from squabble.rules import BaseRule
 
@@ -114,6 +115,13 @@ class RequireColumns(BaseRule):
     Otherwise, only the presence of the column will be checked.
     """
 
+    STATEMENT_KINDS = {StatementKind.DDL}
+    REUSABLE = True
+    STATEMENT_LOCAL = True
+
+    # Types are compared with their modifiers, e.g. ``varchar(36)``.
+    IGNORES_LITERALS = False
+
     class MissingRequiredColumn(Message):
         CODE = 1005
         TEMPLATE = '"{tbl}" missing required column "{col}"'
@@ -2,7 +2,7 @@ import logging
 
 import pglast
 
-import squabble.rule
+from squabble.lint import StatementKind
 from squabble.message import Message
 from squabble.rules import BaseRule
 
@@ -28,6 +28,11 @@ class RequireConcurrentIndex(BaseRule):
         }
     """
 
+    STATEMENT_KINDS = {StatementKind.DDL}
+    REUSABLE = True
+    STATEMENT_LOCAL = True
+    IGNORES_LITERALS = True
+
     class IndexNotConcurrent(Message):
         """
         Adding a new index to an existing table may hold a full table lock
@@ -47,25 +52,37 @@ class RequireConcurrentIndex(BaseRule):
         TEMPLATE = 'index "{name}" not created `CONCURRENTLY`'
 
     def enable(self, ctx, config):
-        include_new = config.get('include_new_tables', False)
+        # Keep track of CREATE TABLE statements if we're not including
+        # them in our check. Whether a table is new depends on the rest
+        # of the file, so this is only decided by ``merge``.
+        if not config.get('include_new_tables', False):
+            ctx.register('CreateStmt', self._create_table)
+
+        ctx.register('IndexStmt', self._create_index)
+
+    def merge(self, ctx, facts):
         tables = set()
 
-        # Keep track of CREATE TABLE statements if we're not including
-        # them in our check.
-        if not include_new:
-            ctx.register('CreateStmt', self._create_table(tables))
+        for fact in facts:
+            if fact[0] == 'table':
+                tables.add(fact[1])
+                continue
 
-        ctx.register('IndexStmt', self._create_index(tables))
+            _kind, table, index_name, node = fact
 
-    @squabble.rule.node_visitor
-    def _create_table(self, ctx, node, tables):
+            # This is a new table, don't alert on it
+            if table in tables:
+                continue
+
+            ctx.report(self.IndexNotConcurrent(name=index_name), node=node)
+
+    def _create_table(self, ctx, node):
         table = node.relation.relname.value.lower()
         logger.debug('found a new table: %s', table)
 
-        tables.add(table)
+        ctx.record(self, ('table', table))
 
-    @squabble.rule.node_visitor
-    def _create_index(self, ctx, node, tables):
+    def _create_index(self, ctx, node):
         index_name = 'unnamed'
         if node.idxname != pglast.Missing:
             index_name = node.idxname.value
@@ -77,11 +94,4 @@ class RequireConcurrentIndex(BaseRule):
             return
 
         table = node.relation.relname.value.lower()
-
-        # This is a new table, don't alert on it
-        if table in tables:
-            return
-
-        ctx.report(
-            self.IndexNotConcurrent(name=index_name),
-            node=node.relation)
+        ctx.record(self, ('index', table, index_name, node.relation))
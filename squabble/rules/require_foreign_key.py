@@ -3,6 +3,7 @@ import re
 import pglast
 from pglast.enums import AlterTableType, ConstrType
 
+from squabble.lint import StatementKind
 from squabble.message import Message
 from squabble.rules import BaseRule
 
@@ -36,6 +37,11 @@ class RequireForeignKey(BaseRule):
       }
     """
 
+    STATEMENT_KINDS = {StatementKind.DDL}
+    REUSABLE = True
+    STATEMENT_LOCAL = True
+    IGNORES_LITERALS = True
+
     class MissingForeignKeyConstraint(Message):
         """
         Foreign keys are a good way to guarantee that your database
@@ -69,36 +75,43 @@ class RequireForeignKey(BaseRule):
     def enable(self, root_ctx, config):
         fk_regex = re.compile(config.get('column_regex', self._DEFAULT_REGEX))
 
-        # Keep track of column_name -> column_def node so we can
-        # report a sane location for the warning when a new column
-        # doesn't have a foreign key.
-        missing_fk = {}
+        # Columns which look like references and foreign key constraints
+        # are recorded as facts, and only matched up with each other by
+        # ``merge``, since they may be in different statements.
+        def record(ctx):
+            return lambda fact: ctx.record(self, fact)
 
         # We want to check both columns that are part of CREATE TABLE
         # as well as ALTER TABLE ... ADD COLUMN
         root_ctx.register(
             'CreateStmt',
-            lambda _, node: _create_table_stmt(node, fk_regex, missing_fk))
+            lambda ctx, node: _create_table_stmt(node, fk_regex, record(ctx)))
 
         root_ctx.register(
             'AlterTableStmt',
-            lambda _, node: _alter_table_stmt(node, fk_regex, missing_fk))
+            lambda ctx, node: _alter_table_stmt(node, fk_regex, record(ctx)))
+
+    def merge(self, ctx, facts):
+        # Keep track of column_name -> column_def node so we can
+        # report a sane location for the warning when a new column
+        # doesn't have a foreign key.
+        missing_fk = {}
 
-        def _report_missing(ctx):
-            """
-            When we exit the root context, any elements remaining in
-            ``missing_fk`` are known not to have a FOREIGN KEY
-            constraint, so report them as errors.
-            """
-            for column, node in missing_fk.items():
-                ctx.report(
-                    self.MissingForeignKeyConstraint(col=column),
-                    node=node)
+        for fact in facts:
+            if fact[0] == 'column':
+                _kind, key, node = fact
+                missing_fk[key] = node
+            else:
+                _kind, key = fact
+                missing_fk.pop(key, None)
 
-        root_ctx.register_exit(_report_missing)
+        # Any elements remaining in ``missing_fk`` are known not to have
+        # a FOREIGN KEY constraint, so report them as errors.
+        for column, node in missing_fk.items():
+            ctx.report(self.MissingForeignKeyConstraint(col=column), node=node)
 
 
-def _create_table_stmt(table_node, fk_regex, missing_fk):
+def _create_table_stmt(table_node, fk_regex, record):
     table_name = table_node.relation.relname.value
     if table_node.tableElts == pglast.Missing:
         return
@@ -108,38 +121,38 @@ def _create_table_stmt(table_node, fk_regex, missing_fk):
         if e.node_tag == 'ColumnDef':
             if _column_needs_foreign_key(fk_regex, e):
                 key = '{}.{}'.format(table_name, e.colname.value)
-                missing_fk[key] = e
+                record(('column', key, e))
 
         # FOREIGN KEY (...) REFERENCES ...
         elif e.node_tag == 'Constraint':
-            _remove_satisfied_foreign_keys(e, table_name, missing_fk)
+            _record_foreign_keys(e, table_name, record)
 
 
-def _alter_table_stmt(node, fk_regex, missing_fk):
+def _alter_table_stmt(node, fk_regex, record):
     table_name = node.relation.relname.value
 
     for cmd in node.cmds:
         if cmd.subtype == AlterTableType.AT_AddColumn:
             if _column_needs_foreign_key(fk_regex, cmd['def']):
                 key = '{}.{}'.format(table_name, cmd['def'].colname.value)
-                missing_fk[key] = cmd['def']
+                record(('column', key, cmd['def']))
 
         elif cmd.subtype in (AlterTableType.AT_AddConstraint,
                              AlterTableType.AT_AddConstraintRecurse):
             constraint = cmd['def']
-            _remove_satisfied_foreign_keys(constraint, table_name, missing_fk)
+            _record_foreign_keys(constraint, table_name, record)
 
 
-def _remove_satisfied_foreign_keys(constraint, table_name, missing_fk):
+def _record_foreign_keys(constraint, table_name, record):
     # Nothing to do if this isn't a foreign key constraint
     if constraint.contype != ConstrType.CONSTR_FOREIGN:
         return
 
-    # Clear out any columns that we earlier identified as
-    # needing a foreign key.
+    # Satisfies any columns that were earlier identified as needing a
+    # foreign key.
     for col_name in constraint.fk_attrs:
         key = '{}.{}'.format(table_name, col_name.string_value)
-        missing_fk.pop(key, '')
+        record(('foreign_key', key))
 
 
 def _column_needs_foreign_key(fk_regex, column_def):
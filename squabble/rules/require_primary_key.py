@@ -2,6 +2,7 @@ import pglast
 from pglast.enums import ConstrType
 
 import squabble.rule
+from squabble.lint import StatementKind
 from squabble.message import Message
 from squabble.rules import BaseRule
 
@@ -15,6 +16,11 @@ class RequirePrimaryKey(BaseRule):
         { "RequirePrimaryKey": {} }
     """
 
+    STATEMENT_KINDS = {StatementKind.DDL}
+    REUSABLE = True
+    STATEMENT_LOCAL = True
+    IGNORES_LITERALS = True
+
     class MissingPrimaryKey(Message):
         """
         When creating a new table, it's usually a good idea to define a primary
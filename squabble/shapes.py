@@ -0,0 +1,175 @@
+"""
+Lint each distinct shape of statement only once, for large collections
+of SQL (e.g. query logs) where the same statements appear over and
+over, often only differing in their literal values.
+
+The shape of a statement is its sequence of tokens, ignoring whitespace,
+comments and the case of keywords and unquoted identifiers (which the
+parser folds to lowercase anyway), and, if none of the enabled rules
+which apply to it look at literal values (see
+:attr:`~squabble.rules.BaseRule.IGNORES_LITERALS`), the values of string
+and numeric literals.
+
+Statements with the same shape are parsed the same way, so the issues
+found in one of them (and the facts recorded for it) can be reused for
+the others, after moving their locations to the corresponding tokens of
+each one. The nodes of reused issues are otherwise those of the
+statement that was linted, so may contain its literal values.
+
+>>> from squabble.splitter import Statement
+>>> def ignore(keyword):
+...     return keyword == b'select'
+>>> a = statement_shape(Statement("SELECT 'a' FROM t", 0), ignore)
+>>> b = statement_shape(Statement("\\nselect  'bcd'  FROM t", 30), ignore)
+>>> a.key == b.key
+True
+>>> b.starts
+[1, 9, 16, 21]
+>>> c = statement_shape(Statement("VALUES ('a')", 0), ignore)
+>>> c.key == statement_shape(Statement("VALUES ('b')", 0), ignore).key
+False
+"""
+
+import bisect
+import collections
+import hashlib
+import pickle
+import re
+
+from squabble.util import pack, relocate, unpack
+
+_TOKEN = re.compile(rb'''
+    (?P<space> \s+ | --[^\n]* | /\*.*?\*/ )
+  | (?P<literal>
+        [Ee]'(?:\\.|''|[^'\\])*'
+      | (?:[BbNnXx]|[Uu]&)?'(?:''|[^'])*'
+      | \$(?P<tag>(?:[A-Za-z_\x80-\xff][\w\x80-\xff]*)?)\$.*?\$(?P=tag)\$
+      | (?:\d+(?:\.\d*)?|\.\d+)(?:[Ee][+-]?\d+)?
+    )
+  | (?P<word> [A-Za-z_\x80-\xff][\w$\x80-\xff]* )  # keyword or identifier
+  | "(?:""|[^"])*"  # quoted identifier
+  | \$\d+  # parameter
+  | (?:[+*<>=~!@\#%^&|`?]|-(?!-)|/(?!\*))+  # operator
+  | .
+''', re.VERBOSE | re.DOTALL)
+
+# Stands in for the value of every literal, when they're ignored. Can't
+# be confused with any token, since it isn't a complete string literal.
+_LITERAL = b"'"
+
+
+Shape = collections.namedtuple('Shape', ['key', 'location', 'starts'])
+Shape.__doc__ = """
+The shape of a :class:`~squabble.splitter.Statement` at ``location``:
+``key`` is the same for every statement of the same shape, and
+``starts`` holds the offset in bytes of each of its tokens from the
+start of the statement.
+"""
+
+
+def statement_shape(stmt, ignore_literals):
+    """
+    Return the :class:`Shape` of ``stmt``, a
+    :class:`~squabble.splitter.Statement`.
+
+    ``ignore_literals`` is called with the first token of the statement,
+    in lowercase, and returns whether statements starting with it which
+    only differ in the values of their literals have the same shape.
+    """
+    tokens = []
+    starts = []
+    ignore = None
+
+    for match in _TOKEN.finditer(stmt.sql.encode('utf-8')):
+        kind = match.lastgroup
+        if kind == 'space':
+            continue
+
+        token = match.group()
+        if kind == 'word':
+            token = token.lower()
+
+        if ignore is None:
+            ignore = ignore_literals(token)
+
+        starts.append(match.start())
+
+        if kind == 'literal' and ignore:
+            tokens.append(_LITERAL)
+        else:
+            tokens.append(token)
+
+    key = hashlib.sha256(b'\0'.join(tokens)).digest()
+    return Shape(key, stmt.location, starts)
+
+
+class ShapeResults:
+    """
+    The issues found in (and the facts recorded for) the first statement
+    of each shape, see :func:`statement_shape`. Results are kept in
+    memory for as long as this object is, so it holds one entry per
+    distinct shape seen.
+
+    Only valid for rules which are all
+    :attr:`~squabble.rules.BaseRule.STATEMENT_LOCAL`. See
+    :func:`statement_shape` for ``ignore_literals``, e.g.
+    :meth:`squabble.lint.LintPlan.ignores_literals`.
+    """
+    def __init__(self, ignore_literals):
+        self.ignore_literals = ignore_literals
+
+        # shape key -> (shape of the linted statement, pickled results,
+        # or None if there weren't any issues or facts)
+        self._results = {}
+
+        # Number of rules, for the facts of statements without any.
+        self._num_rules = None
+
+    def shape(self, stmt):
+        """Return the :class:`Shape` of ``stmt``."""
+        return statement_shape(stmt, self.ignore_literals)
+
+    def get(self, shape):
+        """
+        Return ``(issues, facts)`` for the statement with ``shape``, or
+        ``None`` if no statement with the same shape has been linted.
+        """
+        entry = self._results.get(shape.key)
+        if entry is None:
+            return None
+
+        linted, stored = entry
+
+        if stored is None:
+            return [], [[] for _ in range(self._num_rules)]
+
+        def move(location):
+            offset = location - linted.location
+
+            # Locations before the first token (i.e. the start of the
+            # statement) stay where they are relative to the statement,
+            # others stay where they are relative to their token.
+            token = bisect.bisect_right(linted.starts, offset) - 1
+            if token >= 0:
+                offset += shape.starts[token] - linted.starts[token]
+
+            return shape.location + offset
+
+        # Unpickling gives a fresh copy to move.
+        return unpack(relocate(pickle.loads(stored), move))
+
+    def put(self, shape, issues, facts):
+        """Store the ``issues`` and ``facts`` of a statement."""
+        # Syntax errors mention the text of the statement, so are only
+        # correct for the statement they were found in.
+        if any(issue.message is None for issue in issues):
+            return
+
+        self._num_rules = len(facts)
+
+        stored = None
+        if issues or any(facts):
+            stored = pickle.dumps(pack((issues, facts)),
+                                  pickle.HIGHEST_PROTOCOL)
+
+        self._results[shape.key] = (shape, stored)
@@ -0,0 +1,394 @@
+"""
+Split SQL files into individual statements without parsing them, in the
+same way ``psql`` does.
+
+This is needed for ``pg_dump`` output, where ``COPY ... FROM stdin;``
+statements are followed by rows of data, terminated by a line
+containing only ``\\.``, which the parser itself can't handle.
+"""
+
+import collections
+import re
+
+
+Statement = collections.namedtuple('Statement', ['sql', 'location'])
+Statement.__doc__ = """
+A single statement, including everything (whitespace, comments) since
+the end of the previous one, and its terminating semicolon if any.
+
+``location`` is the offset in bytes of the start of ``sql`` in the
+file, which is the same unit used by the parser for node locations.
+"""
+
+
+# Anything that changes how the following text must be interpreted.
+_SYNTAX = rb'''
+    --  # line comment
+  | /\*  # block comment
+  | (?<![\w$\x80-\xff])[Ee]'  # string with backslash escapes
+  | ['";()]
+  | (?<![\w$\x80-\xff])\$(?:[A-Za-z_][A-Za-z_0-9]*)?\$  # dollar quote
+'''
+
+_TOKEN = re.compile(_SYNTAX, re.VERBOSE)
+
+# Same, but also matching words, see ``_Splitter._add_word``.
+_TOKEN_OR_WORD = re.compile(
+    _SYNTAX + rb'| [A-Za-z_\x80-\xff][\w$\x80-\xff]*', re.VERBOSE)
+
+_BLOCK_COMMENT = re.compile(rb'/\*|\*/')
+_ESCAPE_STRING = re.compile(rb"\\.|'", re.DOTALL)
+
+_STRING_END = {b"'": re.compile(b"'"), b'"': re.compile(b'"')}
+
+# Words that matter for recognizing ``COPY ... FROM stdin``.
+_COPY_WORDS = {b'copy', b'from', b'stdin'}
+
+# Where ``bytes.splitlines`` breaks lines.
+_LINE_BREAK = re.compile(rb'\r\n?|\n')
+
+
+def split_statements(lines, offset=0):
+    """
+    Lazily split ``lines``, an iterable of ``bytes`` which together form
+    a UTF-8 encoded SQL file (such as a file opened in binary mode),
+    into :class:`Statement` tuples. Lines end wherever
+    :func:`split_lines` says, however ``lines`` was split.
+
+    To split the rest of a file from the end of one of its statements,
+    ``lines`` may start there, with ``offset`` giving its location.
+
+    Only the statement being read is held in memory. The data following
+    ``COPY ... FROM stdin`` is skipped line by line without being kept,
+    as are ``psql`` meta-commands (e.g. ``\\connect``). Trailing
+    whitespace and comments are dropped.
+
+    >>> sql = b'''CREATE TABLE a (b text);
+    ... COPY a (b) FROM stdin;
+    ... x;y
+    ... \\\\.
+    ... SELECT ';' -- ;
+    ...   FROM a;
+    ... '''
+    >>> for stmt in split_statements(sql.splitlines(True)):
+    ...     print(stmt.location, repr(stmt.sql))
+    0 'CREATE TABLE a (b text);'
+    24 '\\nCOPY a (b) FROM stdin;'
+    55 "SELECT ';' -- ;\\n  FROM a;"
+    """
+    return _Splitter(offset).split(lines)
+
+
+def split_changed(statements, old, new):
+    """
+    Return the statements of ``new``, the UTF-8 encoded contents of a
+    file which used to be ``old``, whose statements were
+    ``statements``, as :func:`split_statements` would. Only the part of
+    ``new`` around what changed is split again, the statements before
+    it are kept and those after it are moved.
+
+    >>> old = b'SELECT 1;\\nSELECT 2;\\nSELECT 3;\\n'
+    >>> new = b'SELECT 1;\\nSELECT 42; SELECT 4;\\nSELECT 3;\\n'
+    >>> statements = list(split_statements(old.splitlines(True)))
+    >>> for stmt in split_changed(statements, old, new):
+    ...     print(stmt.location, repr(stmt.sql))
+    0 'SELECT 1;'
+    9 '\\nSELECT 42;'
+    20 ' SELECT 4;'
+    30 '\\nSELECT 3;'
+    """
+    prefix = _common_prefix(old, new)
+    suffix = _common_prefix(old[prefix:][::-1], new[prefix:][::-1])
+    moved = len(new) - len(old)
+
+    # Splitting starts from the end of the last statement before the
+    # change which isn't followed by ``COPY`` data or a meta-command
+    # (which aren't part of any statement), or anything that might be
+    # mistaken for one when the rest of its line is split on its own.
+    keep = len(statements)
+    start = 0
+
+    while keep > 1:
+        keep -= 1
+        end = statements[keep].location
+        stmt = statements[keep - 1]
+
+        if end > prefix or \
+           stmt.location + len(stmt.sql.encode('utf-8')) != end:
+            continue
+
+        line_end = _LINE_BREAK.search(new, end)
+        line_end = line_end.start() if line_end else len(new)
+
+        if not new[end:line_end].lstrip().startswith(b'\\'):
+            start = end
+            break
+    else:
+        keep = 0
+
+    # Statements starting after the change, by where they used to start.
+    unchanged = {
+        stmt.location: i for i, stmt in enumerate(statements)
+        if stmt.location > len(old) - suffix
+    }
+
+    result = statements[:keep]
+
+    for stmt in split_statements(split_lines(new, start), offset=start):
+        # Splitting the rest would give the same statements as before,
+        # just moved.
+        if stmt.location > len(new) - suffix and \
+           stmt.location - moved in unchanged:
+            result.extend(
+                Statement(s.sql, s.location + moved)
+                for s in statements[unchanged[stmt.location - moved]:])
+            break
+
+        result.append(stmt)
+
+    return result
+
+
+def _common_prefix(a, b):
+    """
+    Return the length of the longest common prefix of ``a`` and ``b``,
+    comparing slices to do so in few steps.
+
+    >>> _common_prefix(b'abcdef', b'abcxyz')
+    3
+    """
+    low, high = 0, min(len(a), len(b))
+
+    while low < high:
+        middle = (low + high + 1) // 2
+
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+
+    return low
+
+
+def split_lines(data, start=0):
+    """
+    Lazily yield the lines of ``data`` (``bytes``) from ``start`` on,
+    with their line breaks, the same as ``data.splitlines(True)``.
+
+    >>> list(split_lines(b'a\\nb\\r\\nc\\rd'))
+    [b'a\\n', b'b\\r\\n', b'c\\r', b'd']
+    """
+    while start < len(data):
+        match = _LINE_BREAK.search(data, start)
+        end = match.end() if match else len(data)
+
+        yield data[start:end]
+        start = end
+
+
+def _resplit(lines):
+    """
+    Yield ``lines`` split again by :func:`split_lines`, since lines read
+    from a file in binary mode are only split on ``\\n``.
+    """
+    for line in lines:
+        if b'\r' in line:
+            yield from split_lines(line)
+        else:
+            yield line
+
+
+class _Splitter:
+    def __init__(self, offset=0):
+        # Offset of the start of the current line.
+        self._offset = offset
+
+        # Text of the statement being read and its starting offset.
+        self._pending = []
+        self._start = offset
+
+        # Whether anything other than whitespace and comments has been
+        # seen in the pending statement.
+        self._has_tokens = False
+
+        # Significant words of the statement, up to ``FROM stdin``.
+        self._words = []
+
+        self._paren_depth = 0
+
+        # How to find the end of the quoted string or comment that the
+        # current line started in, if any.
+        self._quote = None
+        self._comment_depth = 0
+
+        self._in_copy_data = False
+
+    def split(self, lines):
+        for line in _resplit(lines):
+            if self._in_copy_data:
+                if line.rstrip(b'\r\n') == b'\\.':
+                    self._in_copy_data = False
+                    self._start = self._offset + len(line)
+
+            elif (not self._has_tokens and self._quote is None and
+                  not self._comment_depth and
+                  line.lstrip().startswith(b'\\')):
+                # psql meta-command, these take up the whole line.
+                self._pending = []
+                self._start = self._offset + len(line)
+
+            else:
+                yield from self._split_line(line)
+
+            self._offset += len(line)
+
+        if self._has_tokens:
+            yield self._statement(b''.join(self._pending))
+
+    def _statement(self, sql):
+        stmt = Statement(sql.decode('utf-8'), self._start)
+
+        self._pending = []
+        self._has_tokens = False
+        self._words = []
+        self._paren_depth = 0
+
+        return stmt
+
+    def _split_line(self, line):
+        # Start of the part of the line not yet added to ``_pending``.
+        begin = 0
+        pos = 0
+
+        while pos < len(line):
+            if self._quote is not None:
+                pos = self._skip_quoted(line, pos)
+                continue
+
+            if self._comment_depth:
+                pos = self._skip_comment(line, pos)
+                continue
+
+            if len(self._words) < 2 or self._words[0] == b'copy':
+                match = _TOKEN_OR_WORD.search(line, pos)
+            else:
+                match = _TOKEN.search(line, pos)
+
+            if match is None:
+                break
+
+            token = match.group()
+            pos = match.end()
+
+            if token == b'--':
+                break
+
+            if token == b'/*':
+                self._comment_depth = 1
+                continue
+
+            self._has_tokens = True
+
+            if token == b';':
+                if self._paren_depth:
+                    continue
+
+                is_copy = self._is_copy_from_stdin
+
+                self._pending.append(line[begin:pos])
+                yield self._statement(b''.join(self._pending))
+
+                self._start = self._offset + pos
+                begin = pos
+
+                if is_copy:
+                    self._in_copy_data = True
+                    self._start = self._offset + len(line)
+
+                    # Data starts on the following line.
+                    return
+
+            elif token == b'(':
+                self._paren_depth += 1
+
+            elif token == b')':
+                self._paren_depth = max(0, self._paren_depth - 1)
+
+            elif token[-1:] in (b"'", b'"') or token[:1] == b'$':
+                self._quote = token
+
+                # Count as words, so that ``COPY "from" stdin`` isn't
+                # mistaken for ``FROM stdin``.
+                self._add_word(None)
+
+            else:
+                word = token.lower()
+                self._add_word(word if word in _COPY_WORDS else None)
+
+        self._pending.append(line[begin:])
+
+    def _add_word(self, word):
+        # Only ``COPY`` statements need more than their first word.
+        if len(self._words) < 2 or self._words[0] == b'copy':
+            self._words.append(word)
+
+    @property
+    def _is_copy_from_stdin(self):
+        words = self._words
+        return bool(words) and words[0] == b'copy' and \
+            any(words[i:i + 2] == [b'from', b'stdin']
+                for i in range(1, len(words) - 1))
+
+    def _skip_quoted(self, line, pos):
+        """
+        Return the position just past the end of the quoted string or
+        identifier starting before ``pos``, or the end of ``line``.
+        """
+        quote = self._quote
+
+        if quote[:1] == b'$':
+            end = line.find(quote, pos)
+            if end == -1:
+                return len(line)
+
+            self._quote = None
+            return end + len(quote)
+
+        if quote[:1] in b'Ee':
+            pattern = _ESCAPE_STRING
+        else:
+            pattern = _STRING_END[quote]
+
+        while True:
+            match = pattern.search(line, pos)
+            if match is None:
+                return len(line)
+
+            pos = match.end()
+
+            if len(match.group()) == 2:
+                # Backslash escape
+                continue
+
+            # Doubled quotes are escaped quotes.
+            if line[pos:pos + 1] == quote[-1:]:
+                pos += 1
+                continue
+
+            self._quote = None
+            return pos
+
+    def _skip_comment(self, line, pos):
+        """
+        Return the position just past the end of the (possibly nested)
+        block comment starting before ``pos``, or the end of ``line``.
+        """
+        while self._comment_depth:
+            match = _BLOCK_COMMENT.search(line, pos)
+            if match is None:
+                return len(line)
+
+            pos = match.end()
+            self._comment_depth += 1 if match.group() == b'/*' else -1
+
+        return pos
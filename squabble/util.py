@@ -3,23 +3,13 @@ Odds and ends pieces that don't fit elsewhere, but aren't important
 enough to have their own modules.
 """
 
-import re
+import collections
 
+import pglast
 
-_RST_DIRECTIVE = re.compile(r'^\.\. [\w-]+:: \w+$\n', flags=re.MULTILINE)
 
-
-def strip_rst_directives(string):
-    """
-    Strip reStructuredText directives out of a block of text.
-
-    Lines containing a directive will be stripped out entirely
-
-    >>> strip_rst_directives('hello\\n.. code-block:: foo\\nworld')
-    'hello\\nworld'
-    """
-
-    return re.sub(_RST_DIRECTIVE, '', string)
+# Moved to squabble.message, which can be imported without pglast.
+from squabble.message import strip_rst_directives  # noqa: F401
 
 
 def format_type_name(type_name):
@@ -37,3 +27,123 @@ def format_type_name(type_name):
     'pg_catalog.timetz'
     """
     return '.'.join([p.string_value for p in type_name.names])
+
+
+class PackedNode(collections.namedtuple('PackedNode', ['tree'])):
+    """Stand-in for a ``pglast.Node``, which can't be pickled."""
+
+
+def pack(value):
+    """
+    Replace every ``pglast.Node`` in ``value``, which may be nested in
+    tuples, lists and dicts, with a picklable :class:`PackedNode`, e.g.
+    to send lint issues to another process.
+
+    >>> node = pglast.Node({'String': {'str': 'foo'}})
+    >>> packed = pack([('name', node)])
+    >>> packed
+    [('name', PackedNode(tree={'String': {'str': 'foo'}}))]
+    >>> unpack(packed)[0][1].str.value
+    'foo'
+    """
+    if isinstance(value, pglast.node.Node):
+        return PackedNode({value.node_tag: value.parse_tree})
+
+    # Already packed, e.g. the facts recorded by rules.
+    if isinstance(value, PackedNode):
+        return value
+
+    if isinstance(value, tuple) and hasattr(value, '_fields'):
+        return value._replace(**{
+            field: pack(getattr(value, field)) for field in value._fields
+        })
+
+    if isinstance(value, (list, tuple)):
+        return type(value)(pack(v) for v in value)
+
+    if isinstance(value, dict):
+        return {k: pack(v) for k, v in value.items()}
+
+    return value
+
+
+def unpack(value):
+    """Reverse of :func:`pack`."""
+    if isinstance(value, PackedNode):
+        return pglast.Node(value.tree)
+
+    if isinstance(value, tuple) and hasattr(value, '_fields'):
+        return value._replace(**{
+            field: unpack(getattr(value, field)) for field in value._fields
+        })
+
+    if isinstance(value, (list, tuple)):
+        return type(value)(unpack(v) for v in value)
+
+    if isinstance(value, dict):
+        return {k: unpack(v) for k, v in value.items()}
+
+    return value
+
+
+def relocate(value, move, _seen=None):
+    """
+    Return ``value``, as returned by :func:`pack`, with every location
+    in it replaced by ``move(location)``: those of the nodes, and the
+    ``location`` field of namedtuples such as lint issues. Nodes are
+    changed in place, each only once even if shared.
+
+    >>> packed = pack([pglast.Node({'A_Const': {'location': 7}})])
+    >>> relocate(packed, lambda location: location + 10)
+    [PackedNode(tree={'A_Const': {'location': 17}})]
+    """
+    if _seen is None:
+        _seen = set()
+
+    if isinstance(value, PackedNode):
+        _move_locations(value.tree, move, _seen)
+        return value
+
+    if isinstance(value, tuple) and hasattr(value, '_fields'):
+        fields = {
+            field: relocate(getattr(value, field), move, _seen)
+            for field in value._fields
+        }
+
+        if isinstance(fields.get('location'), int):
+            fields['location'] = move(fields['location'])
+
+        return value._replace(**fields)
+
+    if isinstance(value, (list, tuple)):
+        return type(value)(relocate(v, move, _seen) for v in value)
+
+    if isinstance(value, dict):
+        return {k: relocate(v, move, _seen) for k, v in value.items()}
+
+    return value
+
+
+def _move_locations(tree, move, seen):
+    work = [tree]
+
+    while work:
+        item = work.pop()
+
+        if isinstance(item, list):
+            work.extend(v for v in item if isinstance(v, (dict, list)))
+            continue
+
+        for fields in item.values():
+            if id(fields) in seen:
+                continue
+
+            seen.add(id(fields))
+
+            for key, value in fields.items():
+                if isinstance(value, (dict, list)):
+                    work.append(value)
+
+                # -1 is used for unknown locations.
+                elif key in ('location', 'stmt_location') and value >= 0:
+                    fields[key] = move(value)
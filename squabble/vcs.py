@@ -0,0 +1,259 @@
+"""
+Ask ``git`` what changed in a repository, so that only the files (and
+lines) changed on a branch need to be linted.
+"""
+
+import codecs
+import os.path
+import re
+import subprocess
+
+from squabble import SquabbleException
+
+# Header of each hunk of ``git diff`` output, giving the lines of the new
+# version of the file it covers.
+_HUNK = re.compile(rb'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
+
+
+class GitException(SquabbleException):
+    """Raised when ``git`` can't tell what changed."""
+
+
+def changed_files(ref, cwd='.'):
+    """
+    Return the files changed in the working tree of the repository
+    containing ``cwd`` since ``ref`` (or rather, since the commit that
+    ``HEAD`` and ``ref`` have in common), for example ``origin/master``.
+
+    Files which were added, modified or renamed are included, along with
+    untracked files that aren't ignored, but not deleted ones. The result
+    maps the path of each file, relative to ``cwd``, to the list of
+    ``(first, last)`` line ranges changed in it, or to ``None`` if the
+    whole file is new to git.
+    """
+    root = _git(['rev-parse', '--show-toplevel'], cwd).decode('utf-8')
+    root = root.rstrip('\n')
+
+    base = _merge_base(ref, cwd)
+
+    diff = ['diff', '--no-ext-diff', '--find-renames', '--diff-filter=AMR']
+
+    names = _git(diff + ['--name-only', '-z', base, '--'], cwd)
+    hunks = _hunks(_git(['-c', 'core.quotepath=off'] + diff + [
+        '--no-color', '--unified=0', '--src-prefix=a/', '--dst-prefix=b/',
+        base, '--'
+    ], cwd))
+
+    # Renamed files without any other changes have no hunks.
+    changed = {
+        os.path.join(root, name): hunks.get(name, [])
+        for name in names.decode('utf-8').split('\0') if name
+    }
+
+    untracked = _git([
+        'ls-files', '-z', '--full-name', '--others', '--exclude-standard'
+    ], root)
+
+    for name in untracked.decode('utf-8').split('\0'):
+        if name:
+            changed[os.path.join(root, name)] = None
+
+    cwd = os.path.realpath(cwd)
+    return {
+        os.path.relpath(path, cwd): lines
+        for path, lines in changed.items()
+    }
+
+
+def _hunks(diff):
+    """
+    Return the ``(first, last)`` ranges of the lines added in each file
+    of ``diff``, the output of ``git diff --unified=0``.
+
+    >>> _hunks(b'''diff --git a/x.sql b/x.sql
+    ... --- a/x.sql
+    ... +++ b/x.sql
+    ... @@ -1 +1 @@
+    ... -a
+    ... +b
+    ... @@ -5,0 +6,2 @@
+    ... +c
+    ... +d
+    ... @@ -9,2 +10,0 @@
+    ... ''')
+    {'x.sql': [(1, 1), (6, 7)]}
+    """
+    hunks = {}
+    lines = None
+    previous = b''
+
+    for line in diff.splitlines():
+        # An added line starting with "++ " looks like a header too.
+        if line.startswith(b'+++ ') and previous.startswith(b'--- '):
+            lines = hunks.setdefault(_unquote(line[4:])[len('b/'):], [])
+
+        previous = line
+
+        match = _HUNK.match(line)
+        if match and lines is not None:
+            first = int(match.group(1))
+            count = int(match.group(2) or 1)
+
+            # Hunks only removing lines have nothing to report.
+            if count:
+                lines.append((first, first + count - 1))
+
+    return hunks
+
+
+def _resolve(ref, cwd):
+    commit = _git(['rev-parse', '--verify', '--quiet', ref + '^{commit}'],
+                  cwd, error='unknown revision "%s"' % ref)
+
+    return commit.decode('utf-8').strip()
+
+
+def _merge_base(ref, cwd):
+    commit = _resolve(ref, cwd)
+
+    try:
+        base = _git(['merge-base', commit, 'HEAD'], cwd)
+    except GitException:
+        # No history in common (or no commits yet), so compare with the
+        # revision itself.
+        return commit
+
+    return base.decode('utf-8').strip()
+
+
+def _git(args, cwd, error=None):
+    try:
+        result = subprocess.run(
+            ['git'] + args, cwd=cwd, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+    except OSError as exc:
+        raise GitException('could not run git: %s' % exc)
+
+    if result.returncode != 0:
+        message = result.stderr.decode('utf-8', 'replace').strip()
+        raise GitException(error or message or 'git %s failed' % args[0])
+
+    return result.stdout
+
+
+def _unquote(name):
+    """
+    Return the file name ``name`` from ``git diff`` output, which is
+    quoted if it contains unusual characters.
+
+    >>> _unquote(b'b/plain.sql')
+    'b/plain.sql'
+    >>> _unquote(b'"b/tab\\\\there.sql"')
+    'b/tab\\there.sql'
+    """
+    if name.startswith(b'"') and name.endswith(b'"'):
+        name = codecs.escape_decode(name[1:-1])[0]
+
+    return name.decode('utf-8')
+
+
+class Revision:
+    """
+    The files of the git revision ``rev`` (of the repository containing
+    ``cwd``), read straight from the object database without checking
+    them out. Every file is read through the same ``git cat-file
+    --batch`` process, which is stopped by :meth:`close`.
+
+    File names are relative to ``cwd``, as with ``git ls-tree``.
+    """
+    def __init__(self, rev, cwd='.'):
+        self.rev = rev
+        self.cwd = cwd
+
+        # Resolved once, in case the revision moves while being read.
+        self.commit = _resolve(rev, cwd)
+
+        # file name -> blob id, for the files listed so far.
+        self._blobs = {}
+
+        self._process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def files(self, paths=('.',)):
+        """
+        Return the names of the files in the revision which are, or are
+        in directories, named in ``paths``.
+
+        Raises :class:`GitException` if one of ``paths`` doesn't exist
+        in the revision.
+        """
+        tree = _git(['ls-tree', '-r', '-z', self.commit, '--'] + list(paths),
+                    self.cwd)
+
+        names = []
+
+        for entry in tree.decode('utf-8').split('\0'):
+            if not entry:
+                continue
+
+            info, name = entry.split('\t', 1)
+            mode, kind, blob = info.split(' ')
+
+            # Submodules and symbolic links aren't SQL files.
+            if kind != 'blob' or mode == '120000':
+                continue
+
+            self._blobs[name] = blob
+            names.append(name)
+
+        for path in paths:
+            path = os.path.normpath(path)
+            prefix = '' if path == '.' else path + os.sep
+
+            if not any(n == path or n.startswith(prefix) for n in names):
+                raise GitException('%s: no such file or directory in %s' %
+                                   (path, self.rev))
+
+        return names
+
+    def read(self, name):
+        """
+        Return the contents of the file ``name``, as returned by
+        :meth:`files`, as a string.
+        """
+        if self._process is None:
+            try:
+                self._process = subprocess.Popen(
+                    ['git', 'cat-file', '--batch'], cwd=self.cwd,
+                    stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            except OSError as exc:
+                raise GitException('could not run git: %s' % exc)
+
+        self._process.stdin.write(self._blobs[name].encode('ascii') + b'\n')
+        self._process.stdin.flush()
+
+        # "<object> <type> <size>", or "<object> missing"
+        header = self._process.stdout.readline().split()
+        if len(header) != 3:
+            raise GitException('%s: could not read from %s' %
+                               (name, self.rev))
+
+        contents = self._process.stdout.read(int(header[2]))
+
+        # Every object is followed by a newline.
+        self._process.stdout.read(1)
+
+        return contents.decode('utf-8')
+
+    def close(self):
+        """Stop the ``git cat-file`` process, if it was started."""
+        if self._process is not None:
+            self._process.stdin.close()
+            self._process.wait()
+            self._process.stdout.close()
+            self._process = None
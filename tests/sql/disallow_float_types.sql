@@ -1,7 +1,8 @@
 -- squabble-enable:DisallowFloatTypes
--- >>> {"line": 8,  "column": 2, "message_id": "LossyFloatType"}
 -- >>> {"line": 9,  "column": 2, "message_id": "LossyFloatType"}
--- >>> {"line": 15, "column": 2, "message_id": "LossyFloatType"}
+-- >>> {"line": 10, "column": 2, "message_id": "LossyFloatType"}
+-- >>> {"line": 16, "column": 2, "message_id": "LossyFloatType"}
+-- >>> {"line": 18, "column": 24, "message_id": "LossyFloatType"}
 
 CREATE TABLE foo (
   -- should not pass
@@ -13,3 +14,5 @@ CREATE TABLE foo (
 
 ALTER TABLE foo ADD COLUMN
   bar FLOAT;
+
+SELECT * FROM f() AS t (a real, b int);
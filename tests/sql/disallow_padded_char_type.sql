@@ -1,8 +1,9 @@
 -- squabble-enable:DisallowPaddedCharType
--- >>> {"line": 13, "column": 2, "message_id": "WastefulCharType"}
 -- >>> {"line": 14, "column": 2, "message_id": "WastefulCharType"}
--- >>> {"line": 22, "column": 13, "message_id": "WastefulCharType"}
+-- >>> {"line": 15, "column": 2, "message_id": "WastefulCharType"}
 -- >>> {"line": 23, "column": 13, "message_id": "WastefulCharType"}
+-- >>> {"line": 24, "column": 13, "message_id": "WastefulCharType"}
+-- >>> {"line": 26, "column": 35, "message_id": "WastefulCharType"}
 
 
 CREATE TABLE foo (
@@ -21,3 +22,5 @@ ALTER TABLE foo
 
   ADD COLUMN bad char,
   ADD COLUMN bad char(3);
+
+SELECT * FROM f() AS t (good text, bad char(3));
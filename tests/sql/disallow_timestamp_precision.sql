@@ -1,10 +1,11 @@
 -- squabble-enable:DisallowTimestampPrecision allow_precision_greater_than=5
--- >>> {"line": 24, "column": 6, "message_id": "NoTimestampPrecision"}
 -- >>> {"line": 25, "column": 6, "message_id": "NoTimestampPrecision"}
 -- >>> {"line": 26, "column": 6, "message_id": "NoTimestampPrecision"}
--- >>> {"line": 28, "column": 6, "message_id": "NoTimestampPrecision"}
+-- >>> {"line": 27, "column": 6, "message_id": "NoTimestampPrecision"}
 -- >>> {"line": 29, "column": 6, "message_id": "NoTimestampPrecision"}
 -- >>> {"line": 30, "column": 6, "message_id": "NoTimestampPrecision"}
+-- >>> {"line": 31, "column": 6, "message_id": "NoTimestampPrecision"}
+-- >>> {"line": 34, "column": 28, "message_id": "NoTimestampPrecision"}
 
 CREATE TABLE foo (
   good timestamp,
@@ -29,3 +30,5 @@ CREATE TABLE foo (
   bad time(0) with time zone,
   bad time(0) without time zone
 );
+
+SELECT * FROM f() AS t (bad timestamp(0));
@@ -0,0 +1,25 @@
+-- squabble-enable:RequireConcurrentIndex
+-- squabble-enable:DisallowFloatTypes
+-- >>> {"line": 18, "column": 27, "message_id": "LossyFloatType"}
+-- >>> {"line": 25, "column": 26, "message_id": "IndexNotConcurrent"}
+
+-- Trimmed down `pg_dump` output: data following COPY is not SQL.
+
+SET statement_timeout = 0;
+SELECT pg_catalog.set_config('search_path', '', false);
+
+COPY public.users (id, name) FROM stdin;
+1	Robert'); DROP TABLE students;--
+2	\N
+\.
+
+\connect other
+
+CREATE TABLE public.items (price real);
+
+COPY public.items (price) FROM stdin;
+1.5
+\.
+
+-- Not okay, users was not created in this file
+CREATE INDEX users_idx ON public.users (name);
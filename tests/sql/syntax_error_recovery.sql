@@ -0,0 +1,13 @@
+-- squabble-enable:RequireConcurrentIndex
+-- >>> {"line": 8, "column": 14, "severity": "CRITICAL"}
+-- >>> {"line": 13, "column": 13, "severity": "CRITICAL"}
+-- >>> {"line": 11, "column": 16, "message_id": "IndexNotConcurrent"}
+
+CREATE TABLE foo (id int);
+
+CREATE TABLE (id int);
+
+-- Still linted, and foo is still known to be new.
+CREATE INDEX ON bar (id);
+CREATE INDEX ON foo (id);
+SELECT FROM FROM foo;
@@ -0,0 +1,263 @@
+import glob
+import os
+import os.path
+from unittest.mock import patch
+
+import pytest
+
+import squabble.cli
+from squabble import cache, config, lint, rule
+
+from tests.test_lint import _summarize
+
+SQL_FILES = sorted(glob.glob('tests/sql/*.sql'))
+
+
+def setup_module(_mod):
+    rule.load_rules(plugin_paths=[])
+
+
+@pytest.fixture
+def result_cache(tmpdir):
+    return cache.ResultCache(str(tmpdir))
+
+
+def test_returns_cached_issues(result_cache):
+    base = config.get_base_config(['full'])
+
+    def lint_all():
+        linter = lint.Linter(base, result_cache)
+        issues = []
+
+        for file_name in SQL_FILES:
+            with open(file_name, 'r') as fp:
+                issues.extend(linter.lint(fp.read(), file_name))
+
+        return [_summarize(i) + (i.file,) for i in issues]
+
+    def lint_patched():
+        # Statements are linted by ``stream``, and even when all of
+        # their results are cached, the file's are put together by
+        # ``merge``.
+        with patch.object(lint.Session, 'stream', autospec=True,
+                          side_effect=lint.Session.stream) as stream, \
+                patch.object(lint.Session, 'merge', autospec=True,
+                             side_effect=lint.Session.merge) as merge, \
+                patch('squabble.lint._parse_statement',
+                      side_effect=lint._parse_statement) as parse:
+            issues = lint_all()
+
+        return issues, stream.called or merge.called or parse.called
+
+    # Linting the files goes through what's patched...
+    expected, linted = lint_patched()
+    assert linted
+
+    # ...which is skipped when the results of each file are cached.
+    issues, linted = lint_patched()
+    assert issues == expected
+    assert not linted
+
+
+def test_reuses_parse_trees_across_configs(result_cache):
+    with open('tests/sql/syntax_error_recovery.sql', 'r') as fp:
+        contents = fp.read()
+
+    base = config.get_base_config()
+    full = config.get_base_config(['full'])
+
+    lint.Linter(base, result_cache).lint(contents, 'file.sql')
+
+    expected = lint.check_file(full, 'file.sql', contents)
+
+    with patch('pglast.parse_sql') as parse_sql:
+        issues = lint.Linter(full, result_cache).lint(contents, 'file.sql')
+
+    parse_sql.assert_not_called()
+
+    assert any(i.severity == lint.Severity.CRITICAL for i in issues)
+    assert [_summarize(i) for i in issues] == \
+        [_summarize(i) for i in expected]
+
+
+@pytest.mark.parametrize('file_name', SQL_FILES)
+def test_statement_results_match_check_file(result_cache, file_name):
+    with open(file_name, 'r') as fp:
+        contents = fp.read()
+
+    base = config.get_base_config(['full'])
+    cfg = config.apply_file_config(base, contents)
+    if cfg is None:
+        return
+
+    # Results of the statements are reused after something is inserted
+    # before them.
+    for prefix in ['', '-- ü\nCREATE TABLE x (id int primary key);\n']:
+        issues = lint.Linter(base, result_cache).lint(
+            prefix + contents, file_name)
+        expected = lint.check_file(cfg, file_name, prefix + contents)
+
+        assert [_summarize(i) for i in issues] == \
+            [_summarize(i) for i in expected]
+
+
+def test_only_changed_statements_are_linted(result_cache):
+    base = config.get_base_config(['full'])
+    statements = ['CREATE TABLE t%d (id int, u_id int);' % i
+                  for i in range(10)]
+
+    linter = lint.Linter(base, result_cache)
+    linter.lint('\n'.join(statements), 'file.sql')
+
+    statements[4] = 'CREATE TABLE changed (x real);'
+
+    with patch('squabble.lint._parse_statement',
+               side_effect=lint._parse_statement) as parse:
+        issues = linter.lint('\n'.join(statements), 'file.sql')
+
+    assert [c[0][0].sql.strip() for c in parse.call_args_list] == \
+        [statements[4]]
+
+    expected = lint.check_file(base, 'file.sql', '\n'.join(statements))
+    assert [_summarize(i) for i in issues] == \
+        [_summarize(i) for i in expected]
+
+
+def test_key_depends_on_contents_and_config(result_cache, tmpdir):
+    base = config.get_base_config()
+    full = config.get_base_config(['full'])
+
+    key = result_cache.key('SELECT 1;', base)
+
+    assert key == result_cache.key(b'SELECT 1;', base)
+    assert key != result_cache.key('SELECT 2;', base)
+    assert key != result_cache.key('SELECT 1;', full)
+
+    plugin_dir = tmpdir.mkdir('plugins')
+    plugin_dir.join('plugin.py').write('# v1')
+    plugin_cache = cache.ResultCache(str(tmpdir), [str(plugin_dir)])
+
+    assert plugin_cache.key('SELECT 1;', base) != key
+
+    plugin_dir.join('plugin.py').write('# v2')
+    changed_cache = cache.ResultCache(str(tmpdir), [str(plugin_dir)])
+
+    assert changed_cache.key('SELECT 1;', base) != \
+        plugin_cache.key('SELECT 1;', base)
+
+
+def test_ignores_corrupt_entries(result_cache):
+    key = result_cache.key('SELECT 1;', config.get_base_config())
+    result_cache.put(key, [])
+
+    with open(result_cache._path('results', key), 'wb') as fp:
+        fp.write(b'garbage')
+
+    assert result_cache.get(key, 'file.sql') is None
+
+
+def test_prune_removes_least_recently_used(result_cache):
+    base = config.get_base_config()
+    keys = [result_cache.key('SELECT %d;' % i, base) for i in range(4)]
+
+    for i, key in enumerate(keys):
+        result_cache.put(key, [])
+        os.utime(result_cache._path('results', key), (i, i))
+
+    # Reading an entry marks it as the most recently used.
+    assert result_cache.get(keys[0], 'file.sql') == []
+
+    size = os.path.getsize(result_cache._path('results', keys[0]))
+    result_cache.max_size = size * 2
+    result_cache.prune()
+
+    remaining = [
+        k for k in keys
+        if os.path.exists(result_cache._path('results', k))
+    ]
+    assert remaining == [keys[0], keys[3]]
+
+
+def test_prune_only_looks_through_cache_when_too_large(result_cache):
+    base = config.get_base_config()
+    keys = [result_cache.key('SELECT %d;' % i, base) for i in range(4)]
+
+    # The size of the cache isn't known until it's first looked through.
+    result_cache.put(keys[0], [])
+    result_cache.prune()
+
+    size = os.path.getsize(result_cache._path('results', keys[0]))
+    result_cache.max_size = size * 3
+
+    for key in keys[1:3]:
+        result_cache.put(key, [])
+
+    with patch('glob.iglob', wraps=glob.iglob) as iglob:
+        result_cache.prune()
+
+    assert not iglob.called
+
+    result_cache.put(keys[3], [])
+
+    with patch('glob.iglob', wraps=glob.iglob) as iglob:
+        result_cache.prune()
+
+    assert iglob.called
+    assert sum(
+        os.path.exists(result_cache._path('results', k)) for k in keys
+    ) == 3
+
+    # Back to the size of what's left.
+    with open(os.path.join(result_cache.directory, 'size'), 'rb') as fp:
+        assert int(fp.read()) == size * 3
+
+
+def test_prune_skips_entries_being_written(result_cache):
+    base = config.get_base_config()
+    key = result_cache.key('SELECT 1;', base)
+    result_cache.put(key, [])
+
+    directory = os.path.dirname(result_cache._path('results', key))
+    writing = os.path.join(directory, 'writing.tmp')
+    stale = os.path.join(directory, 'stale.tmp')
+
+    for path in [writing, stale]:
+        with open(path, 'wb') as fp:
+            fp.write(b'x' * 100)
+
+    os.utime(stale, (0, 0))
+
+    result_cache.max_size = 0
+    result_cache.prune()
+
+    assert os.listdir(directory) == ['writing.tmp']
+
+
+def test_put_tolerates_temporary_file_removed(result_cache):
+    base = config.get_base_config()
+    key = result_cache.key('SELECT 1;', base)
+
+    def remove_and_replace(src, dst):
+        os.unlink(src)
+        return os.rename(src, dst)
+
+    with patch('os.replace', side_effect=remove_and_replace):
+        result_cache.put(key, [])
+
+    assert result_cache.get(key, 'file.sql') is None
+    assert os.listdir(os.path.dirname(result_cache._path('results', key))) \
+        == []
+
+
+@pytest.mark.parametrize('stream,jobs', [(False, 1), (True, 1), (False, 2)])
+def test_cli_linter_matches_uncached(capsys, result_cache, stream, jobs):
+    base_cfg = config.get_base_config()
+
+    assert squabble.cli.run_linter(base_cfg, SQL_FILES, expanded=False) == 1
+    uncached = capsys.readouterr().err
+
+    for _ in range(2):
+        assert squabble.cli.run_linter(
+            base_cfg, SQL_FILES, expanded=False, stream=stream, jobs=jobs,
+            cache=result_cache) == 1
+        assert capsys.readouterr().err == uncached
@@ -1,9 +1,11 @@
 import copy
+import json
 from unittest.mock import patch
 
 import pytest
 
-from squabble import config
+import squabble.cli
+from squabble import config, rule
 
 
 def test_extract_file_rules():
@@ -117,3 +119,64 @@ def test_discover_config_location(mock_exists, mock_expand, mock_vcs):
     mock_exists.assert_any_call('./.squabblerc')
     mock_exists.assert_any_call('gitrepo/.squabblerc')
     mock_exists.assert_any_call('user/.squabblerc')
+
+
+@pytest.fixture
+def nested(tmpdir):
+    tmpdir.join('svc', '.squabblerc').ensure().write(json.dumps({
+        'rules': {'A': {'y': 2}, 'B': {}},
+    }))
+    tmpdir.join('svc', 'legacy', '.squabblerc').ensure().write(json.dumps({
+        'rules': {'A': False},
+    }))
+
+    base = config.Config(reporter='', plugins=[], rules={'A': {'x': 1}})
+    return tmpdir, config.DirectoryConfigs(base, str(tmpdir))
+
+
+def test_directory_configs(nested):
+    root, configs = nested
+
+    def rules(*path):
+        return configs.for_file(str(root.join(*path))).rules
+
+    assert rules('a.sql') == {'A': {'x': 1}}
+    assert rules('svc', 'a.sql') == {'A': {'x': 1, 'y': 2}, 'B': {}}
+    assert rules('svc', 'legacy', 'x', 'a.sql') == {'B': {}}
+    assert configs.for_file('stdin') is configs.base
+    assert configs.for_file('/elsewhere/a.sql') is configs.base
+
+    # Shared by every file below the directory.
+    assert configs.for_file(str(root.join('svc', 'b.sql'))) is \
+        configs.for_file(str(root.join('svc', 'sub', 'c.sql')))
+
+
+def test_directory_configs_invalid(nested):
+    root, configs = nested
+    root.join('bad', '.squabblerc').ensure().write('{"rules": ')
+
+    with pytest.raises(config.InvalidConfigException):
+        configs.for_file(str(root.join('bad', 'a.sql')))
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_cli_uses_directory_configs(tmpdir, capsys, jobs):
+    rule.load_rules(plugin_paths=[])
+
+    for directory in ['db', 'svc']:
+        tmpdir.join(directory, 'a.sql').ensure().write(
+            'CREATE TABLE t (x real);\n')
+
+    tmpdir.join('svc', '.squabblerc').write(json.dumps({
+        'rules': {'DisallowFloatTypes': {}},
+    }))
+
+    base = config.get_base_config()
+    configs = config.DirectoryConfigs(base, str(tmpdir))
+
+    assert squabble.cli.run_linter(
+        base, [str(tmpdir)], False, jobs=jobs, configs=configs) == 1
+
+    output = capsys.readouterr().err
+    assert 'svc/a.sql' in output
+    assert 'db/a.sql' not in output
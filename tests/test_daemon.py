@@ -0,0 +1,180 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+import squabble
+from squabble import daemon
+
+
+@pytest.fixture
+def project(tmpdir):
+    tmpdir.join('.squabblerc').write('{"rules": {"DisallowNotIn": {}}}')
+    tmpdir.join('a.sql').write('SELECT 1 WHERE 1 NOT IN (2);\n')
+
+    return tmpdir
+
+
+def _request(project, argv, stdin=None, **kwargs):
+    return dict({
+        'version': squabble.__version__,
+        'argv': argv,
+        'cwd': str(project),
+        'env': dict(os.environ),
+        'stdin': stdin,
+    }, **kwargs)
+
+
+def _touch(path, contents):
+    # Make sure the stamp changes, however coarse the file system's
+    # modification times are.
+    mtime = path.mtime() + 10
+    path.write(contents)
+    path.setmtime(mtime)
+
+
+def test_handle(project):
+    session = daemon.Session()
+    cwd = os.getcwd()
+
+    response = daemon.handle(_request(project, ['a.sql']), session)
+
+    assert response['status'] == 1
+    assert 'a.sql:1:' in response['stderr']
+    assert os.getcwd() == cwd
+
+    response = daemon.handle(
+        _request(project, ['-'], stdin='SELECT 1;'), session)
+
+    assert response == {'status': 0, 'stdout': '', 'stderr': ''}
+
+    response = daemon.handle(_request(project, ['--jobs=x']), session)
+
+    assert response['status'] == 1
+    assert '--jobs must be a number' in response['stderr']
+
+
+def test_handle_reuses_what_was_loaded(project):
+    session = daemon.Session()
+    request = _request(project, ['a.sql'])
+
+    daemon.handle(request, session)
+    linters = dict(session._linters)
+
+    daemon.handle(request, session)
+    assert session._linters == linters
+
+    _touch(project.join('.squabblerc'), '{"rules": {}}')
+
+    response = daemon.handle(request, session)
+    assert response['status'] == 0
+    assert session._linters != linters
+
+
+def test_handle_reloads_directory_configs(project):
+    session = daemon.Session()
+    project.join('db', 'b.sql').ensure().write('SELECT 1 NOT IN (2);\n')
+    request = _request(project, ['db'])
+
+    assert daemon.handle(request, session)['status'] == 1
+
+    project.join('db', '.squabblerc').write(
+        '{"rules": {"DisallowNotIn": false}}')
+
+    assert daemon.handle(request, session)['status'] == 0
+
+
+def test_handle_restarts(project):
+    plugins = project.join('plugins').ensure(dir=True)
+    plugins.join('rules.py').write(
+        'from squabble.rules import BaseRule\n'
+        'class DaemonPluginRule(BaseRule):\n'
+        '    """Does nothing."""\n'
+        '    def enable(self, ctx, config):\n'
+        '        pass\n')
+
+    project.join('.squabblerc').write(
+        '{"plugins": ["plugins"], "rules": {"DaemonPluginRule": {}}}')
+
+    session = daemon.Session()
+    request = _request(project, ['a.sql'])
+
+    assert daemon.handle(request, session)['status'] == 0
+
+    _touch(plugins.join('rules.py'), plugins.join('rules.py').read())
+    assert daemon.handle(request, session) == {'restart': True}
+
+    request['version'] = 'other'
+    assert daemon.handle(request, daemon.Session()) == {'restart': True}
+
+
+@pytest.fixture
+def socket_path(tmpdir_factory, monkeypatch):
+    path = str(tmpdir_factory.mktemp('daemon').join('squabble.sock'))
+    monkeypatch.setenv('SQUABBLE_SOCKET', path)
+
+    return path
+
+
+def _lint(project, args):
+    command = [sys.executable, '-m', 'squabble']
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+
+    return subprocess.run(
+        command + args + ['a.sql', '-'], cwd=str(project), env=env,
+        input=b'SELECT 1 NOT IN (2);', stderr=subprocess.PIPE, timeout=30)
+
+
+def test_client(project, socket_path):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'squabble', 'daemon'], env=env)
+
+    try:
+        for _ in range(100):
+            if os.path.exists(socket_path):
+                break
+            time.sleep(0.1)
+
+        client = _lint(project, ['--daemon'])
+        local = _lint(project, [])
+
+        assert client.returncode == local.returncode == 1
+        assert client.stderr == local.stderr
+        assert b'stdin:1:' in client.stderr
+
+        # Other runs are turned away while the daemon waits for this one.
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+
+            started = time.monotonic()
+            busy = _lint(project, ['--daemon'])
+
+            assert time.monotonic() - started < daemon._RESPONSE_TIMEOUT
+            assert busy.returncode == 1
+            assert busy.stderr == local.stderr
+
+    finally:
+        server.terminate()
+        server.wait(10)
+
+    assert not os.path.exists(socket_path)
+
+
+def test_client_times_out(project, socket_path, monkeypatch):
+    monkeypatch.setattr(daemon, '_RESPONSE_TIMEOUT', 0.1)
+    monkeypatch.chdir(str(project))
+
+    args = {'PATHS': ['a.sql'], '--rev': None, '--changed-since': None,
+            '--list-presets': False, '--list-rules': False,
+            '--show-rule': None, '--explain': None}
+
+    # Connections are never accepted, so nothing is ever answered.
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        server.listen(1)
+
+        assert daemon.run(['--daemon', 'a.sql'], args) is None
@@ -0,0 +1,90 @@
+import os
+import os.path
+from unittest.mock import patch
+
+import pytest
+
+import squabble.cli
+from squabble import config, rule
+from squabble.discovery import FileFinder
+
+
+def setup_module(_mod):
+    rule.load_rules(plugin_paths=[])
+
+
+@pytest.fixture
+def tree(tmpdir):
+    for name in [
+            'a.sql', 'b.txt', '.hidden.sql',
+            'db/c.sql', 'db/legacy/d.sql', 'db/build/e.sql',
+            'vendor/f.sql', 'node_modules/x/g.sql', '.git/HEAD',
+    ]:
+        tmpdir.join(name).ensure().write('SELECT 1;\n')
+
+    tmpdir.join('.gitignore').write('node_modules/\n# comment\nbuild\n')
+    tmpdir.join('db', '.gitignore').write('*.sql\n!c.sql\n')
+
+    return tmpdir
+
+
+def _relative(tree, paths):
+    return [os.path.relpath(p, str(tree)) for p in paths]
+
+
+def test_find_honours_gitignore(tree):
+    finder = FileFinder(root=str(tree))
+    found = finder.find([str(tree)])
+
+    assert _relative(tree, found) == ['a.sql', 'db/c.sql', 'vendor/f.sql']
+    assert finder.missing == []
+
+
+@pytest.mark.parametrize('include,exclude,expected', [
+    (['*.sql'], ['vendor'], ['a.sql', 'db/c.sql']),
+    (['*.sql'], ['/db/'], ['a.sql', 'vendor/f.sql']),
+    (['*.txt', 'vendor/**/*.sql'], [], ['b.txt', 'vendor/f.sql']),
+])
+def test_find_include_exclude(tree, include, exclude, expected):
+    finder = FileFinder(include, exclude, root=str(tree))
+
+    assert _relative(tree, finder.find([str(tree)])) == expected
+
+
+def test_find_without_gitignore(tree):
+    finder = FileFinder(exclude=['node_modules'], root=str(tree),
+                        gitignore=False)
+
+    assert _relative(tree, finder.find([str(tree)])) == [
+        'a.sql', 'db/c.sql', 'db/build/e.sql', 'db/legacy/d.sql',
+        'vendor/f.sql',
+    ]
+
+
+def test_find_skips_excluded_directories(tree):
+    finder = FileFinder(exclude=['vendor/'], root=str(tree))
+
+    with patch('os.scandir', wraps=os.scandir) as scandir:
+        list(finder.find([str(tree)]))
+
+    scanned = {os.path.basename(str(c[0][0])) for c in scandir.call_args_list}
+    assert 'vendor' not in scanned
+    assert 'node_modules' not in scanned
+
+
+def test_find_named_and_missing_paths(tree):
+    finder = FileFinder(exclude=['*.txt'], root=str(tree))
+    paths = [str(tree.join('b.txt')), str(tree.join('nope')), '-']
+
+    assert _relative(tree, finder.find(paths[:2])) == ['b.txt']
+    assert finder.missing == [paths[1]]
+    assert list(finder.find(['-'])) == ['-']
+
+
+def test_cli_reports_missing_paths(tree, capsys):
+    base = config.get_base_config()._replace(rules={})
+    status = squabble.cli.run_linter(
+        base, [str(tree.join('a.sql')), str(tree.join('nope.sql'))], False)
+
+    assert status == 1
+    assert 'nope.sql: no such file or directory' in capsys.readouterr().err
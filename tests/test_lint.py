@@ -0,0 +1,479 @@
+"""
+Tests for the traversal in ``lint.Context.traverse``: differential tests
+checking it against the reference implementation, which re-walks the
+subtree of every node with a hook, and benchmarks on synthetic trees.
+"""
+
+import glob
+import sys
+import time
+from unittest.mock import Mock, patch
+
+import pglast
+import pytest
+from pglast.enums import A_Expr_Kind, BoolExprType, SubLinkType
+
+from squabble import config, lint, rule
+from squabble.message import Message
+from squabble.rules import BaseRule
+from squabble.rules.disallow_not_in import DisallowNotIn
+from squabble.rules.require_columns import RequireColumns
+from squabble.splitter import split_statements
+
+SQL_FILES = sorted(glob.glob('tests/sql/*.sql'))
+
+# Exercises several nested registrations at once (CreateStmt ->
+# ColumnDef/Constraint, BoolExpr -> SubLink) as well as exit hooks
+# that depend on state from earlier statements.
+MIXED_SQL = '''
+CREATE TABLE a (a_id int, f real, c char(3), PRIMARY KEY (a_id));
+CREATE TABLE b (b_id int REFERENCES a, x_id int, t time with time zone);
+CREATE TABLE c (c_id int);
+ALTER TABLE b ADD FOREIGN KEY (x_id) REFERENCES x(id);
+ALTER TABLE c ADD COLUMN y_id int DEFAULT 1, ALTER COLUMN c_id TYPE bigint;
+CREATE INDEX on c(c_id);
+SELECT * FROM a
+WHERE NOT (a_id IN (SELECT 1) AND NOT (f NOT IN (1, 2)))
+  AND NOT EXISTS (SELECT CURRENT_TIME WHERE a_id NOT IN (SELECT 2));
+'''
+
+
+def setup_module(_mod):
+    rule.load_rules(plugin_paths=[])
+
+
+def _full_config(contents, **extra_rules):
+    base = config.get_base_config(['full'])
+    base = base._replace(rules={**base.rules, **extra_rules})
+    return config.apply_file_config(base, contents)
+
+
+def _summarize(issue):
+    node = issue.node.parse_tree if issue.node else None
+    message = issue.message.asdict() if issue.message else None
+
+    return (message, issue.message_text, issue.severity, issue.location,
+            node)
+
+
+def _lint_nested(cfg, contents):
+    rules = lint._configure_rules(cfg.rules)
+    session = lint.Session(rules, contents, 'file.sql')
+
+    ctx = lint.Context(session)
+    for r, options in rules:
+        r.enable(ctx, options)
+
+    tree = []
+    for stmt in split_statements(contents.encode('utf-8').splitlines(True)):
+        try:
+            tree.extend(lint._parse_statement(stmt))
+        except pglast.parser.ParseError:
+            pass
+
+    ctx._traverse_nested(tree)
+    session._merge(ctx)
+
+    return lint._ordered_issues(session._issues)
+
+
+def _lint_both(cfg, contents):
+    # Syntax errors aren't reported by the reference implementation.
+    single = [i for i in lint.check_file(cfg, 'file.sql', contents)
+              if i.severity != lint.Severity.CRITICAL]
+    nested = _lint_nested(cfg, contents)
+
+    return [_summarize(i) for i in single], [_summarize(i) for i in nested]
+
+
+@pytest.mark.parametrize('file_name', SQL_FILES)
+def test_matches_nested_traversal(file_name):
+    with open(file_name, 'r') as fp:
+        contents = fp.read()
+
+    for cfg in [config.apply_file_config(config.get_base_config(), contents),
+                _full_config(contents)]:
+        single, nested = _lint_both(cfg, contents)
+        assert single == nested
+
+
+def test_matches_nested_traversal_mixed_rules():
+    cfg = _full_config(MIXED_SQL, RequireColumns={
+        'required': ['created_at,timestamp', 'a_id']
+    })
+    single, nested = _lint_both(cfg, MIXED_SQL)
+
+    assert single
+    assert single == nested
+
+
+@pytest.mark.parametrize('file_name', SQL_FILES)
+def test_matches_nested_traversal_statement_kinds(file_name):
+    with open(file_name, 'r') as fp:
+        contents = fp.read()
+
+    cfg = _full_config(contents)
+    cfg = cfg._replace(rules={
+        name: options for name, options in cfg.rules.items()
+        if rule.Registry.get_class(name).STATEMENT_KINDS is not None
+    })
+
+    assert cfg.rules
+    single, nested = _lint_both(cfg, contents)
+    assert single == nested
+
+
+def test_skips_statements_of_other_kinds():
+    seen = []
+
+    ctx = lint.Context(session=None)
+    ctx.register('CreateStmt', lambda _c, n: seen.append(n.node_tag))
+    ctx.register('SelectStmt', lambda _c, n: seen.append(n.node_tag))
+    ctx.traverse(pglast.parse_sql('SELECT 1; CREATE TABLE t (); SELECT 2'),
+                 statement_kinds={lint.StatementKind.DDL})
+
+    assert seen == ['CreateStmt']
+
+
+def test_visits_each_node_once():
+    seen = []
+
+    ctx = lint.Context(session=None)
+    ctx.register('ColumnDef', lambda _c, n: seen.append(n.colname.value))
+
+    def create_stmt(child_ctx, _node):
+        child_ctx.register('ColumnDef', lambda _c, _n: seen.append('child'))
+
+    ctx.register('CreateStmt', create_stmt)
+    ctx.traverse(lint._parse_string('CREATE TABLE t (a int, b int);'))
+
+    assert seen == ['child', 'a', 'child', 'b']
+
+
+def test_outer_hooks_registered_late():
+    seen = []
+
+    ctx = lint.Context(session=None)
+
+    def inner(_child_ctx, _node):
+        seen.append('inner')
+        ctx.register('TypeCast', lambda _c, _n: seen.append('outer'))
+
+    def func_call(child_ctx, _node):
+        child_ctx.register('TypeCast', inner)
+
+    ctx.register('FuncCall', func_call)
+    ctx.traverse(pglast.parse_sql('SELECT f(1::int), 2::int'))
+
+    # The cast after the function call is only watched by the hook
+    # registered on the root context from inside the call.
+    assert seen == ['inner', 'outer']
+
+
+def test_exit_hook_ordering():
+    events = []
+
+    ctx = lint.Context(session=None)
+
+    def create_stmt(child_ctx, node):
+        name = node.relation.relname.value
+        child_ctx.register_exit(lambda _c: events.append('exit ' + name))
+
+    ctx.register('CreateStmt', create_stmt)
+    ctx.register_exit(lambda _c: events.append('exit root'))
+    ctx.traverse(lint._parse_string('CREATE TABLE a (); CREATE TABLE b ();'))
+
+    assert events == ['exit a', 'exit b', 'exit root']
+
+
+def _nested_not_in(depth):
+    """
+    Build the parse tree of ``SELECT NOT (NOT (... (x IN (SELECT 1))))``
+    directly, since it would be too deep for the parser to return.
+    """
+    expr = {'SubLink': {
+        'subLinkType': SubLinkType.ANY_SUBLINK,
+        'testexpr': {'ColumnRef': {'fields': [{'String': {'str': 'x'}}]}},
+        'subselect': {'SelectStmt': {'targetList': [
+            {'ResTarget': {'val': {'A_Const': {'val': {'Integer': {
+                'ival': 1}}}}}}
+        ]}}
+    }}
+
+    for _ in range(depth):
+        expr = {'BoolExpr': {'boolop': BoolExprType.NOT_EXPR, 'args': [expr]}}
+
+    return pglast.Node([{'RawStmt': {'stmt': {'SelectStmt': {
+        'targetList': [{'ResTarget': {'val': expr}}]
+    }}}}])
+
+
+def _deep_sum(depth):
+    """Build the parse tree of ``SELECT 1 + 1 + ... + 1``."""
+    expr = {'A_Const': {'val': {'Integer': {'ival': 1}}}}
+
+    for _ in range(depth):
+        expr = {'A_Expr': {
+            'kind': A_Expr_Kind.AEXPR_OP,
+            'name': [{'String': {'str': '+'}}],
+            'lexpr': expr,
+            'rexpr': {'A_Const': {'val': {'Integer': {'ival': 1}}}},
+        }}
+
+    return pglast.Node([{'RawStmt': {'stmt': {'SelectStmt': {
+        'targetList': [{'ResTarget': {'val': expr}}]
+    }}}}])
+
+
+def _lint_tree(tree):
+    session = lint.Session([(DisallowNotIn(), {})], '', 'deep.sql')
+    ctx = lint.Context(session)
+    DisallowNotIn().enable(ctx, {})
+
+    start = time.perf_counter()
+    ctx.traverse(tree)
+    elapsed = time.perf_counter() - start
+
+    return lint._ordered_issues(session._issues), elapsed
+
+
+def test_traverse_deeper_than_recursion_limit():
+    depth = sys.getrecursionlimit() * 5
+
+    issues, _ = _lint_tree(_deep_sum(depth))
+    assert issues == []
+
+    # Every NOT has a child context active for the rest of the tree.
+    issues, _ = _lint_tree(_nested_not_in(depth))
+    assert len(issues) == depth
+
+
+@pytest.mark.parametrize('build_tree', [_deep_sum, _nested_not_in])
+def test_traverse_cost_is_linear_in_depth(build_tree):
+    """
+    Regression benchmark: quadrupling the depth of the tree should
+    roughly quadruple the time taken. Quadratic behavior would make it
+    16 times slower, so leave plenty of headroom for noisy machines.
+    """
+    def best_time(depth):
+        tree = build_tree(depth)
+        return min(_lint_tree(tree)[1] for _ in range(3))
+
+    small, large = best_time(1500), best_time(6000)
+    assert large < small * 10
+
+
+def test_skips_files_without_hooked_tags():
+    hook = Mock()
+
+    ctx = lint.Context(session=None)
+    ctx.register('IndexStmt', hook)
+    ctx.register_exit(hook)
+
+    with patch.object(lint._Traversal, '_visit') as visit:
+        ctx.traverse(lint._parse_string('CREATE TABLE foo (id int);'))
+
+    visit.assert_not_called()
+    hook.assert_called_once_with(ctx)
+
+
+def test_views_match_pglast_nodes():
+    tree = pglast.parse_sql(MIXED_SQL)
+    index = lint._NodeIndex(tree)
+
+    expected = [
+        node for node in pglast.Node(tree).traverse()
+        if isinstance(node, pglast.node.Node)
+    ]
+
+    assert len(index) == len(expected)
+
+    for position, node in enumerate(expected):
+        view = index.view(position)
+
+        assert view.parse_tree is node.parse_tree
+        assert view.parent_attribute == node.parent_attribute
+
+        if node.parent_node is None:
+            assert view.parent_node is None
+        else:
+            assert view.parent_node.parse_tree is node.parent_node.parse_tree
+
+
+def test_prunes_literal_subtrees():
+    rows = ', '.join("(%d, 'x'::text, ARRAY[1.5])" % i for i in range(1000))
+    tree = pglast.parse_sql('INSERT INTO t VALUES ' + rows)
+
+    assert len(lint._NodeIndex(tree, prune_literals=True)) < 10
+    assert len(lint._NodeIndex(tree)) > 1000
+
+
+def test_literal_hooks_registered_late():
+    sql = "INSERT INTO t VALUES (1, 'a'), (2, 'b'); SELECT ARRAY[3, 4];"
+
+    def run(traverse):
+        seen = []
+
+        def stmt(child_ctx, node):
+            seen.append(node.node_tag)
+            child_ctx.register('A_Const', lambda _c, n: seen.append(n.val))
+
+        ctx = lint.Context(session=None)
+        ctx.register('InsertStmt', stmt)
+        ctx.register('SelectStmt', stmt)
+        traverse(ctx, pglast.parse_sql(sql))
+
+        return [str(s) for s in seen]
+
+    # Hooks are called in a different order, but the same number of times.
+    seen = sorted(run(lint.Context.traverse))
+
+    assert seen.count('{Integer}') == 6
+    assert seen == sorted(run(lint.Context._traverse_nested))
+
+
+def _message_names(issues):
+    return [type(i.message).__name__ for i in issues]
+
+
+def test_check_stream_is_lazy():
+    cfg = config.get_base_config()._replace(rules={
+        'DisallowNotIn': {},
+        'RequireForeignKey': {},
+    })
+
+    def lines():
+        yield b'CREATE TABLE a (b_id int);\n'
+        yield b'SELECT 1 WHERE 1 NOT IN (2);\n'
+        raise AssertionError('read past the second statement')
+
+    issues = lint.check_stream(cfg, 'file.sql', lines())
+
+    # Reported as soon as the statement has been linted.
+    assert _message_names([next(issues)]) == ['NotInNotAllowed']
+
+    # Exit hooks only run once the whole file has been read.
+    issues = lint.check_stream(cfg, 'file.sql', [
+        b'CREATE TABLE a (b_id int);\n',
+        b'SELECT 1 WHERE 1 NOT IN (2);\n',
+        b'SELECT 1 WHERE 1 NOT IN (3);\n',
+    ])
+
+    assert _message_names(issues) == [
+        'NotInNotAllowed', 'NotInNotAllowed', 'MissingForeignKeyConstraint',
+    ]
+
+
+def test_facts_dont_keep_statement_trees():
+    cfg = config.get_base_config()._replace(rules={
+        'RequireConcurrentIndex': {},
+        'RequireForeignKey': {},
+    })
+    session = lint.Session(lint._configure_rules(cfg.rules),
+                           'CREATE INDEX ON a (b);\n'
+                           'ALTER TABLE a ADD COLUMN b_id int;\n',
+                           'file.sql')
+
+    issues = session.lint()
+
+    # Only the subtree of each node is kept, not a ``pglast.Node`` whose
+    # ``parent_node`` leads back to the whole statement.
+    facts = [f for rule_facts in session.facts() for f in rule_facts]
+    assert len(facts) == 2
+    assert not any(isinstance(value, pglast.node.Base)
+                   for fact in facts for value in fact)
+
+    assert _message_names(issues) == [
+        'IndexNotConcurrent', 'MissingForeignKeyConstraint',
+    ]
+    assert [i.node.location.value for i in issues] == [16, 48]
+
+
+@pytest.mark.parametrize('file_name', SQL_FILES)
+def test_linter_matches_check_file(file_name):
+    with open(file_name, 'r') as fp:
+        contents = fp.read()
+
+    base = config.get_base_config(['full'])
+    linter = lint.Linter(base)
+
+    expected = []
+    cfg = config.apply_file_config(base, contents)
+    if cfg is not None:
+        expected = lint.check_file(cfg, file_name, contents)
+
+    for _ in range(2):
+        issues = linter.lint(contents, file_name)
+        assert [_summarize(i) for i in issues] == \
+            [_summarize(i) for i in expected]
+
+
+def test_linter_enables_rules_once():
+    base = config.get_base_config()._replace(rules={
+        'RequireColumns': {'required': ['id,int']},
+        'DisallowNotIn': {},
+    })
+    files = [
+        ('a.sql', 'CREATE TABLE a (x int);'),
+        ('b.sql', 'CREATE TABLE b (id int);'),
+        ('c.sql', '-- enable:DisallowFloatTypes\nCREATE TABLE c (f real);'),
+        ('d.sql', '-- disable:DisallowNotIn\nCREATE TABLE d (f real);'),
+        ('e.sql', '-- enable:DisallowFloatTypes\nCREATE TABLE e (id int);'),
+    ]
+
+    with patch.object(RequireColumns, 'enable',
+                      autospec=True,
+                      side_effect=RequireColumns.enable) as enable:
+        linter = lint.Linter(base)
+        issues = list(linter.lint_many(files))
+
+    # Shared by the files overriding other rules.
+    enable.assert_called_once()
+
+    assert [(i.file, type(i.message).__name__) for i in issues] == [
+        ('a.sql', 'MissingRequiredColumn'),
+        ('c.sql', 'MissingRequiredColumn'),
+        ('c.sql', 'LossyFloatType'),
+        ('d.sql', 'MissingRequiredColumn'),
+    ]
+
+
+def test_linter_enables_other_rules_for_each_file():
+    class OneTablePerFile(BaseRule):
+        """Keeps track of the tables created in a file in ``enable``."""
+        class TooManyTables(Message):
+            TEMPLATE = 'only one table may be created'
+
+        def enable(self, ctx, _config):
+            tables = []
+
+            def create_table(child_ctx, node):
+                tables.append(node)
+
+                if len(tables) > 1:
+                    child_ctx.report(self.TooManyTables())
+
+            ctx.register('CreateStmt', create_table)
+
+    base = config.get_base_config()._replace(rules={
+        'OneTablePerFile': {},
+        'RequireColumns': {'required': ['id,int']},
+    })
+    files = [
+        ('a.sql', 'CREATE TABLE a (id int);'),
+        ('b.sql', 'CREATE TABLE b (id int);'),
+        ('c.sql', 'CREATE TABLE c (id int);\nCREATE TABLE d (x int);'),
+    ]
+
+    with patch.object(OneTablePerFile, 'enable',
+                      autospec=True,
+                      side_effect=OneTablePerFile.enable) as enable:
+        linter = lint.Linter(base)
+        issues = list(linter.lint_many(files))
+
+    assert enable.call_count == 3
+
+    assert [(i.file, type(i.message).__name__) for i in issues] == [
+        ('c.sql', 'TooManyTables'),
+        ('c.sql', 'MissingRequiredColumn'),
+    ]
@@ -0,0 +1,202 @@
+import os
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from squabble import config, lint, lsp, rule
+
+from tests.test_lint import _summarize
+
+
+def setup_module(_mod):
+    rule.load_rules(plugin_paths=[])
+
+
+def _position(text, index):
+    lines = lsp._split_lines(text[:index]) or ['']
+
+    if lines[-1].endswith(('\r', '\n')):
+        lines.append('')
+
+    return {'line': len(lines) - 1, 'character': lsp._units(lines[-1])}
+
+
+def _edit(document, start, end, new_text):
+    """Replace ``[start, end)`` of the document's text with ``new_text``."""
+    text = document.text
+
+    document.change([{
+        'range': {'start': _position(text, start),
+                  'end': _position(text, end)},
+        'text': new_text,
+    }])
+
+    return text[:start] + new_text + text[end:]
+
+
+@pytest.mark.parametrize('text,start,end,new_text', [
+    ('SELECT 1;\nSELECT 2;\n', 7, 7, '0'),
+    ('SELECT 1;\nSELECT 2;\n', 9, 10, ''),
+    ('SELECT 1;\nSELECT 2;', 19, 19, '\n-- done\n'),
+    ("SELECT '\U0001f600', 1;\n", 12, 13, '2'),
+    ('SELECT 1;\r\nSELECT 2;\r\n', 9, 11, '\n\n'),
+])
+def test_document_change(text, start, end, new_text):
+    document = lsp.Document('file:///a.sql', text)
+
+    assert _edit(document, start, end, new_text) == document.text
+
+
+def test_document_change_joins_line_breaks():
+    document = lsp.Document('file:///a.sql', 'SELECT 1;\rx\nSELECT 2;\n')
+    _edit(document, 10, 11, '')
+
+    assert document.lines == ['SELECT 1;\r\n', 'SELECT 2;\n']
+
+
+def test_document_lint_matches_linter():
+    with open('tests/sql/require_columns.sql', 'r') as fp:
+        contents = fp.read()
+
+    base = config.get_base_config(['full'])
+    linter = lint.Linter(base)
+    document = lsp.Document('file:///a.sql', contents)
+
+    def check():
+        with patch('squabble.lint._parse_statement',
+                   side_effect=lint._parse_statement) as parse:
+            issues = document.lint(linter)
+
+        expected = linter.lint(document.text)
+
+        assert [_summarize(i) for i in issues] == \
+            [_summarize(i) for i in expected]
+
+        return [c[0][0].sql.strip() for c in parse.call_args_list]
+
+    check()
+
+    # Something inserted before the other statements, which move.
+    inserted = '-- ü\nCREATE TABLE x (id int primary key);'
+    _edit(document, 0, 0, inserted + '\n')
+    assert check() == [inserted]
+
+    end = len(document.text)
+    _edit(document, end, end, '\nSELECT 1 WHERE 2 NOT IN (3);\n')
+    assert check() == ['SELECT 1 WHERE 2 NOT IN (3);']
+
+
+def test_document_lint_cancelled():
+    base = config.get_base_config(['full'])
+    linter = lint.Linter(base)
+
+    statements = ['CREATE TABLE t%d (id int, u_id int);' % i
+                  for i in range(10)]
+    document = lsp.Document('file:///a.sql', '\n'.join(statements))
+
+    checks = iter([False] * 4)
+
+    with pytest.raises(lsp.Cancelled):
+        document.lint(linter, cancelled=lambda: next(checks, True))
+
+    with patch('squabble.lint._parse_statement',
+               side_effect=lint._parse_statement) as parse:
+        issues = document.lint(linter)
+
+    # The statements linted before it was cancelled aren't linted again.
+    assert len(parse.call_args_list) == 6
+
+    expected = linter.lint(document.text)
+    assert [_summarize(i) for i in issues] == \
+        [_summarize(i) for i in expected]
+
+
+class _Client:
+    """Talks to a server running in another thread, over pipes."""
+    def __init__(self):
+        server_in, self._input = os.pipe()
+        self._output, server_out = os.pipe()
+
+        self.server = lsp.Server(
+            os.fdopen(server_in, 'rb'), os.fdopen(server_out, 'wb'),
+            debounce=0.05)
+
+        self._input = os.fdopen(self._input, 'wb')
+        self._output = os.fdopen(self._output, 'rb')
+
+        self.status = None
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        self.status = self.server.serve()
+
+    def send(self, method, params=None, request_id=None):
+        message = {'jsonrpc': '2.0', 'method': method, 'params': params}
+        if request_id is not None:
+            message['id'] = request_id
+
+        lsp.write_message(self._input, message)
+
+    def receive(self):
+        return lsp.read_message(self._output)
+
+    def exit(self):
+        self.send('exit')
+        self._thread.join(10)
+
+        return self.status
+
+
+def test_server(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    tmpdir.join('.squabblerc').write('{"rules": {"DisallowFloatTypes": {}}}')
+
+    uri = 'file://' + str(tmpdir.join('a.sql'))
+
+    client = _Client()
+
+    client.send('initialize', {'rootUri': 'file://' + str(tmpdir)}, 1)
+    assert client.receive()['result']['capabilities']['textDocumentSync'] \
+        == {'openClose': True, 'change': 2, 'save': {'includeText': False}}
+
+    client.send('initialized', {})
+    client.send('textDocument/didOpen', {'textDocument': {
+        'uri': uri, 'languageId': 'sql', 'version': 1,
+        'text': 'SELECT 1;\nCREATE TABLE t (x real);\n',
+    }})
+
+    message = client.receive()
+    assert message['method'] == 'textDocument/publishDiagnostics'
+
+    [diagnostic] = message['params']['diagnostics']
+    assert diagnostic['range'] == {'start': {'line': 1, 'character': 16},
+                                   'end': {'line': 1, 'character': 17}}
+    assert diagnostic['code'] == 1007
+    assert diagnostic['source'] == 'squabble'
+
+    client.send('textDocument/didChange', {
+        'textDocument': {'uri': uri, 'version': 2},
+        'contentChanges': [{
+            'range': {'start': {'line': 1, 'character': 18},
+                      'end': {'line': 1, 'character': 22}},
+            'text': 'int',
+        }],
+    })
+
+    message = client.receive()
+    assert message['params'] == {'uri': uri, 'version': 2, 'diagnostics': []}
+
+    # Cancelled before the server got to it.
+    client.send('$/cancelRequest', {'id': 2})
+    client.send('shutdown', None, 2)
+    assert client.receive()['error']['code'] == -32800
+
+    client.send('textDocument/hover', {}, 3)
+    assert client.receive()['error']['code'] == -32601
+
+    client.send('shutdown', None, 4)
+    assert client.receive() == {'jsonrpc': '2.0', 'id': 4, 'result': None}
+
+    assert client.exit() == 0
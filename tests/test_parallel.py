@@ -0,0 +1,141 @@
+import glob
+from unittest.mock import patch
+
+import pytest
+
+from squabble import config, lint, parallel, rule
+from squabble.message import Message
+from squabble.rules import BaseRule
+
+from tests.test_lint import MIXED_SQL, _full_config, _summarize
+
+SQL_FILES = sorted(glob.glob('tests/sql/*.sql'))
+
+
+def setup_module(_mod):
+    rule.load_rules(plugin_paths=[])
+
+
+def _lint_both(cfg, contents):
+    lines = contents.encode('utf-8').splitlines(True)
+
+    serial = lint.check_stream(cfg, 'file.sql', lines)
+    sharded = parallel.check_stream(cfg, 'file.sql', lines, jobs=2,
+                                    shard_size=1)
+
+    return [_summarize(i) for i in serial], [_summarize(i) for i in sharded]
+
+
+@pytest.mark.parametrize('file_name', SQL_FILES)
+def test_matches_serial(file_name):
+    with open(file_name, 'r') as fp:
+        contents = fp.read()
+
+    serial, sharded = _lint_both(_full_config(contents), contents)
+    assert serial == sharded
+
+
+def test_merges_facts_across_shards():
+    cfg = _full_config(MIXED_SQL, RequireColumns={
+        'required': ['created_at,timestamp', 'a_id']
+    })
+    serial, sharded = _lint_both(cfg, MIXED_SQL)
+
+    assert serial == sharded
+
+    # Tables created in an earlier shard are still known to be new.
+    sql = 'CREATE TABLE a (id int);\nCREATE INDEX ON a (id);\n' \
+        'CREATE INDEX ON b (id);\n'
+    cfg = config.get_base_config()._replace(rules={
+        'RequireConcurrentIndex': {},
+    })
+    serial, sharded = _lint_both(cfg, sql)
+
+    assert [message['message_id'] for message, *_ in sharded] == [
+        'IndexNotConcurrent',
+    ]
+    assert serial == sharded
+
+
+def test_configuration_errors_raised_up_front():
+    cfg = config.get_base_config()._replace(rules={
+        'AddColumnDisallowConstraints': {},
+    })
+
+    with pytest.raises(Exception):
+        list(parallel.check_stream(cfg, 'file.sql', [b'SELECT 1;'], jobs=2))
+
+
+def test_stream_pool_shared_between_files():
+    base = config.get_base_config()._replace(rules={
+        'RequireConcurrentIndex': {},
+    })
+    other = base._replace(rules={'DisallowFloatTypes': {}})
+
+    files = [
+        (base, 'CREATE INDEX ON a (id);\nCREATE INDEX ON b (id);\n'),
+        (other, 'CREATE TABLE a (x real);\nCREATE TABLE b (y real);\n'),
+        (base, 'CREATE INDEX ON c (id);\n'),
+    ]
+
+    with patch('squabble.parallel._pool', wraps=parallel._pool) as start:
+        with parallel.StreamPool(2, base) as pool:
+            for cfg, sql in files:
+                lines = sql.encode('utf-8').splitlines(True)
+                serial = lint.check_stream(cfg, 'file.sql', lines)
+                sharded = parallel.check_stream(
+                    cfg, 'file.sql', lines, jobs=2, shard_size=1, pool=pool)
+
+                assert [_summarize(i) for i in serial] == \
+                    [_summarize(i) for i in sharded]
+
+    assert start.call_count == 1
+
+
+def test_single_shard_linted_inline():
+    cfg = config.get_base_config()._replace(rules={
+        'RequireConcurrentIndex': {},
+    })
+    lines = [b'CREATE INDEX ON a (id);\n']
+
+    with patch('squabble.parallel._pool') as start:
+        issues = list(parallel.check_stream(cfg, 'file.sql', lines, jobs=4))
+
+    assert [i.message.CODE for i in issues] == [1001]
+    assert not start.called
+
+
+def test_rules_keeping_state_across_statements_not_sharded():
+    class TableCreatedTwice(BaseRule):
+        """Keeps track of the tables created so far in ``enable``."""
+        class CreatedTwice(Message):
+            TEMPLATE = 'table created twice'
+
+        def enable(self, ctx, _config):
+            tables = set()
+
+            def create_table(child_ctx, node):
+                name = node.relation.relname.value
+
+                if name in tables:
+                    child_ctx.report(self.CreatedTwice(), node=node)
+
+                tables.add(name)
+
+            ctx.register('CreateStmt', create_table)
+
+    cfg = config.get_base_config()._replace(rules={
+        'TableCreatedTwice': {},
+        'DisallowFloatTypes': {},
+    })
+    sql = 'CREATE TABLE a (x real);\nCREATE TABLE b (id int);\n' \
+        'CREATE TABLE a (id int);\n'
+
+    with patch('squabble.parallel._pool') as start:
+        serial, sharded = _lint_both(cfg, sql)
+
+    assert not start.called
+    assert [message['message_id'] for message, *_ in sharded] == [
+        'LossyFloatType', 'CreatedTwice',
+    ]
+    assert serial == sharded
@@ -1,11 +1,16 @@
 """ Odds and ends tests to hit corner cases etc in rules logic. """
 
+import os
+import subprocess
+import sys
 import unittest
+from unittest.mock import Mock, patch
 
 import pytest
 
 import squabble.rule
 from squabble import RuleConfigurationException, UnknownRuleException
+from squabble.rules import BaseRule
 from squabble.rules.add_column_disallow_constraints import \
     AddColumnDisallowConstraints
 
@@ -31,3 +36,55 @@ class TestRuleRegistry(unittest.TestCase):
     def test_get_class_unknown_name(self):
         with pytest.raises(UnknownRuleException):
             squabble.rule.Registry.get_class('asdfg')
+
+    def test_manifest_is_up_to_date(self):
+        # Otherwise, run `python -m squabble.rule`
+        assert squabble.rule.build_manifest() == squabble.rule.manifest()
+
+    def test_rules_imported_when_used(self):
+        script = '''
+import sys
+from squabble.rule import Registry
+
+def loaded():
+    return sorted(m for m in sys.modules if m.startswith('squabble.rules.'))
+
+list(Registry.all())
+Registry.get_meta('DisallowNotIn')
+print(loaded())
+
+Registry.get_class('DisallowNotIn')
+print(loaded())
+'''
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        output = subprocess.check_output([sys.executable, '-c', script],
+                                         env=env)
+
+        assert output.decode('utf-8').splitlines() == [
+            '[]',
+            "['squabble.rules.disallow_not_in']",
+        ]
+
+    def test_entry_point_plugins(self):
+        def load():
+            class EntryPointRule(BaseRule):
+                """Provided by an installed package."""
+
+            class DisallowNotIn(BaseRule):
+                """Can't replace a built in rule."""
+
+        entry_point = Mock(load=Mock(side_effect=load))
+        entry_point.name = 'example'
+
+        with patch('squabble.rule.entry_points', return_value=[entry_point]), \
+                patch('squabble.rule._entry_points_loaded', False):
+            cls = squabble.rule.Registry.get_class('EntryPointRule')
+
+            assert cls.meta()['description'] == \
+                'Provided by an installed package.'
+
+            squabble.rule.Registry.get_class('EntryPointRule')
+            assert entry_point.load.call_count == 1
+
+            cls = squabble.rule.Registry.get_class('DisallowNotIn')
+            assert cls.__module__ == 'squabble.rules.disallow_not_in'
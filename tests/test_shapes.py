@@ -0,0 +1,85 @@
+import glob
+from unittest.mock import patch
+
+import pytest
+
+from squabble import config, lint, rule
+
+SQL_FILES = sorted(glob.glob('tests/sql/*.sql'))
+
+
+def setup_module(_mod):
+    rule.load_rules(plugin_paths=[])
+
+
+def _locate(issues):
+    return [(i.message_text, i.severity, i.location, i.file) for i in issues]
+
+
+@pytest.mark.parametrize('file_name', SQL_FILES)
+def test_matches_without_dedupe(file_name):
+    with open(file_name, 'r') as fp:
+        contents = fp.read()
+
+    base = config.get_base_config(['full'])
+    linter = lint.Linter(base, dedupe=True)
+
+    # Same statements with different literals and formatting.
+    variants = [
+        contents,
+        contents.replace('1', '12345').replace("'", "'xyz"),
+        '\n-- comment\n' + contents.replace(' ', '\t  '),
+    ]
+
+    for i, text in enumerate(variants):
+        name = '%s.%d' % (file_name, i)
+
+        assert _locate(linter.lint(text, name)) == \
+            _locate(lint.Linter(base).lint(text, name))
+
+
+def test_lints_each_shape_once():
+    base = config.get_base_config()._replace(rules={
+        'DisallowNotIn': {},
+        'DisallowRenameEnumValue': {},
+    })
+    query = "SELECT * FROM t WHERE id NOT IN (%d, '%s') AND x = %d;"
+
+    files = [
+        ('a.sql', '\n'.join(
+            query % (i, 'v' * i, i * 100) for i in range(1, 20))),
+        ('b.sql', "ALTER TYPE e RENAME VALUE 'a' TO 'b';\n" +
+         query % (1, '', 2)),
+    ]
+
+    linter = lint.Linter(base, dedupe=True)
+
+    with patch('squabble.lint._parse_statement',
+               side_effect=lint._parse_statement) as parse:
+        issues = list(linter.lint_many(files))
+
+    # Literals still matter for the DDL statement.
+    assert [c[0][0].sql.split()[0] for c in parse.call_args_list] == \
+        ['SELECT', 'ALTER']
+
+    expected = list(lint.Linter(base).lint_many(files))
+    assert len(issues) == 21
+    assert _locate(issues) == _locate(expected)
+
+
+def test_type_modifiers_matter_for_required_columns():
+    base = config.get_base_config()._replace(rules={
+        'RequireColumns': {'required': ['id,varchar(36)']},
+    })
+    files = [
+        ('a.sql', 'CREATE TABLE t (id varchar(10));'),
+        ('b.sql', 'CREATE TABLE t (id varchar(36));'),
+        ('c.sql', 'CREATE TABLE t (id varchar(12));'),
+    ]
+
+    issues = list(lint.Linter(base, dedupe=True).lint_many(files))
+
+    assert [(i.file, i.message.format()) for i in issues] == [
+        ('a.sql', '"t.id" has type "varchar(10)" expected "varchar(36)"'),
+        ('c.sql', '"t.id" has type "varchar(12)" expected "varchar(36)"'),
+    ]
@@ -31,8 +31,9 @@ def expected_output(file_name):
     return expected
 
 
+@pytest.mark.parametrize('stream', [False, True])
 @pytest.mark.parametrize('file_name', SQL_FILES)
-def test_snapshot(file_name):
+def test_snapshot(file_name, stream):
     with open(file_name, 'r') as fp:
         contents = fp.read()
 
@@ -44,7 +45,13 @@ def test_snapshot(file_name):
     base_cfg = config.get_base_config()
     cfg = config.apply_file_config(base_cfg, contents)
 
-    issues = lint.check_file(cfg, file_name, contents)
+    if stream:
+        with open(file_name, 'rb') as fp:
+            issues = list(lint.check_stream(cfg, file_name, fp))
+
+        contents = reporter.SourceFile(file_name)
+    else:
+        issues = lint.check_file(cfg, file_name, contents)
 
     assert len(issues) == len(expected)
 
@@ -57,6 +64,29 @@ def test_snapshot(file_name):
 
         assert actual == e
 
+    if stream:
+        contents.close()
+
+
+def test_source_file_columns_count_characters(tmpdir):
+    contents = 'SELECT 1;\nCREATE TABLE "café" (prix real);\n'
+    path = tmpdir.join('file.sql')
+    path.write_binary(contents.encode('utf-8'))
+
+    # Issue locations are byte offsets.
+    location = contents.encode('utf-8').index(b'prix')
+    issue = lint.LintIssue(location=location, file=str(path))
+
+    source = reporter.SourceFile(str(path))
+    try:
+        located = reporter._issue_to_file_location(issue, source)
+    finally:
+        source.close()
+
+    expected = ('CREATE TABLE "café" (prix real);', 2, 21)
+    assert located == expected
+    assert reporter._issue_to_file_location(issue, contents) == expected
+
 
 @pytest.mark.parametrize('reporter_name', reporter._REPORTERS.keys())
 def test_reporter_sanity(reporter_name):
@@ -88,3 +118,38 @@ def test_cli_linter():
     # Exit status 1 means that lint issues occurred, not that the process
     # itself failed.
     assert exit_status == 1
+
+
+@pytest.mark.parametrize('stream,jobs,dedupe', [
+    (True, 1, False),
+    (False, 2, False),
+    (True, 2, False),
+    (False, 1, True),
+    (False, 2, True),
+])
+def test_cli_linter_matches_serial(capsys, stream, jobs, dedupe):
+    base_cfg = config.get_base_config()
+
+    assert squabble.cli.run_linter(base_cfg, SQL_FILES, expanded=False) == 1
+    serial = capsys.readouterr().err
+
+    assert squabble.cli.run_linter(
+        base_cfg, SQL_FILES, expanded=False, stream=stream, jobs=jobs,
+        dedupe=dedupe) == 1
+    assert capsys.readouterr().err == serial
+
+
+def test_cli_linter_holds_one_file_at_a_time():
+    base_cfg = config.get_base_config(['full'])
+    issues, files = squabble.cli._lint_files(base_cfg, sorted(SQL_FILES))
+
+    # Nothing is read until issues are asked for.
+    assert files == {}
+
+    reported = []
+    for issue in issues:
+        assert list(files) == [issue.file]
+        reported.append(issue.file)
+
+    assert files == {}
+    assert len(set(reported)) > 1
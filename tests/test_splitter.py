@@ -0,0 +1,122 @@
+import glob
+import io
+import random
+
+import pglast
+import pytest
+
+from squabble import lint
+from squabble.splitter import split_changed, split_lines, split_statements
+
+
+def _split(sql):
+    lines = sql.encode('utf-8').splitlines(True)
+    return [stmt.sql for stmt in split_statements(lines)]
+
+
+@pytest.mark.parametrize('sql,expected', [
+    ('SELECT 1; SELECT 2', ['SELECT 1;', ' SELECT 2']),
+    ('SELECT 1;\n-- trailing comment\n', ['SELECT 1;']),
+    ("SELECT 'a;b', 'it''s;'; SELECT 2", ["SELECT 'a;b', 'it''s;';",
+                                          ' SELECT 2']),
+    ("SELECT E'\\';'; SELECT 2", ["SELECT E'\\';';", ' SELECT 2']),
+    ('SELECT "a;""b"; SELECT 2', ['SELECT "a;""b";', ' SELECT 2']),
+    ('SELECT /* ; /* ; */ ; */ 1; SELECT 2',
+     ['SELECT /* ; /* ; */ ; */ 1;', ' SELECT 2']),
+    ('SELECT $$;$$, $a$ $$; $a$; SELECT 2',
+     ['SELECT $$;$$, $a$ $$; $a$;', ' SELECT 2']),
+    ("SELECT 'a\n;b';\nSELECT 2", ["SELECT 'a\n;b';", '\nSELECT 2']),
+    ('CREATE RULE r AS ON INSERT TO t DO (DELETE FROM a; DELETE FROM b);',
+     ['CREATE RULE r AS ON INSERT TO t DO (DELETE FROM a; DELETE FROM b);']),
+    ('COPY t FROM stdin;\na;b\n\\.\nSELECT 1;',
+     ['COPY t FROM stdin;', 'SELECT 1;']),
+    ('SELECT a$b$c; SELECT 2', ['SELECT a$b$c;', ' SELECT 2']),
+    ('COPY t TO stdout; SELECT 1;', ['COPY t TO stdout;', ' SELECT 1;']),
+    ('COPY "from" stdin FROM \'f\'; SELECT 1;',
+     ['COPY "from" stdin FROM \'f\';', ' SELECT 1;']),
+    ('\\connect foo\nSELECT 1;', ['SELECT 1;']),
+])
+def test_split_statements(sql, expected):
+    assert _split(sql) == expected
+
+
+def test_locations_are_in_bytes():
+    sql = "SELECT 'ü';\nCOPY t FROM stdin;\nü\n\\.\nSELECT 2;"
+    lines = sql.encode('utf-8').splitlines(True)
+
+    locations = [stmt.location for stmt in split_statements(lines)]
+
+    assert locations == [0, 12, 38]
+
+
+def test_split_is_lazy():
+    def lines():
+        yield b'SELECT 1;\n'
+        yield b'COPY t FROM stdin;\n'
+        raise AssertionError('read past the first statement')
+
+    assert next(split_statements(lines())).sql == 'SELECT 1;'
+
+
+@pytest.mark.parametrize('sql,expected', [
+    ('SELECT 1; -- ;\rSELECT 2;\r', ['SELECT 1;', ' -- ;\rSELECT 2;']),
+    ('COPY t FROM stdin;\ra;b\r\\.\rSELECT 1;',
+     ['COPY t FROM stdin;', 'SELECT 1;']),
+    ('\\connect foo\rSELECT 1;\r\nSELECT 2;', ['SELECT 1;', '\r\nSELECT 2;']),
+])
+def test_lines_split_like_splitlines(sql, expected):
+    data = sql.encode('utf-8')
+    statements = list(split_statements(split_lines(data)))
+
+    assert [stmt.sql for stmt in statements] == expected
+
+    # However the lines were split, e.g. read from a file.
+    assert list(split_statements(io.BytesIO(data))) == statements
+    assert list(split_statements([data])) == statements
+    assert split_changed([], b'', data) == statements
+
+
+@pytest.mark.parametrize('file_name', [
+    f for f in sorted(glob.glob('tests/sql/*.sql'))
+    if 'syntax_error' not in f and not f.endswith('pg_dump_copy.sql')
+])
+def test_parse_matches_whole_file(file_name):
+    with open(file_name, 'rb') as fp:
+        contents = fp.read()
+
+    statements = split_statements(contents.splitlines(True))
+    tree = [node for s in statements for node in lint._parse_statement(s)]
+
+    assert tree == pglast.parse_sql(contents.decode('utf-8'))
+
+
+# Edits likely to change where statements start and end.
+_SNIPPETS = [
+    ';', "'", '"', '$$', '/*', '*/', '--', '(', ')', '\n', ' ', 'x',
+    'SELECT 1;\n', 'COPY t FROM stdin;\n', 'a;b\n', '\n\\.\n',
+    '\\connect foo\n', "E'\\'", 'ü', '\r', '\r\n',
+]
+
+
+def test_split_changed_matches_split_statements():
+    rng = random.Random(42)
+
+    with open('tests/sql/pg_dump_copy.sql', 'r') as fp:
+        text = fp.read()
+
+    old = text.encode('utf-8')
+    statements = list(split_statements(old.splitlines(True)))
+
+    for _ in range(500):
+        start = rng.randrange(len(text) + 1)
+        end = min(len(text), start + rng.choice([0, 0, 1, 5, 40]))
+        insert = ''.join(rng.choice(_SNIPPETS)
+                         for _ in range(rng.randrange(3)))
+
+        text = text[:start] + insert + text[end:]
+        new = text.encode('utf-8')
+
+        statements = split_changed(statements, old, new)
+        assert statements == list(split_statements(new.splitlines(True)))
+
+        old = new
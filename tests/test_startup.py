@@ -0,0 +1,60 @@
+"""
+Editors run squabble every time a file is saved, so its startup time is
+how long they wait for it.
+"""
+
+import os
+import subprocess
+import sys
+
+# Time allowed for importing the command line interface, in
+# milliseconds, not counting the standard library (e.g. ``logging``),
+# whose cost depends on the interpreter rather than on squabble.
+IMPORT_BUDGET = 50
+
+# Only needed once files are linted (or with options like --cache-dir).
+SLOW_MODULES = {'pglast', 'pkg_resources', 'subprocess', 'multiprocessing'}
+
+
+def _import_times(module):
+    """
+    Return a map of each module imported by importing ``module`` in a
+    new interpreter to the time (in microseconds) taken to import it,
+    not counting the modules it imported.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        env=env, stderr=subprocess.PIPE, check=True)
+
+    times = {}
+
+    for line in result.stderr.decode('utf-8').splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        self_time, _cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(self_time)
+
+    return times
+
+
+def test_cli_imports_quickly():
+    own = ('squabble', 'docopt', 'colorama')
+    best = None
+
+    # The fastest of a few runs, since the machine may be busy.
+    for _ in range(3):
+        times = _import_times('squabble.__main__')
+
+        assert not SLOW_MODULES & {
+            name.split('.')[0] for name in times
+        }
+
+        elapsed = sum(
+            t for name, t in times.items() if name.split('.')[0] in own)
+
+        best = elapsed if best is None else min(best, elapsed)
+
+    assert best / 1000 < IMPORT_BUDGET
@@ -0,0 +1,123 @@
+import subprocess
+
+import pytest
+
+import squabble.cli
+from squabble import config, rule, vcs
+
+
+def setup_module(_mod):
+    rule.load_rules(plugin_paths=[])
+
+
+def _git(repo, *args):
+    subprocess.run(
+        ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com']
+        + list(args), cwd=str(repo), check=True, stdout=subprocess.PIPE)
+
+
+@pytest.fixture
+def repo(tmpdir):
+    _git(tmpdir, 'init', '-q')
+
+    tmpdir.join('a.sql').write('SELECT 1;\nSELECT 2;\nSELECT 3;\n')
+    tmpdir.join('b.sql').write('DROP TABLE b;\n')
+    tmpdir.join('c.sql').write('CREATE TABLE c (id int);\n')
+
+    _git(tmpdir, 'add', '.')
+    _git(tmpdir, 'commit', '-q', '-m', 'base')
+    _git(tmpdir, 'tag', 'base')
+
+    return tmpdir
+
+
+def test_changed_files(repo):
+    repo.join('a.sql').write('SELECT 1;\nSELECT 22;\nSELECT 3;\n')
+    repo.join('b.sql').remove()
+    _git(repo, 'mv', 'c.sql', 'd.sql')
+    repo.join('e.sql').write('CREATE TABLE e (id int);\nDROP TABLE e;\n')
+    _git(repo, 'add', '-A')
+    _git(repo, 'commit', '-q', '-m', 'change')
+
+    repo.join('.gitignore').write('ignored.sql\n')
+    repo.join('ignored.sql').write('SELECT 1;\n')
+
+    assert vcs.changed_files('base', str(repo)) == {
+        'a.sql': [(2, 2)],
+        'd.sql': [],
+        'e.sql': [(1, 2)],
+        '.gitignore': None,
+    }
+
+    # Relative to the given directory.
+    repo.mkdir('sub')
+    assert vcs.changed_files('base', str(repo.join('sub')))['../a.sql'] == \
+        [(2, 2)]
+
+
+def test_unknown_revision(repo):
+    with pytest.raises(vcs.GitException):
+        vcs.changed_files('no-such-branch', str(repo))
+
+
+def test_only_reports_changed_lines(repo, capsys, monkeypatch):
+    repo.join('a.sql').write('CREATE TABLE a (x real);\nSELECT 2;\n')
+    _git(repo, 'commit', '-q', '-a', '-m', 'a')
+
+    repo.join('a.sql').write(
+        'CREATE TABLE a (x real);\nSELECT 2;\nCREATE TABLE b (x real);\n')
+    monkeypatch.chdir(repo)
+
+    base_cfg = config.get_base_config()._replace(rules={
+        'DisallowFloatTypes': {},
+    })
+    changed = vcs.changed_files('HEAD')
+
+    assert squabble.cli.run_linter(base_cfg, ['a.sql'], False) == 1
+    assert len(capsys.readouterr().err.splitlines()) == 2
+
+    assert squabble.cli.run_linter(
+        base_cfg, ['a.sql'], False, changed_lines=changed) == 1
+    assert capsys.readouterr().err.startswith('a.sql:3:')
+
+
+def test_revision_reads_files(repo):
+    repo.mkdir('db').join('x.sql').write('SELECT x;\n')
+    _git(repo, 'add', '.')
+    _git(repo, 'commit', '-q', '-m', 'db')
+
+    repo.join('a.sql').write('changed on disk')
+
+    with vcs.Revision('HEAD', str(repo)) as revision:
+        assert revision.files() == ['a.sql', 'b.sql', 'c.sql', 'db/x.sql']
+
+        assert revision.read('a.sql') == 'SELECT 1;\nSELECT 2;\nSELECT 3;\n'
+        assert revision.read('db/x.sql') == 'SELECT x;\n'
+
+        with pytest.raises(vcs.GitException):
+            revision.files(['missing.sql'])
+
+    with vcs.Revision('base', str(repo.join('db'))) as revision:
+        with pytest.raises(vcs.GitException):
+            revision.files()
+
+        assert revision.files(['..']) == ['../a.sql', '../b.sql', '../c.sql']
+
+
+def test_cli_lints_revision(repo, capsys, monkeypatch):
+    repo.join('a.sql').write('CREATE TABLE a (x real);\n')
+    _git(repo, 'commit', '-q', '-a', '-m', 'a')
+    repo.join('a.sql').remove()
+    monkeypatch.chdir(repo)
+
+    base_cfg = config.get_base_config()._replace(rules={
+        'DisallowFloatTypes': {},
+    })
+
+    for jobs in [1, 2]:
+        assert squabble.cli.run_linter(
+            base_cfg, [], False, jobs=jobs, rev='HEAD') == 1
+        assert capsys.readouterr().err.startswith('a.sql:1:16 LOW')
+
+        assert squabble.cli.run_linter(
+            base_cfg, ['.'], False, jobs=jobs, rev='base') == 0